@@ -17,6 +17,10 @@ import tempfile
 from pathlib import Path
 
 from attachment_editor_window_qt import AttachmentEditorWindowQt
+from attachment_index import attachment_metadata, locate_attachment, resolve_attachment
+from attachment_store import blob_hash, get_attachment_store, normalize_name
+from attachment_ingest import ingest_attachment, stored_extension, get_ingest_policy
+from job_executor_qt import JobExecutor
 
 
 class AddExpenseWindowQt(QDialog):
@@ -33,7 +37,14 @@ class AddExpenseWindowQt(QDialog):
         self.editor_instance = None
 
         self.attachment_relative_path = ""
+        # hash/tamaño/ruta del anexo copiado en esta sesión (se guardan con la factura)
+        self.attachment_meta = None
         self._pending_temp_attachment = None
+        # Guardado del anexo en segundo plano (attachment_ingest)
+        self._ingest_job = None
+        self._ingest_announce = True
+        self._save_after_ingest = False
+        self.jobs = getattr(parent, "jobs", None) or JobExecutor(self)
 
         self._suggestion_popup = QListWidget(self)
         self._suggestion_popup.setWindowFlags(Qt.WindowType.ToolTip)
@@ -202,6 +213,9 @@ class AddExpenseWindowQt(QDialog):
             if ap:
                 self.attachment_relative_path = ap
                 self.attachment_display.setText(ap)
+                if d.get("attachment_hash"):
+                    # Permite ubicar el blob si el árbol se migró al almacén por contenido
+                    self.attachment_meta = {k: d.get(k) for k in ("attachment_hash", "attachment_size", "attachment_relpath")}
         except Exception as e:
             print("Error cargando datos existentes en AddExpenseWindowQt:", e)
     
@@ -272,59 +286,129 @@ class AddExpenseWindowQt(QDialog):
         default.mkdir(parents=True, exist_ok=True)
         return str(default)
 
-    def _store_attachment(self, source_path: str) -> str | None:
+    def _attachment_destination(self, ext: str):
+        """(raíz de adjuntos, ruta destino) para un anexo nuevo: <empresa>/<año>/<mes>/<factura>_<rnc><ext>."""
+        base_path = self._get_attachment_base()
+        company_name = None
+        try:
+            if self.parent and hasattr(self.parent, "company_selector"):
+                company_name = self.parent.company_selector.currentText()
+            elif self.controller and hasattr(self.controller, "get_active_company_name"):
+                company_name = self.controller.get_active_company_name()
+        except Exception:
+            company_name = None
+        company_name = company_name or "company"
+        safe_company = "".join(c for c in company_name if c.isalnum() or c in (" ", "-", "_")).strip().replace(" ", "_")
+        try:
+            invoice_date = self.date_edit.date().toPyDate()
+        except Exception:
+            invoice_date = datetime.date.today()
+        year = invoice_date.strftime("%Y")
+        month = invoice_date.strftime("%m")
+        dest_folder = Path(base_path) / safe_company / year / month
+        dest_folder.mkdir(parents=True, exist_ok=True)
+        invoice_part = "".join(c for c in (self.invoice_number_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        rnc_part = "".join(c for c in (self.rnc_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or "noRNC"
+        dest_name = f"{invoice_part}_{rnc_part}{ext}"
+        dest_path = dest_folder / dest_name
+        if dest_path.exists():
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            dest_name = f"{invoice_part}_{rnc_part}_{ts}{ext}"
+            dest_path = dest_folder / dest_name
+        return base_path, dest_path
+
+    def _store_attachment(self, source_path: str, remove_source: bool = False, announce: bool = True) -> bool:
+        """
+        Guarda el anexo en la carpeta de adjuntos en segundo plano (attachment_ingest:
+        orientación, tamaño y recompresión de fotos, escritura atómica) y calcula sus
+        metadatos en el mismo hilo. Al terminar, _on_attachment_ingested actualiza la
+        ventana. Retorna False si no se pudo iniciar.
+        """
         try:
             if not source_path or not os.path.exists(source_path):
                 QMessageBox.critical(self, "Error", "El archivo seleccionado no existe.")
-                return None
-            base_path = self._get_attachment_base()
-            company_name = None
-            try:
-                if self.parent and hasattr(self.parent, "company_selector"):
-                    company_name = self.parent.company_selector.currentText()
-                elif self.controller and hasattr(self.controller, "get_active_company_name"):
-                    company_name = self.controller.get_active_company_name()
-            except Exception:
-                company_name = None
-            company_name = company_name or "company"
-            safe_company = "".join(c for c in company_name if c.isalnum() or c in (" ", "-", "_")).strip().replace(" ", "_")
+                return False
+            base_path, dest_path = self._attachment_destination(stored_extension(source_path))
+            policy = get_ingest_policy()
+        except Exception as e:
+            QMessageBox.critical(self, "Error al guardar anexo", f"No se pudo guardar el anexo:\n{e}")
+            return False
+
+        def _ingest():
+            result = ingest_attachment(source_path, str(dest_path), base_path, policy)
             try:
-                invoice_date = self.date_edit.date().toPyDate()
-            except Exception:
-                invoice_date = datetime.date.today()
-            year = invoice_date.strftime("%Y")
-            month = invoice_date.strftime("%m")
-            dest_folder = Path(base_path) / safe_company / year / month
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            invoice_part = "".join(c for c in (self.invoice_number_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            rnc_part = "".join(c for c in (self.rnc_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or "noRNC"
-            orig_name = Path(source_path).name
-            ext = Path(orig_name).suffix.lower() or ""
-            dest_name = f"{invoice_part}_{rnc_part}{ext}"
-            dest_path = dest_folder / dest_name
-            if dest_path.exists():
-                ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                dest_name = f"{invoice_part}_{rnc_part}_{ts}{ext}"
-                dest_path = dest_folder / dest_name
-            shutil.copy2(source_path, str(dest_path))
+                if result.content_hash:
+                    # Almacén por contenido: el hash ya se calculó y la ruta es el nombre registrado
+                    meta = {"attachment_hash": result.content_hash, "attachment_size": result.stored_bytes,
+                            "attachment_relpath": result.name}
+                else:
+                    meta = attachment_metadata(result.path, base_path)
+            except OSError as e:
+                print("No se pudieron calcular los metadatos del anexo:", e)
+                meta = None
+            if remove_source:
+                try:
+                    os.remove(source_path)
+                except OSError:
+                    pass
+            return result, meta
+
+        self._ingest_announce = announce
+        self.attachment_display.setText(f"(procesando) {Path(source_path).name}")
+        self._ingest_job = self.jobs.submit(
+            _ingest, key=self._ingest_key(),
+            on_finished=lambda result, base=base_path: self._on_attachment_ingested(result, base),
+            on_failed=self._on_attachment_ingest_failed,
+        )
+        return True
+
+    def _ingest_key(self):
+        return f"attachment-ingest-{id(self)}"
+
+    def reject(self):
+        # Al cerrar sin guardar se descarta el aviso del anexo en curso (el archivo se termina de escribir)
+        if self._ingest_job is not None:
+            self.jobs.cancel(self._ingest_key())
+            self._ingest_job = None
+        super().reject()
+
+    def _on_attachment_ingested(self, result, base_path):
+        ingest, meta = result
+        self._ingest_job = None
+        if ingest.name:
+            relative = ingest.name.replace("/", os.sep)
+        else:
             try:
-                relative = os.path.relpath(str(dest_path), base_path)
+                relative = os.path.relpath(ingest.path, base_path)
             except Exception:
-                relative = str(dest_path)
-            return relative
-        except Exception as e:
-            QMessageBox.critical(self, "Error al guardar anexo", f"No se pudo guardar el anexo:\n{e}")
-            return None
+                relative = ingest.path
+        if ingest.deduplicated:
+            print(f"Anexo ya guardado con el mismo contenido: se reutiliza {ingest.content_hash[:12]}")
+        self.attachment_relative_path = relative
+        self.attachment_meta = meta
+        self._pending_temp_attachment = None
+        self.attachment_display.setText(relative)
+        if ingest.normalized:
+            print(f"Anexo normalizado: {ingest.source_bytes / 1048576:.1f} MB -> {ingest.stored_bytes / 1048576:.1f} MB")
+        if self._save_after_ingest:
+            self._save_after_ingest = False
+            self.btn_save.setEnabled(True)
+            self._on_save_clicked()
+        elif self._ingest_announce:
+            QMessageBox.information(self, "Adjunto guardado", f"El anexo se guardó en:\n{relative}")
+
+    def _on_attachment_ingest_failed(self, message):
+        self._ingest_job = None
+        self._save_after_ingest = False
+        self.btn_save.setEnabled(True)
+        self.attachment_display.setText(self.attachment_relative_path or "")
+        QMessageBox.critical(self, "Error al guardar anexo", f"No se pudo guardar el anexo:\n{message}")
 
     def _attach_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Seleccionar anexo (imágenes o PDF)", "", "Imágenes (*.png *.jpg *.jpeg *.bmp *.gif *.webp *.tiff *.tif *.svg);;PDF (*.pdf);;Todos los archivos (*.*)")
         if not file_path:
             return
-        rel = self._store_attachment(file_path)
-        if rel:
-            self.attachment_relative_path = rel
-            self.attachment_display.setText(rel)
-            QMessageBox.information(self, "Adjunto guardado", f"El anexo se guardó en:\n{rel}")
+        self._store_attachment(file_path)
 
     # <-- 2. MODIFICAR _on_load_and_show_clicked
     def _on_load_and_show_clicked(self):
@@ -367,6 +451,17 @@ class AddExpenseWindowQt(QDialog):
         """
         Este método se activa cuando el editor emite la señal 'saved'.
         """
+        content_hash = blob_hash(saved_temp_path)
+        if content_hash:
+            # Editado dentro del almacén: el mismo nombre ya apunta al blob nuevo. No es un
+            # temporal (otros nombres pueden compartir el blob), solo cambian los metadatos.
+            relpath = (self.attachment_meta or {}).get("attachment_relpath") or normalize_name(self.attachment_relative_path)
+            self.attachment_meta = {"attachment_hash": content_hash,
+                                    "attachment_size": os.path.getsize(saved_temp_path),
+                                    "attachment_relpath": relpath}
+            self._pending_temp_attachment = None
+            self.attachment_display.setText(self.attachment_relative_path)
+            return
         self._pending_temp_attachment = saved_temp_path
         display_name = f"(temp) {Path(saved_temp_path).name}"
         self.attachment_display.setText(display_name)
@@ -392,10 +487,11 @@ class AddExpenseWindowQt(QDialog):
                 self._on_load_and_show_clicked()
             return
         
-        base = self._get_attachment_base()
-        full = str(Path(base) / rel) if not os.path.isabs(rel) else rel
-        if not os.path.exists(full):
-            QMessageBox.critical(self, "No Existe", f"No se encontró el archivo en la ruta esperada:\n{full}")
+        full = self._locate_current_attachment(rel)
+        if not full:
+            base = self._get_attachment_base()
+            expected = str(Path(base) / rel) if not os.path.isabs(rel) else rel
+            QMessageBox.critical(self, "No Existe", f"No se encontró el archivo en la ruta esperada:\n{expected}")
             return
         
         if any(full.lower().endswith(ext) for ext in (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tiff", ".tif", ".svg")):
@@ -414,6 +510,16 @@ class AddExpenseWindowQt(QDialog):
         except Exception as e:
             QMessageBox.critical(self, "Error Abrir Archivo", f"No se pudo abrir el archivo:\n{e}")
 
+    def _locate_current_attachment(self, rel):
+        """Archivo del anexo guardado: ruta relativa, blob del almacén por contenido o índice de adjuntos."""
+        try:
+            base = self._get_attachment_base()
+        except Exception:
+            base = None
+        meta = self.attachment_meta or {}
+        return (locate_attachment(meta.get("attachment_relpath") or rel, base, meta.get("attachment_hash"))
+                or resolve_attachment(rel, base))
+
     def _prompt_attachment_metadata_if_missing(self):
         try:
             need_rnc = not self.rnc_le.text().strip()
@@ -432,52 +538,11 @@ class AddExpenseWindowQt(QDialog):
         except Exception as e:
             print("Error prompting metadata:", e)
     
-    def _finalize_temp_attachment(self, temp_path: str) -> str | None:
+    def _finalize_temp_attachment(self, temp_path: str) -> bool:
+        """Pasa el anexo temporal (del editor) a la carpeta de adjuntos; el temporal se borra al terminar."""
         if not temp_path or not os.path.exists(temp_path):
-            return None
-        try:
-            base_path = self._get_attachment_base()
-            company_name = None
-            try:
-                if self.parent and hasattr(self.parent, "company_selector"):
-                    company_name = self.parent.company_selector.currentText()
-                elif self.controller and hasattr(self.controller, "get_active_company_name"):
-                    company_name = self.controller.get_active_company_name()
-            except Exception:
-                company_name = None
-            company_name = company_name or "company"
-            safe_company = "".join(c for c in company_name if c.isalnum() or c in (" ", "-", "_")).strip().replace(" ", "_")
-            try:
-                invoice_date = self.date_edit.date().toPyDate()
-            except Exception:
-                invoice_date = datetime.date.today()
-            year = invoice_date.strftime("%Y")
-            month = invoice_date.strftime("%m")
-            dest_folder = Path(base_path) / safe_company / year / month
-            dest_folder.mkdir(parents=True, exist_ok=True)
-            invoice_part = "".join(c for c in (self.invoice_number_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            rnc_part = "".join(c for c in (self.rnc_le.text().strip() or "") if (c.isalnum() or c in ("-", "_"))).strip() or "noRNC"
-            ext = Path(temp_path).suffix.lower()
-            dest_name = f"{invoice_part}_{rnc_part}{ext}"
-            dest_path = dest_folder / dest_name
-            if dest_path.exists():
-                ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                dest_name = f"{invoice_part}_{rnc_part}_{ts}{ext}"
-                dest_path = dest_folder / dest_name
-            shutil.copy2(temp_path, str(dest_path))
-            try:
-                relative = os.path.relpath(str(dest_path), base_path)
-            except Exception:
-                relative = str(dest_path)
-            # optionally remove temp file
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-            return relative
-        except Exception as e:
-            QMessageBox.critical(self, "Error al finalizar anexo", f"No se pudo mover el anexo temporal:\n{e}")
-            return None
+            return False
+        return self._store_attachment(temp_path, remove_source=True, announce=False)
 
     def _calc_itbis_from_total(self):
         try:
@@ -514,17 +579,20 @@ class AddExpenseWindowQt(QDialog):
 
     def _on_save_clicked(self):
         import traceback
+        if self._ingest_job is not None:
+            # El anexo aún se está guardando: se guarda la factura cuando termine
+            self._save_after_ingest = True
+            self.btn_save.setEnabled(False)
+            return
         try:
             pending = getattr(self, "_pending_temp_attachment", None)
             if pending:
-                rel_final = self._finalize_temp_attachment(pending)
-                if rel_final:
-                    self.attachment_relative_path = rel_final
-                    self.attachment_display.setText(rel_final)
-                    self._pending_temp_attachment = None
+                if self._finalize_temp_attachment(pending):
+                    self._save_after_ingest = True
+                    self.btn_save.setEnabled(False)
                 else:
                     QMessageBox.critical(self, "Error", "No se pudo finalizar el anexo temporal. Revisa el anexo o intenta adjuntarlo nuevamente.")
-                    return
+                return
         except Exception as e:
             tb = traceback.format_exc()
             print("Error finalizando anexo temporal:\n", tb)
@@ -568,6 +636,7 @@ class AddExpenseWindowQt(QDialog):
                 "currency": currency, "exchange_rate": exchange_rate, "rnc": rnc, "third_party_name": third_party,
                 "itbis": _to_float(self.itbis_le.text(), default=0.0), "total_amount": _to_float(self.total_le.text(), default=0.0),
                 "attachment_path": attachment_val,
+                **(self.attachment_meta if attachment_val and self.attachment_meta else {}),
                 "company_id": (self.parent.get_current_company_id() if self.parent and hasattr(self.parent, "get_current_company_id") else None)
             }
         except Exception as e:
@@ -642,9 +711,9 @@ class AddExpenseWindowQt(QDialog):
             try: base = self._get_attachment_base()
             except Exception: base = None
 
-            full_path = str(Path(base) / rel) if base and not os.path.isabs(rel) else rel
+            full_path = self._locate_current_attachment(rel)
 
-            if full_path and os.path.exists(full_path):
+            if full_path:
                 resp = QMessageBox.question(
                     self,
                     "Eliminar anexo",
@@ -653,12 +722,20 @@ class AddExpenseWindowQt(QDialog):
                 )
                 if resp == QMessageBox.StandardButton.Yes:
                     try:
-                        os.remove(full_path)
+                        store = get_attachment_store(base) if blob_hash(full_path) else None
+                        if store is not None:
+                            # Blob del almacén: se quita el nombre; el blob solo si nadie más lo usa
+                            name = (self.attachment_meta or {}).get("attachment_relpath") or rel
+                            if not store.unlink(name):
+                                raise OSError(f"'{name}' no está registrado en el almacén de anexos")
+                        else:
+                            os.remove(full_path)
                         QMessageBox.information(self, "Archivo eliminado", "El archivo del anexo fue eliminado correctamente.")
                     except Exception as e:
                         QMessageBox.warning(self, "No se pudo eliminar", f"No fue posible eliminar el archivo:\n{e}")
             
             self.attachment_relative_path = ""
+            self.attachment_meta = None
             if hasattr(self, "attachment_display"):
                 self.attachment_display.setText("")
 
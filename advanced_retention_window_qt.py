@@ -195,20 +195,8 @@ class AdvancedRetentionWindowQt(QDialog):
             QMessageBox.critical(self, "Error", f"No se pudo obtener facturas: {e}")
             return
 
-        # Normalizar cada invoice a dict para que invoice.get(...) funcione
-        invoices = []
-        for inv in raw_invoices:
-            try:
-                invoices.append(dict(inv))
-            except Exception:
-                if isinstance(inv, dict):
-                    invoices.append(inv)
-                else:
-                    try:
-                        invoices.append({k: inv[k] for k in inv.keys()})
-                    except Exception:
-                        invoices.append(inv)
-        self.all_invoices = invoices
+        # Registros Invoice: ya soportan invoice.get(...), no hace falta copiarlos
+        self.all_invoices = list(raw_invoices)
 
         # limpiar tabla y estados
         self.table.setRowCount(0)
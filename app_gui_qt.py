@@ -1,17 +1,18 @@
 # --- LIBRERÍAS DE PYQT6 ---
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QMenuBar, QMenu,
-    QSplitter, QLabel, QComboBox, QPushButton, QTableWidget, QTableWidgetItem,
+    QSplitter, QLabel, QComboBox, QPushButton, QTableWidget, QTableWidgetItem, QTableView,
     QFrame, QSizePolicy, QMessageBox, QFileDialog, QGroupBox, QLineEdit, QDateEdit,
     QApplication, QHeaderView, QDialog
 )
 # QAction se importa de QtGui, que es el lugar correcto.
 from PyQt6.QtGui import QAction, QFont, QColor
-from PyQt6.QtCore import Qt, QDate
+from PyQt6.QtCore import Qt, QDate, QSize, QTimer
 
 # --- LIBRERÍAS ESTÁNDAR Y DE TERCEROS ---
 import pandas as pd
 import datetime
+import os
 from pathlib import Path
 
 # --- IMPORTS DE TUS PROPIOS MÓDULOS DE LA APLICACIÓN ---
@@ -24,6 +25,12 @@ from report_window_qt import ReportWindowQt
 from third_party_report_window_qt import ThirdPartyReportWindowQt
 from attachment_editor_window_qt import AttachmentEditorWindowQt
 from company_management_window_qt import CompanyManagementWindow # Asegúrate que la clase se llame así en el archivo
+from transactions_model_qt import TransactionsTableModel
+from job_executor_qt import JobExecutor
+from thumbnail_loader_qt import ThumbnailLoader, ICON_PX
+from diagnostics_window_qt import DiagnosticsWindowQt
+import query_stats
+from attachment_index import resolve_attachment
 
 
 class MainApplicationQt(QMainWindow):
@@ -37,8 +44,14 @@ class MainApplicationQt(QMainWindow):
             'Mayo': '05', 'Junio': '06', 'Julio': '07', 'Agosto': '08',
             'Septiembre': '09', 'Octubre': '10', 'Noviembre': '11', 'Diciembre': '12'
         }
-        # Lista maestra que SIEMPRE contiene TODAS las transacciones del filtro actual
-        self.all_current_transactions = []
+        # Filtro de período activo; la tabla pide sus filas por páginas con este filtro
+        self.current_period_filter = {}
+        # Miniaturas de los anexos de la tabla: solo de las filas visibles, en segundo plano
+        self.thumbnails = ThumbnailLoader(self, root_provider=self._attachment_root)
+        self.transactions_model = TransactionsTableModel(self.controller, parent=self, thumbnails=self.thumbnails)
+        # Tareas en segundo plano (consultas pesadas y reportes); compartido con las ventanas hijas
+        self.jobs = JobExecutor(self)
+        self._summary_request = None
         self.companies_list = []
         self.current_itbis_neto = 0.0
 
@@ -60,10 +73,88 @@ class MainApplicationQt(QMainWindow):
         # remaining UI wiring from your snippet
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self._show_context_menu)
+        self._setup_thumbnail_column()
 
         # Conexión del botón de cálculo
         self.btn_calcular.clicked.connect(self._recalculate_itbis_restante)
 
+        # Una sola vez: hash/tamaño/ruta de los anexos guardados antes de existir esas columnas
+        self._start_attachment_backfill()
+
+    def _start_attachment_backfill(self):
+        """
+        Completa en segundo plano los metadatos de anexo de las facturas existentes
+        (lectura y hash de archivos); el guardado en la base se hace en este hilo.
+        """
+        if self.controller.get_setting("attachment_metadata_backfilled"):
+            return
+        root = self.controller.get_attachment_base_path()
+        if not root or not os.path.isdir(root):
+            return  # Sin la carpeta de adjuntos no se puede verificar nada; se intenta en el próximo inicio
+
+        def _collect(job):
+            return self.controller.collect_attachment_metadata(root, progress_callback=job.report_progress)
+
+        self.jobs.submit(_collect, key="attachment-backfill", on_finished=self._on_attachment_metadata,
+                         on_failed=lambda message: print(f"[WARN] Metadatos de anexos: {message}"))
+
+    def _on_attachment_metadata(self, result):
+        updates, missing = result
+        updated = self.controller.apply_attachment_metadata(updates)
+        self.controller.set_setting("attachment_metadata_backfilled", True)
+        print(f"Metadatos de anexos completados: {updated} facturas, {len(missing)} anexos no encontrados.")
+
+    def _attachment_root(self):
+        return self.controller.get_setting("attachment_base_path") or self.controller.get_attachment_base_path()
+
+    def _setup_thumbnail_column(self):
+        """
+        Columna "Anexo" de la tabla: al dejar de desplazarse (o al llegar filas nuevas)
+        se piden las miniaturas de las filas visibles.
+        """
+        self.table.setIconSize(QSize(ICON_PX, ICON_PX))
+        self.table.verticalHeader().setDefaultSectionSize(ICON_PX + 6)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(TransactionsTableModel.PREVIEW_COLUMN, QHeaderView.ResizeMode.Fixed)
+        header.resizeSection(TransactionsTableModel.PREVIEW_COLUMN, ICON_PX + 24)
+        # Con la miniatura al final, la columna que se estira es la anterior
+        header.setStretchLastSection(False)
+
+        self._thumbnail_timer = QTimer(self)
+        self._thumbnail_timer.setSingleShot(True)
+        self._thumbnail_timer.setInterval(120)
+        self._thumbnail_timer.timeout.connect(self._request_visible_thumbnails)
+        # Sin argumentos: QTimer.start(int) tomaría el valor de la señal como intervalo
+        restart = lambda *_args: self._thumbnail_timer.start()
+        self.table.verticalScrollBar().valueChanged.connect(restart)
+        self.transactions_model.rowsInserted.connect(restart)
+        self.transactions_model.modelReset.connect(restart)
+
+    def _request_visible_thumbnails(self):
+        last_row = self.transactions_model.rowCount() - 1
+        if last_row < 0:
+            return
+        viewport = self.table.viewport()
+        first = self.table.rowAt(0)
+        last = self.table.rowAt(viewport.height() - 1)
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = last_row
+        self.transactions_model.request_thumbnails(first, last)
+
+    def closeEvent(self, event):
+        # Cancelar tareas pendientes y esperar (brevemente) a las que están en curso
+        self.jobs.shutdown(3000)
+        self.thumbnails.shutdown(1000)
+        # Con la instrumentación activa, deja el resumen para 'db_maintenance.py query-stats --saved'
+        if getattr(self.controller, "stats", None) is not None:
+            try:
+                self.controller.stats.save(query_stats.STATS_FILE)
+            except OSError as e:
+                print(f"No se pudieron guardar las estadísticas de consultas: {e}")
+        super().closeEvent(event)
+
     # ------------------------
     # Company management integration
     # ------------------------
@@ -159,6 +250,7 @@ class MainApplicationQt(QMainWindow):
         # --- Menú Opciones
         options_menu = menubar.addMenu("Opciones")
         options_menu.addAction("Configuración...", self._open_settings_window)
+        options_menu.addAction("Diagnóstico de Consultas...", self._open_diagnostics_window)
         options_menu.addSeparator()
         theme_menu = options_menu.addMenu("Cambiar Tema")
         for theme in ["Fusion", "Windows", "WindowsVista"]:
@@ -357,12 +449,10 @@ class MainApplicationQt(QMainWindow):
             tabla_filtro_layout.addStretch()
             right_layout.addLayout(tabla_filtro_layout)
 
-            self.table = QTableWidget(0, 7)
-            self.table.setHorizontalHeaderLabels([
-                "Fecha", "Tipo", "No. Fact.", "Empresa", "ITBIS (RD$)", "Monto Original", "Total (RD$)"
-            ])
+            # Vista sobre el modelo perezoso: las filas se cargan por páginas al desplazarse
+            self.table = QTableView()
+            self.table.setModel(self.transactions_model)
             self.table.setAlternatingRowColors(True)
-            self.table.setSortingEnabled(True)
             self.table.setSelectionBehavior(self.table.SelectionBehavior.SelectRows)
             # --------- Cambios para columnas expansibles ---------
             self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
@@ -442,175 +532,54 @@ class MainApplicationQt(QMainWindow):
             self._clear_ui()
             return
 
-        # 1. Obtener los datos del controlador
-        dashboard_data = self.controller.get_dashboard_data(
+        # 1-2. Totales calculados en SQLite en segundo plano; el panel de resumen
+        # se actualiza cuando llegan (un cambio de empresa cancela el cálculo anterior)
+        self._request_dashboard_summary(
             company_id, filter_month=filter_month, filter_year=filter_year, specific_date=specific_date
         )
 
-        if dashboard_data and dashboard_data['summary']:
-            summary = dashboard_data['summary']
-            
-            # 2. Actualizar el panel de resumen (CORREGIDO)
-            self.label_total_ingresos.setText(f"RD$ {summary.get('total_ingresos', 0.0):,.2f}")
-            self.label_total_gastos.setText(f"RD$ {summary.get('total_gastos', 0.0):,.2f}")
-            self.label_itbis_ingresos.setText(f"RD$ {summary.get('itbis_ingresos', 0.0):,.2f}")
-            self.label_itbis_gastos.setText(f"RD$ {summary.get('itbis_gastos', 0.0):,.2f}")
-            self.label_total_neto.setText(f"RD$ {summary.get('total_neto', 0.0):,.2f}")
-            self.label_itbis_neto.setText(f"RD$ {summary.get('itbis_neto', 0.0):,.2f}")
-            
-            # Guardamos el ITBIS neto y recalculamos
-            self.current_itbis_neto = summary.get('itbis_neto', 0.0)
-            self._recalculate_itbis_restante()
-            
-            # 3. Guardar la lista COMPLETA de transacciones
-            self.all_current_transactions = dashboard_data['all_transactions']
-            
-            # 4. Poblar la tabla usando el filtro de tipo (Ingreso/Gasto/Todos)
-            self._apply_transaction_filter()
+        # 3. Guardar el filtro de período; la tabla lo usa para paginar sus filas
+        self.current_period_filter = dict(
+            filter_month=filter_month, filter_year=filter_year, specific_date=specific_date
+        )
 
-        else:
-            self._clear_ui()
+        # 4. Poblar la tabla usando el filtro de tipo (Ingreso/Gasto/Todos)
+        self._apply_transaction_filter()
+
+    def _request_dashboard_summary(self, company_id, **filters):
+        """Lanza el cálculo del resumen en el pool de tareas, reemplazando cualquier cálculo pendiente."""
+        request = object()
+        self._summary_request = request
+        self.jobs.submit(
+            self.controller.get_dashboard_summary, company_id, key="dashboard-summary",
+            on_finished=lambda summary: self._on_dashboard_summary(request, summary),
+            on_failed=lambda message: print(f"[WARN] Resumen del dashboard: {message}"),
+            **filters
+        )
 
-# -------------------------------------------------------------------
-# Método modificado/robusto: poblar la tabla de transacciones
-# (Reemplaza la versión existente por esta)
-# -------------------------------------------------------------------
-    def _populate_transactions_table(self, transactions):
-        """
-        Pobla la QTableWidget con la lista de transacciones.
-        - Monto Original: muestra el valor en la moneda original (ej. "118.00 USD" o "RD$ 1,234.56")
-        - ITBIS (RD$): itbis * exchange_rate
-        - Total (RD$): usa total_amount_rd si existe y >0, si no total_amount * exchange_rate
-        - Guarda el ID de la factura en la columna "No. Fact." usando ItemDataRole.UserRole
-        - Debug prints controlables por self.debug_transactions (False por defecto)
-        """
-        from PyQt6.QtWidgets import QTableWidgetItem
-        from PyQt6.QtGui import QColor
+    def _on_dashboard_summary(self, request, summary):
+        # Ignorar resultados de una petición ya reemplazada o cancelada
+        if request is not self._summary_request:
+            return
+        self._summary_request = None
+        if summary is None:
+            self._clear_ui()
+            return
+        self._update_summary_labels(summary)
 
-        debug = getattr(self, "debug_transactions", False)
+    def _update_summary_labels(self, summary):
+        """Actualiza las etiquetas del resumen financiero y recalcula el ITBIS restante."""
+        self.label_total_ingresos.setText(f"RD$ {summary.get('total_ingresos', 0.0):,.2f}")
+        self.label_total_gastos.setText(f"RD$ {summary.get('total_gastos', 0.0):,.2f}")
+        self.label_itbis_ingresos.setText(f"RD$ {summary.get('itbis_ingresos', 0.0):,.2f}")
+        self.label_itbis_gastos.setText(f"RD$ {summary.get('itbis_gastos', 0.0):,.2f}")
+        self.label_total_neto.setText(f"RD$ {summary.get('total_neto', 0.0):,.2f}")
+        self.label_itbis_neto.setText(f"RD$ {summary.get('itbis_neto', 0.0):,.2f}")
 
-        self.table.setSortingEnabled(False)
-        self.table.setRowCount(0)
-        self.current_transactions = transactions or []
-        self.table.setRowCount(len(self.current_transactions))
+        # Guardamos el ITBIS neto y recalculamos
+        self.current_itbis_neto = summary.get('itbis_neto', 0.0)
+        self._recalculate_itbis_restante()
 
-        for row_index, trans in enumerate(self.current_transactions):
-            try:
-                if debug:
-                    print(f"[DBG] row {row_index} id={trans.get('id')} currency={trans.get('currency')} exchange_rate={trans.get('exchange_rate')} total_amount_rd={trans.get('total_amount_rd')}")
-
-                invoice_date = str(trans.get('invoice_date') or '')
-                invoice_type = str(trans.get('invoice_type') or '')
-                invoice_number = str(trans.get('invoice_number') or '')
-                third_party_name = str(trans.get('third_party_name') or '')
-
-                # Normalizar moneda
-                currency = trans.get('currency') or trans.get('moneda') or 'RD$'
-                if isinstance(currency, str):
-                    currency = currency.strip()
-                if currency.upper() in ("RDS", "RDS$", "RD", "DOP"):
-                    currency = "RD$"
-
-                # Lectura segura numérica con fallbacks
-                def _safe_float(keys, default=0.0):
-                    for k in keys:
-                        v = trans.get(k)
-                        if v in (None, ''):
-                            continue
-                        try:
-                            return float(v)
-                        except Exception:
-                            continue
-                    return float(default)
-
-                itbis = _safe_float(['itbis', 'itb', 'tax'], 0.0)
-                exchange_rate = _safe_float(['exchange_rate', 'tasa_cambio', 'rate'], 1.0)
-                total_amount = _safe_float(['total_amount', 'amount', 'monto'], 0.0)
-
-                # total_amount_rd preferido si está y > 0, si no calcularlo
-                total_amount_rd_val = trans.get('total_amount_rd')
-                total_amount_rd = None
-                try:
-                    if total_amount_rd_val not in (None, '', 0):
-                        total_amount_rd = float(total_amount_rd_val)
-                except Exception:
-                    total_amount_rd = None
-                if not total_amount_rd:
-                    total_amount_rd = total_amount * exchange_rate
-
-                # Tipo y color
-                if invoice_type == 'emitida':
-                    tipo_texto = "↑ INGRESO"
-                    color = QColor("#35ff95")
-                elif invoice_type == 'gasto':
-                    tipo_texto = "↓ GASTO"
-                    color = QColor("#ff5370")
-                else:
-                    tipo_texto = "N/A"
-                    color = QColor("gray")
-
-                # Construir items no-editables (solo seleccionables)
-                flags = Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
-
-                # Fecha
-                date_item = QTableWidgetItem(invoice_date)
-                date_item.setFlags(flags)
-                date_item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-                self.table.setItem(row_index, 0, date_item)
-
-                # Tipo
-                tipo_item = QTableWidgetItem(tipo_texto)
-                tipo_item.setFlags(flags)
-                tipo_item.setForeground(color)
-                tipo_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.table.setItem(row_index, 1, tipo_item)
-
-                # No. Fact. (guardar ID en UserRole)
-                invoice_number_item = QTableWidgetItem(invoice_number)
-                invoice_number_item.setFlags(flags)
-                fact_id = trans.get('id') or ''
-                invoice_number_item.setData(Qt.ItemDataRole.UserRole, fact_id)
-                invoice_number_item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-                self.table.setItem(row_index, 2, invoice_number_item)
-
-                # Empresa / tercero
-                third_item = QTableWidgetItem(third_party_name)
-                third_item.setFlags(flags)
-                third_item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-                self.table.setItem(row_index, 3, third_item)
-
-                # ITBIS en RD$ (numérico, alineado a la derecha)
-                itbis_rd = itbis * exchange_rate
-                itbis_item = QTableWidgetItem(f"{itbis_rd:,.2f}")
-                itbis_item.setFlags(flags)
-                itbis_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                self.table.setItem(row_index, 4, itbis_item)
-
-                # Monto Original: mostrar con prefijo "RD$ " si es RD$, o sufijo con la abreviatura si no
-                if currency == "RD$":
-                    monto_original_str = f"RD$ {total_amount:,.2f}"
-                else:
-                    monto_original_str = f"{total_amount:,.2f} {currency}"
-                monto_item = QTableWidgetItem(monto_original_str)
-                monto_item.setFlags(flags)
-                monto_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                monto_item.setToolTip(f"Tasa: {exchange_rate} → Total RD$: {total_amount_rd:,.2f}")
-                self.table.setItem(row_index, 5, monto_item)
-
-                # Total en RD$ (numérico)
-                total_rd_item = QTableWidgetItem(f"{total_amount_rd:,.2f}")
-                total_rd_item.setFlags(flags)
-                total_rd_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                self.table.setItem(row_index, 6, total_rd_item)
-
-            except Exception as e:
-                # No detener el poblado; log para depuración
-                print(f"[ERROR] Al poblar la fila {row_index}: {e}")
-                print(f"[ERROR] Datos de la transacción: {trans}")
-
-        self.table.setSortingEnabled(True)
-        # (Opcional) Si agregaste la columna de ID, puedes ocultarla así:
-        # self.table.setColumnHidden(7, True)
     def get_current_company_id(self):
         idx = self.company_selector.currentIndex()
         if idx < 0 or not hasattr(self, "companies_list"):
@@ -619,19 +588,22 @@ class MainApplicationQt(QMainWindow):
 
     def _apply_transaction_filter(self):
         """
-        Filtra la lista maestra de transacciones (sin volver a la DB)
-        y llama a la función que puebla la tabla.
+        Aplica el filtro de tipo (Ingresos/Gastos/Todos) sobre el período actual.
+        El modelo de la tabla vuelve a consultar la primera página con ese filtro;
+        el resto se carga a medida que el usuario se desplaza.
         """
         filter_value = self.transaction_filter.currentText()
         
         if filter_value == "Ingresos":
-            filtered = [t for t in self.all_current_transactions if t['invoice_type'] == 'emitida']
+            invoice_type = 'emitida'
         elif filter_value == "Gastos":
-            filtered = [t for t in self.all_current_transactions if t['invoice_type'] == 'gasto']
+            invoice_type = 'gasto'
         else: # "Todos"
-            filtered = self.all_current_transactions
+            invoice_type = None
             
-        self._populate_transactions_table(filtered)
+        self.transactions_model.set_query(
+            self.get_current_company_id(), invoice_type=invoice_type, **self.current_period_filter
+        )
 
     def _apply_month_year_filter(self):
         """Aplica el filtro por mes y año llamando a la función central."""
@@ -664,22 +636,15 @@ class MainApplicationQt(QMainWindow):
         company_id = self.get_current_company_id()
         if not company_id:
             return
-        dashboard_data = self.controller.get_dashboard_data(
-            company_id, filter_month=filter_month, filter_year=filter_year
-        )
-        if dashboard_data:
-            summary = dashboard_data['summary']
-            self.label_total_ingresos.setText(f"RD$ {summary.get('total_ingresos', 0.0):,.2f}")
-            self.label_total_gastos.setText(f"RD$ {summary.get('total_gastos', 0.0):,.2f}")
-            self.label_itbis_ingresos.setText(f"RD$ {summary.get('itbis_ingresos', 0.0):,.2f}")
-            self.label_itbis_gastos.setText(f"RD$ {summary.get('itbis_gastos', 0.0):,.2f}")
-            self.label_total_neto.setText(f"RD$ {summary.get('total_neto', 0.0):,.2f}")
-            self.label_itbis_neto.setText(f"RD$ {summary.get('itbis_neto', 0.0):,.2f}")
-            self._populate_transactions_table(dashboard_data['all_transactions'])
+        self._request_dashboard_summary(company_id, filter_month=filter_month, filter_year=filter_year)
+        self.current_period_filter = dict(filter_month=filter_month, filter_year=filter_year)
+        self._apply_transaction_filter()
 
 
     def _clear_ui(self):
         """Limpia todos los paneles de datos."""
+        self.jobs.cancel("dashboard-summary")
+        self._summary_request = None
         self.label_total_ingresos.setText("RD$ 0.00")
         self.label_total_gastos.setText("RD$ 0.00")
         self.label_itbis_ingresos.setText("RD$ 0.00")
@@ -687,8 +652,8 @@ class MainApplicationQt(QMainWindow):
         self.label_total_neto.setText("RD$ 0.00")
         self.label_itbis_neto.setText("RD$ 0.00")
         self.label_itbis_a_pagar.setText("RD$ 0.00")
-        self.table.setRowCount(0)
-        self.all_current_transactions = []
+        self.current_period_filter = {}
+        self.transactions_model.clear()
         
     def _recalculate_itbis_restante(self):
         """Calcula y muestra el ITBIS a pagar."""
@@ -766,6 +731,11 @@ class MainApplicationQt(QMainWindow):
                 self._populate_company_selector()
                 self._refresh_dashboard()
 
+    def _open_diagnostics_window(self):
+        """Abre las métricas de consultas (query_stats)."""
+        dlg = DiagnosticsWindowQt(self, self.controller)
+        dlg.exec()
+
     def _open_retention_calculator(self):
         """
         Abre la ventana de Cálculo de Impuestos y Retenciones (AdvancedRetentionWindowQt)
@@ -850,7 +820,11 @@ class MainApplicationQt(QMainWindow):
                 'third_party_name': form_data.get(third_party_key),
                 'itbis': float(form_data.get('itbis') or 0.0),  # Puede ser 0
                 'total_amount': float(form_data.get('factura_total') or 0.0),
-                'attachment_path': form_data.get('attachment_path')
+                'attachment_path': form_data.get('attachment_path'),
+                # Metadatos del anexo recién guardado (hash, tamaño y ruta normalizada), si vienen
+                'attachment_hash': form_data.get('attachment_hash'),
+                'attachment_size': form_data.get('attachment_size'),
+                'attachment_relpath': form_data.get('attachment_relpath'),
             }
             if invoice_type == 'emitida':
                 invoice_data['invoice_category'] = form_data.get('tipo_de_factura') or form_data.get('invoice_category')
@@ -869,12 +843,12 @@ class MainApplicationQt(QMainWindow):
             if currency != "RD$":
                 # si no tenemos rate razonable preguntamos al usuario
                 if not exchange_rate or exchange_rate == 1.0:
-                    # proponemos un valor por defecto (1.0) o intentamos tomar de current_transactions primer elemento
+                    # proponemos un valor por defecto (1.0) o intentamos tomar la tasa de la primera fila de la tabla
                     default_rate = "1.0"
                     # si hay transacciones previas intentamos usar su exchange_rate como sugerencia
                     try:
-                        if self.current_transactions and len(self.current_transactions) > 0:
-                            default_rate = str(self.current_transactions[0].get('exchange_rate', default_rate) or default_rate)
+                        if self.transactions_model.rowCount() > 0:
+                            default_rate = str(self.transactions_model.exchange_rate(0) or default_rate)
                     except Exception:
                         pass
 
@@ -930,9 +904,9 @@ class MainApplicationQt(QMainWindow):
 
     def _edit_selected_invoice(self, row, column):
         # Obtén el ID de la factura desde la fila seleccionada
-        if not self.current_transactions or row >= len(self.current_transactions):
+        invoice_data = self.transactions_model.transaction_at(row)
+        if not invoice_data:
             return
-        invoice_data = self.current_transactions[row]
         from add_invoice_window_qt import AddInvoiceWindowQt
         win = AddInvoiceWindowQt(self, self.controller, tipo_factura=invoice_data['invoice_type'],
                                 on_save=self._save_invoice_callback, existing_data=invoice_data)
@@ -948,21 +922,21 @@ class MainApplicationQt(QMainWindow):
         """
         import json # Importamos json para un formato legible
 
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
 
         if current_row < 0:
             QMessageBox.warning(self, "Sin Selección", "Por favor, selecciona una fila en la tabla para diagnosticar.")
             return
 
-        # Verificamos que el índice de la fila sea válido para la lista de datos
-        if current_row >= len(self.current_transactions):
+        # Verificamos que el índice de la fila sea válido para las filas cargadas
+        if current_row >= self.transactions_model.rowCount():
             QMessageBox.critical(self, "Error de Sincronización", 
-                                 f"El índice de la fila ({current_row}) está fuera del rango de los datos actuales ({len(self.current_transactions)} registros).\n"
+                                 f"El índice de la fila ({current_row}) está fuera del rango de los datos actuales ({self.transactions_model.rowCount()} registros).\n"
                                  "Intenta refrescar los datos.")
             return
 
         # Obtenemos el diccionario de datos exacto para esa fila
-        transaction_data = self.current_transactions[current_row]
+        transaction_data = self.transactions_model.transaction_at(current_row)
         
         # Formateamos los datos para que sean fáciles de leer
         if transaction_data:
@@ -979,16 +953,16 @@ class MainApplicationQt(QMainWindow):
 
     def _select_row_for_comparison(self, row_type):
         """Guarda los datos de la fila seleccionada para la comparación."""
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
         if current_row < 0:
             QMessageBox.warning(self, "Sin Selección", "Por favor, selecciona una fila en la tabla.")
             return
 
-        if current_row >= len(self.current_transactions):
+        if current_row >= self.transactions_model.rowCount():
             QMessageBox.critical(self, "Error", "El índice de la fila está fuera de rango.")
             return
 
-        transaction_data = self.current_transactions[current_row]
+        transaction_data = self.transactions_model.transaction_at(current_row)
 
         if row_type == 'full':
             self.full_row_data = transaction_data
@@ -1047,18 +1021,18 @@ class MainApplicationQt(QMainWindow):
         """
         import json # Used for pretty-printing the dictionary
 
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
 
         if current_row < 0:
             QMessageBox.warning(self, "Sin Selección", "Por favor, selecciona una fila en la tabla para diagnosticar.")
             return
 
-        if current_row >= len(self.current_transactions):
+        if current_row >= self.transactions_model.rowCount():
             QMessageBox.critical(self, "Error de Sincronización", "El índice de la fila está fuera de rango. Intenta refrescar los datos.")
             return
 
         # Get the exact data dictionary for that row
-        transaction_data = self.current_transactions[current_row]
+        transaction_data = self.transactions_model.transaction_at(current_row)
         
         # Format the data for easy reading
         pretty_data = json.dumps(transaction_data, indent=4, ensure_ascii=False, default=str)
@@ -1086,9 +1060,9 @@ class MainApplicationQt(QMainWindow):
             self._refresh_dashboard()
     def _edit_selected_invoice(self, row, column):
         # Obtén el índice/ID de la factura desde la fila seleccionada
-        if not self.current_transactions or row < 0 or row >= len(self.current_transactions):
+        invoice_data = self.transactions_model.transaction_at(row)
+        if not invoice_data:
             return
-        invoice_data = self.current_transactions[row]
         invoice_type = invoice_data.get('invoice_type', '')
 
         if invoice_type == 'gasto':
@@ -1115,9 +1089,9 @@ class MainApplicationQt(QMainWindow):
         """
         Crea y añade al right_layout:
         - la barra de filtro (Mostrar: Todos/Ingresos/Gastos) junto a los botones Editar/Eliminar
-        - la QTableWidget (self.table) con configuración adecuada
+        - la QTableView (self.table) sobre el modelo perezoso de transacciones
         """
-        from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QComboBox, QPushButton, QTableWidget
+        from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QComboBox, QPushButton, QTableView
         # Contenedor para la barra de filtro y botones
         filter_widget = QWidget()
         filter_layout = QHBoxLayout(filter_widget)
@@ -1150,12 +1124,9 @@ class MainApplicationQt(QMainWindow):
         right_layout.addWidget(filter_widget)
 
         # Crear la tabla y guardarla en self.table (si ya existe, la sobreescribimos)
-        self.table = QTableWidget(0, 7)
-        self.table.setHorizontalHeaderLabels([
-            "Fecha", "Tipo", "No. Fact.", "Empresa", "ITBIS (RD$)", "Monto Original", "Total (RD$)"
-        ])
+        self.table = QTableView()
+        self.table.setModel(self.transactions_model)
         self.table.setAlternatingRowColors(True)
-        self.table.setSortingEnabled(True)
         self.table.setSelectionBehavior(self.table.SelectionBehavior.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.table.horizontalHeader().setSectionsMovable(True)
@@ -1163,7 +1134,7 @@ class MainApplicationQt(QMainWindow):
 
         # Conexiones de interacción
         # Doble-clic abre editor
-        self.table.cellDoubleClicked.connect(lambda r, c: self._edit_selected_transaction(r))
+        self.table.doubleClicked.connect(lambda index: self._edit_selected_transaction(index.row()))
         # Clic derecho -> menú (ya conectado en __init__, pero aseguramos política)
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self._show_context_menu)
@@ -1198,13 +1169,10 @@ class MainApplicationQt(QMainWindow):
 
     def _get_invoice_id_from_row(self, row):
         """
-        Devuelve el invoice id almacenado en UserRole del item No. Fact. (columna 2).
+        Devuelve el invoice id de la fila indicada (UserRole de la columna No. Fact.).
         """
         try:
-            item = self.table.item(row, 2)
-            if not item:
-                return None
-            val = item.data(Qt.ItemDataRole.UserRole)
+            val = self.transactions_model.invoice_id(row)
             if val is None or val == "":
                 return None
             try:
@@ -1222,7 +1190,7 @@ class MainApplicationQt(QMainWindow):
         """
         from PyQt6.QtWidgets import QMessageBox
         if row is None:
-            row = self.table.currentRow()
+            row = self.table.currentIndex().row()
         if row < 0:
             QMessageBox.information(self, "Editar", "Selecciona primero una transacción en la tabla.")
             return
@@ -1263,7 +1231,7 @@ class MainApplicationQt(QMainWindow):
         """
         from PyQt6.QtWidgets import QMessageBox
         if row is None:
-            row = self.table.currentRow()
+            row = self.table.currentIndex().row()
         if row < 0:
             QMessageBox.information(self, "Eliminar", "Selecciona primero una transacción en la tabla.")
             return
@@ -1303,24 +1271,25 @@ class MainApplicationQt(QMainWindow):
 
     def _open_attachment_editor(self, relative_or_absolute_path):
         """
-        Abre el editor de anexos. Si se pasa ruta relativa, la intenta resolver usando
-        controller.get_setting('attachment_base_path').
+        Abre el editor de anexos. Si la ruta no existe, la intenta resolver usando
+        controller.get_setting('attachment_base_path') (o la raíz de adjuntos) y su índice.
         """
         import os
         path = relative_or_absolute_path or ""
-        if not os.path.isabs(path):
+        if not os.path.exists(path):
             try:
-                base = self.controller.get_setting("attachment_base_path")
+                base = self.controller.get_setting("attachment_base_path") or self.controller.get_attachment_base_path()
             except Exception:
                 base = None
-            if base:
-                candidate = os.path.join(base, path)
-                if os.path.exists(candidate):
-                    path = candidate
+            # Unida a la raíz o, si no, buscada por nombre en el índice de adjuntos
+            path = resolve_attachment(path, base) or path
         if not os.path.exists(path):
             QMessageBox.warning(self, "Archivo no encontrado", f"No se encontró el anexo: {path}")
             return
         dlg = AttachmentEditorWindowQt(self, path)
         dlg.exec()
+        # El anexo pudo cambiar: las miniaturas se vuelven a pedir (la caché en disco va por contenido)
+        self.thumbnails.clear()
+        self._thumbnail_timer.start()
 
 
@@ -1,17 +1,139 @@
 # attachment_editor_window_qt.py
 
+"""
+Editor de imágenes anexas (rotar, contraste, recorte).
+
+Para que la edición sea fluida con escaneos de 20 megapíxeles, el editor trabaja
+sobre una copia reducida (a lo sumo PROXY_MAX_PX de lado) y anota cada cambio
+en una lista de operaciones. Al guardar, la lista se aplica una sola vez sobre
+la imagen a resolución completa, en un hilo secundario (JobExecutor).
+
+La imagen reducida se muestra con un QImage que usa directamente el búfer de
+bytes (formato nativo de Qt, sin QPixmap ni conversión por píxel).
+"""
 import os
+import tempfile
 import traceback
 from pathlib import Path
 from PIL import Image, ImageEnhance
 
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox,
-    QGraphicsView, QGraphicsScene, QFrame, QGraphicsPixmapItem, QGraphicsRectItem,
+    QGraphicsView, QGraphicsScene, QFrame, QGraphicsItem, QGraphicsRectItem,
 )
-from PyQt6.QtGui import QPixmap, QImage, QPen, QColor, QBrush, QPainter
+from PyQt6.QtGui import QImage, QPen, QColor, QBrush, QPainter
 from PyQt6.QtCore import Qt, QRectF, QPointF, QSizeF, pyqtSignal # <-- 1. IMPORTAR pyqtSignal
 
+from job_executor_qt import JobExecutor
+from attachment_ingest import fitted_size
+from attachment_store import blob_hash, get_attachment_store
+
+# Lado mayor de la copia de trabajo que se muestra y edita
+PROXY_MAX_PX = 2048
+CONTRAST_STEP = 1.25
+
+
+def apply_operation(image, operation):
+    """
+    Aplica una operación del editor a una imagen PIL RGB y retorna la nueva:
+    ('rotate', 90), ('contrast', factor) o ('crop', (izq, arriba, der, abajo)) con
+    el recuadro en fracciones del tamaño, para que valga a cualquier resolución.
+    """
+    kind, value = operation
+    if kind == 'rotate':
+        # transpose es exacto y mucho más rápido que rotate(90, expand=True) (mismo sentido)
+        turns = (int(value) // 90) % 4
+        transposes = {1: Image.Transpose.ROTATE_90, 2: Image.Transpose.ROTATE_180, 3: Image.Transpose.ROTATE_270}
+        return image.transpose(transposes[turns]) if turns else image
+    if kind == 'contrast':
+        return ImageEnhance.Contrast(image).enhance(value)
+    if kind == 'crop':
+        left, top, right, bottom = value
+        w, h = image.size
+        return image.crop((round(left * w), round(top * h), round(right * w), round(bottom * h)))
+    raise ValueError(f"Operación desconocida: {kind}")
+
+
+def apply_operations(image, operations):
+    for operation in operations:
+        image = apply_operation(image, operation)
+    return image
+
+
+def load_proxy_image(path, max_px=PROXY_MAX_PX):
+    """(copia RGB reducida, tamaño original). Los JPEG se decodifican ya reducidos (draft)."""
+    with Image.open(path) as img:
+        full_size = img.size
+        img.draft('RGB', fitted_size(full_size, max_px))
+        proxy = img.convert("RGB")
+    proxy.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+    return proxy, full_size
+
+
+def render_full_resolution(image_path, operations, max_size, dest_path=None):
+    """
+    Aplica 'operations' a la imagen completa, la ajusta a max_size (ancho, alto) y
+    la guarda de forma atómica en dest_path (por defecto, sobre image_path). Si la
+    imagen es un blob del almacén por contenido, el resultado se guarda como blob
+    nuevo y los nombres que usaban el anterior pasan a él.
+    Corre en un hilo secundario: no toca la interfaz. Retorna la ruta guardada.
+    """
+    dest_path = dest_path or image_path
+    with Image.open(image_path) as img:
+        image = img.convert("RGB")
+    image = apply_operations(image, operations)
+    image.thumbnail((int(max_size[0]), int(max_size[1])), Image.Resampling.LANCZOS)
+    old_hash = blob_hash(dest_path)
+    directory = tempfile.gettempdir() if old_hash else os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.editor-', suffix=Path(dest_path).suffix, dir=directory)
+    os.close(fd)
+    try:
+        image.save(tmp_path, quality=95, optimize=True)
+        if old_hash:
+            # <raíz>/.blobs_anexos/ab/<hash>.jpg: el blob no se modifica en el lugar
+            root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(dest_path))))
+            dest_path = get_attachment_store(root, create=True).replace_content(old_hash, tmp_path).path
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return dest_path
+
+
+def qimage_from_pil(pil_image):
+    """
+    (QImage, búfer) que comparten memoria: los bytes se empaquetan una vez en BGRX,
+    el orden de Format_RGB32 en memoria, y el QImage los usa sin copiarlos. El
+    búfer debe mantenerse vivo mientras se use el QImage.
+    """
+    if pil_image.mode != "RGB":
+        pil_image = pil_image.convert("RGB")
+    buffer = pil_image.tobytes("raw", "BGRX")
+    qimage = QImage(buffer, pil_image.width, pil_image.height, pil_image.width * 4, QImage.Format.Format_RGB32)
+    return qimage, buffer
+
+
+class ImageItem(QGraphicsItem):
+    """Dibuja un QImage directamente (sin convertirlo a QPixmap)."""
+
+    def __init__(self, qimage, buffer, parent=None):
+        super().__init__(parent)
+        self._image = qimage
+        self._buffer = buffer  # Mantiene vivos los bytes que usa el QImage
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._image.width(), self._image.height())
+
+    def paint(self, painter, option, widget=None):
+        painter.drawImage(0, 0, self._image)
+
+
 # (La clase CropRectItem no necesita cambios, se deja igual)
 class CropRectItem(QGraphicsRectItem):
     HANDLE_SIZE = 12
@@ -145,10 +267,14 @@ class AttachmentEditorWindowQt(QDialog):
         self.image_path = image_path
         self.width_destino = width
         self.height_destino = height
+        # Cambios pendientes de aplicar a la imagen completa (ver apply_operation)
+        self.operations = []
+        self.jobs = getattr(parent, "jobs", None) or JobExecutor(self)
+        self._save_job = None
 
         try:
-            self.original_image = Image.open(self.image_path).convert("RGB")
-            self.current_image = self.original_image.copy()
+            # Copia de trabajo reducida; la imagen completa solo se lee al guardar
+            self.current_image, self.full_size = load_proxy_image(self.image_path)
         except Exception as e:
             tb = traceback.format_exc()
             QMessageBox.critical(self, "Error al abrir imagen", f"No se pudo abrir la imagen:\n{e}\n\n{tb}")
@@ -167,6 +293,7 @@ class AttachmentEditorWindowQt(QDialog):
             self.view.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
             self.view.setFrameShape(QFrame.Shape.NoFrame)
             self.crop_item = None
+            self.image_item = None
             self._build_ui()
             self.update_image_display()
         except Exception as e:
@@ -191,8 +318,8 @@ class AttachmentEditorWindowQt(QDialog):
         btn_contrast.clicked.connect(self.enhance_contrast)
         self.btn_crop = QPushButton("Recortar")
         self.btn_crop.clicked.connect(self.toggle_crop_mode)
-        btn_save = QPushButton("Guardar")
-        btn_save.clicked.connect(self.save_changes)
+        self.btn_save = QPushButton("Guardar")
+        self.btn_save.clicked.connect(self.save_changes)
         # <-- 5. CAMBIAR BOTÓN A "CERRAR"
         btn_close = QPushButton("Cerrar")
         btn_close.clicked.connect(self.close) # Usar close() para ventanas no modales
@@ -204,13 +331,14 @@ class AttachmentEditorWindowQt(QDialog):
         toolbar_layout.addWidget(btn_contrast)
         toolbar_layout.addWidget(self.btn_crop)
         toolbar_layout.addStretch()
-        toolbar_layout.addWidget(btn_save)
+        toolbar_layout.addWidget(self.btn_save)
         toolbar_layout.addWidget(btn_close)
 
         main_layout.addLayout(toolbar_layout)
         main_layout.addWidget(self.view)
 
     def save_changes(self):
+        """Aplica las operaciones a la imagen completa en segundo plano; al terminar emite 'saved'."""
         try:
             # --- VALIDACIÓN CRÍTICA (se mantiene igual) ---
             if not isinstance(self.width_destino, (int, float)) or self.width_destino <= 0:
@@ -220,71 +348,54 @@ class AttachmentEditorWindowQt(QDialog):
                 QMessageBox.critical(self, "Error de Dimensiones", f"La altura de destino es inválida: {self.height_destino}")
                 return
             # --- FIN DE LA VALIDACIÓN ---
+            if self._save_job is not None:
+                return
 
-            # Hacemos una copia para no modificar la imagen actual en el editor
-            img_to_save = self.current_image.copy()
-            
-            # --- LÍNEA CLAVE CORREGIDA ---
-            # Usamos thumbnail para redimensionar proporcionalmente
-            img_to_save.thumbnail(
-                (int(self.width_destino), int(self.height_destino)), 
-                Image.Resampling.LANCZOS
+            self.btn_save.setEnabled(False)
+            self.btn_save.setText("Guardando...")
+            self._save_job = self.jobs.submit(
+                render_full_resolution, self.image_path, list(self.operations),
+                (self.width_destino, self.height_destino),
+                key=f"attachment-editor-{id(self)}",
+                on_finished=self._on_saved, on_failed=self._on_save_failed,
             )
-            
-            # Asegurarse de que el directorio existe (se mantiene igual)
-            dirp = os.path.dirname(self.image_path)
-            if dirp and not os.path.exists(dirp):
-                os.makedirs(dirp, exist_ok=True)
-                
-            img_to_save.save(self.image_path, quality=95, optimize=True)
-            QMessageBox.information(self, "Guardado", "Los cambios han sido guardados.")
-            
-            self.saved.emit(self.image_path)
-            self.close()
-            
         except Exception as e:
             tb = traceback.format_exc()
             QMessageBox.critical(self, "Error al Guardar", f"No se pudo guardar la imagen:\n{e}\n\n{tb}")
-    # (El resto del archivo AttachmentEditorWindowQt no necesita más cambios)
-    def pil_to_qpixmap(self, pil_image):
-        """
-        Convierte una imagen de Pillow a QPixmap de forma robusta.
-        """
-        try:
-            # Asegurarse de que la imagen esté en un formato que QImage entiende bien
-            if pil_image.mode == "RGBA":
-                format = QImage.Format.Format_RGBA8888
-            elif pil_image.mode == "RGB":
-                format = QImage.Format.Format_RGB888
-            else:
-                # Convertir otros modos a RGB
-                pil_image = pil_image.convert("RGB")
-                format = QImage.Format.Format_RGB888
-
-            # Crear QImage desde los bytes, especificando el stride (bytes por línea)
-            qimage = QImage(
-                pil_image.tobytes(),
-                pil_image.width,
-                pil_image.height,
-                pil_image.width * len(pil_image.getbands()), # bytes por línea
-                format
-            )
-            return QPixmap.fromImage(qimage)
-        except Exception as e:
-            print(f"[attachment_editor] ERROR convirtiendo PIL a QPixmap: {e}")
-            return QPixmap() # Devuelve un Pixmap vacío en caso de error
+
+    def _on_saved(self, path):
+        self._save_job = None
+        self.btn_save.setEnabled(True)
+        self.btn_save.setText("Guardar")
+        QMessageBox.information(self, "Guardado", "Los cambios han sido guardados.")
+        self.saved.emit(path)
+        self.close()
+
+    def _on_save_failed(self, message):
+        self._save_job = None
+        self.btn_save.setEnabled(True)
+        self.btn_save.setText("Guardar")
+        QMessageBox.critical(self, "Error al Guardar", f"No se pudo guardar la imagen:\n{message}")
+
+    def _apply(self, operation):
+        """Aplica la operación a la copia de trabajo, la anota y refresca la vista."""
+        self.current_image = apply_operation(self.current_image, operation)
+        self.operations.append(operation)
+        self.update_image_display()
 
     def update_image_display(self):
         try:
+            if self.crop_item is not None and self.crop_item.scene() is self.scene:
+                self.scene.removeItem(self.crop_item)  # se conserva al limpiar la escena
             self.scene.clear()
-            pixmap = self.pil_to_qpixmap(self.current_image)
-            if not pixmap.isNull():
-                self.pixmap_item = QGraphicsPixmapItem(pixmap)
-                self.scene.addItem(self.pixmap_item)
-                self.scene.setSceneRect(0, 0, pixmap.width(), pixmap.height())
+            qimage, buffer = qimage_from_pil(self.current_image)
+            if not qimage.isNull():
+                self.image_item = ImageItem(qimage, buffer)
+                self.scene.addItem(self.image_item)
+                self.scene.setSceneRect(0, 0, qimage.width(), qimage.height())
                 self.fit_to_view()
             if self.crop_item:
-                # re-add crop item above pixmap
+                # re-add crop item above the image
                 self.scene.addItem(self.crop_item)
         except Exception as e:
             tb = traceback.format_exc()
@@ -313,16 +424,13 @@ class AttachmentEditorWindowQt(QDialog):
 
     def rotate_image(self):
         try:
-            self.current_image = self.current_image.rotate(90, expand=True)
-            self.update_image_display()
+            self._apply(('rotate', 90))
         except Exception as e:
             QMessageBox.warning(self, "Error al rotar", str(e))
 
     def enhance_contrast(self):
         try:
-            enhancer = ImageEnhance.Contrast(self.current_image)
-            self.current_image = enhancer.enhance(1.25)
-            self.update_image_display()
+            self._apply(('contrast', CONTRAST_STEP))
         except Exception as e:
             QMessageBox.warning(self, "Error de contraste", str(e))
     def toggle_crop_mode(self):
@@ -331,9 +439,9 @@ class AttachmentEditorWindowQt(QDialog):
                 self.apply_crop()
                 self.btn_crop.setText("Recortar")
             else:
-                if not hasattr(self, "pixmap_item") or not self.pixmap_item:
+                if not self.image_item:
                     return
-                rect = self.pixmap_item.boundingRect()
+                rect = self.image_item.boundingRect()
                 w = rect.width() * 0.6
                 h = rect.height() * 0.6
                 x = rect.x() + (rect.width() - w) / 2
@@ -354,7 +462,7 @@ class AttachmentEditorWindowQt(QDialog):
             crop_rect = self.crop_item.rect()
             tl_scene = self.crop_item.mapToScene(crop_rect.topLeft())
             br_scene = self.crop_item.mapToScene(crop_rect.bottomRight())
-            pixmap_rect = self.pixmap_item.sceneBoundingRect()
+            pixmap_rect = self.image_item.sceneBoundingRect()
             if pixmap_rect.width() == 0 or pixmap_rect.height() == 0:
                 QMessageBox.warning(self, "Error", "No se puede recortar: dimensiones inválidas.")
                 return
@@ -369,13 +477,14 @@ class AttachmentEditorWindowQt(QDialog):
             if x2 - x1 < 10 or y2 - y1 < 10:
                 QMessageBox.warning(self, "Recorte inválido", "El área seleccionada es demasiado pequeña.")
                 return
-            self.current_image = self.current_image.crop((x1, y1, x2, y2))
             try:
                 self.scene.removeItem(self.crop_item)
             except Exception:
                 pass
             self.crop_item = None
-            self.update_image_display()
+            # El recuadro se anota en fracciones para aplicarlo luego a la imagen completa
+            w, h = self.current_image.size
+            self._apply(('crop', (x1 / w, y1 / h, x2 / w, y2 / h)))
             self.btn_crop.setText("Recortar")
         except Exception as e:
             tb = traceback.format_exc()
@@ -391,7 +500,10 @@ class AttachmentEditorWindowQt(QDialog):
             pass
 
     def get_final_image(self):
+        """Imagen completa con las operaciones aplicadas y ajustada al tamaño de destino."""
         try:
-            return self.current_image.resize((self.width_destino, self.height_destino), Image.Resampling.LANCZOS)
+            with Image.open(self.image_path) as img:
+                image = apply_operations(img.convert("RGB"), self.operations)
+            return image.resize((self.width_destino, self.height_destino), Image.Resampling.LANCZOS)
         except Exception:
-            return self.current_image
\ No newline at end of file
+            return self.current_image
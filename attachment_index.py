@@ -0,0 +1,283 @@
+"""
+Índice persistente de los archivos bajo la raíz de adjuntos.
+
+Buscar un anexo por su nombre recorría toda la carpeta de Dropbox por cada
+factura (glob('**/nombre') y os.walk). Este índice guarda, por carpeta, la
+lista de archivos y subcarpetas. Para las búsquedas mantiene además dos
+diccionarios: nombre -> carpetas y nombre en minúsculas -> (carpeta, nombre).
+
+- Se construye una vez y se guarda en attachment_index.json, en la caché local
+  de la raíz (page_cache.cache_dir_for), fuera de la carpeta sincronizada.
+- refresh() es incremental: hace stat de cada carpeta conocida y solo vuelve a
+  listar las que cambiaron de mtime. Agregar, borrar o renombrar un archivo
+  cambia el mtime de su carpeta.
+- Las carpetas ocultas (nombre con '.'), como el almacén por contenido, no se
+  indexan.
+
+    index = get_attachment_index(root)
+    path = index.find("Empresa/2024/05/factura_123.pdf")   # ruta absoluta o None
+    path = resolve_attachment("factura_123.pdf", root)    # ruta directa, almacén o índice
+
+También arma los metadatos que se guardan con cada factura
+(attachment_metadata: hash, tamaño y ruta relativa normalizada).
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+
+from page_cache import cache_dir_for
+from attachment_store import get_attachment_store, hash_file, blob_hash
+
+INDEX_FILE = 'attachment_index.json'
+INDEX_VERSION = 1
+# Antigüedad máxima del índice antes de revisar las carpetas otra vez
+REFRESH_SECONDS = 30
+# Ante un nombre no encontrado se revisa de nuevo si el índice tiene más de esto
+MISS_REFRESH_SECONDS = 5
+
+
+class AttachmentIndex:
+    """Archivos de 'root' por nombre (exacto y sin distinguir mayúsculas)."""
+
+    def __init__(self, root, index_path=None):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(cache_dir_for(self.root), INDEX_FILE)
+        self._lock = threading.RLock()
+        self._dirs = None  # carpeta relativa -> [mtime_ns, [archivos], [subcarpetas]]
+        self._by_name = {}
+        self._by_lower = {}
+        self._refreshed_at = 0.0
+
+    # --- Construcción ---
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (isinstance(data, dict) and data.get('version') == INDEX_VERSION
+                    and data.get('root') == os.path.normcase(self.root)):
+                return data.get('dirs') or {}
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self):
+        data = {'version': INDEX_VERSION, 'root': os.path.normcase(self.root), 'dirs': self._dirs}
+        directory = os.path.dirname(self.index_path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.attachment-index-', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"No se pudo guardar el índice de adjuntos: {e}")
+
+    @staticmethod
+    def _scan(path):
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        else:
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, subdirs
+
+    def refresh(self):
+        """
+        Sincroniza el índice con el disco: solo se listan las carpetas nuevas o
+        cuyo mtime cambió. Retorna la cantidad de carpetas vueltas a listar.
+        """
+        with self._lock:
+            if self._dirs is None:
+                self._dirs = self._load()
+            rescanned = 0
+            seen = set()
+            stack = ['']
+            while stack:
+                rel = stack.pop()
+                full = os.path.join(self.root, rel) if rel else self.root
+                try:
+                    mtime_ns = os.stat(full).st_mtime_ns
+                except OSError:
+                    continue
+                entry = self._dirs.get(rel)
+                if entry is None or entry[0] != mtime_ns:
+                    files, subdirs = self._scan(full)
+                    entry = self._dirs[rel] = [mtime_ns, files, subdirs]
+                    rescanned += 1
+                seen.add(rel)
+                stack.extend(os.path.join(rel, name) if rel else name for name in entry[2])
+
+            stale = [rel for rel in self._dirs if rel not in seen]
+            for rel in stale:
+                del self._dirs[rel]
+            if rescanned or stale or not self._by_name:
+                self._rebuild_maps()
+            if rescanned or stale:
+                self._save()
+            self._refreshed_at = time.monotonic()
+            return rescanned
+
+    def _rebuild_maps(self):
+        by_name, by_lower = {}, {}
+        for rel, (_mtime, files, _subdirs) in self._dirs.items():
+            for name in files:
+                by_name.setdefault(name, []).append(rel)
+                by_lower.setdefault(name.lower(), []).append((rel, name))
+        self._by_name, self._by_lower = by_name, by_lower
+
+    def ensure_fresh(self, max_age=REFRESH_SECONDS):
+        with self._lock:
+            if self._dirs is None or time.monotonic() - self._refreshed_at > max_age:
+                self.refresh()
+
+    def iter_files(self):
+        """Rutas absolutas de todos los archivos indexados."""
+        self.ensure_fresh()
+        with self._lock:
+            items = [(rel, list(files)) for rel, (_mtime, files, _subdirs) in self._dirs.items()]
+        for rel, files in items:
+            for name in files:
+                yield os.path.join(self.root, rel, name)
+
+    # --- Búsqueda ---
+
+    def _candidates(self, name):
+        exact = [(rel, name) for rel in self._by_name.get(name, ())]
+        return exact or list(self._by_lower.get(name.lower(), ()))
+
+    def find(self, path):
+        """
+        Ruta absoluta de un archivo con el mismo nombre que 'path' (primero exacto,
+        luego sin distinguir mayúsculas). Si hay varios, se prefiere el que termina
+        con la misma ruta relativa y luego el menos profundo. None si no existe.
+        """
+        if not path:
+            return None
+        normalized = str(path).strip().replace('\\', '/').strip('/')
+        name = normalized.rsplit('/', 1)[-1]
+        if not name:
+            return None
+
+        self.ensure_fresh()
+        with self._lock:
+            candidates = self._candidates(name)
+            if not candidates and time.monotonic() - self._refreshed_at > MISS_REFRESH_SECONDS:
+                self.refresh()
+                candidates = self._candidates(name)
+
+        suffix = '/' + normalized.lower()
+
+        def rank(item):
+            rel, actual = item
+            rel_path = (rel.replace(os.sep, '/') + '/' + actual) if rel else actual
+            return (not ('/' + rel_path.lower()).endswith(suffix), rel_path.count('/'), rel_path)
+
+        for rel, actual in sorted(candidates, key=rank):
+            full = os.path.join(self.root, rel, actual)
+            if os.path.exists(full):
+                return full
+        return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_attachment_index(root):
+    """Instancia compartida del índice para esa raíz, o None si la raíz no existe."""
+    if not root or not os.path.isdir(root):
+        return None
+    key = os.path.normcase(os.path.abspath(root))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = AttachmentIndex(root)
+        return index
+
+
+def resolve_attachment(path, root):
+    """
+    Ruta existente de un anexo: absoluta, unida a 'root', su blob en el almacén
+    por contenido (attachment_store) o buscada por nombre en el índice de 'root'.
+    Retorna None si no se encuentra.
+    """
+    if not path:
+        return None
+    normalized = os.path.normpath(str(path).strip().replace('\\', os.sep).replace('/', os.sep))
+    if os.path.isabs(normalized):
+        if os.path.exists(normalized):
+            return normalized
+    elif root:
+        candidate = os.path.normpath(os.path.join(root, normalized))
+        if os.path.exists(candidate):
+            return candidate
+    store = get_attachment_store(root)
+    blob = store.resolve(path) if store else None
+    if blob:
+        return blob
+    index = get_attachment_index(root)
+    return index.find(path) if index else None
+
+
+def normalize_relpath(path, root):
+    """
+    Ruta guardada en attachment_relpath: relativa a 'root' si está dentro, con '/'
+    como separador en cualquier sistema; si está fuera de la raíz, la absoluta.
+    """
+    full = os.path.abspath(path)
+    if root:
+        try:
+            rel = os.path.relpath(full, os.path.abspath(root))
+        except ValueError:
+            rel = None  # Otra unidad en Windows
+        if rel and rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+            full = rel
+    return full.replace(os.sep, '/')
+
+
+def attachment_metadata(full_path, root):
+    """Columnas attachment_hash, attachment_size y attachment_relpath para un archivo existente."""
+    return {
+        # Un blob del almacén se llama como su hash: no hace falta leerlo
+        'attachment_hash': blob_hash(full_path) or hash_file(full_path),
+        'attachment_size': os.path.getsize(full_path),
+        'attachment_relpath': normalize_relpath(full_path, root),
+    }
+
+
+def locate_attachment(relpath, root, content_hash=None):
+    """
+    Archivo existente de un anexo guardado: su ruta relativa bajo 'root' o, si el
+    árbol está en el almacén por contenido, el blob de ese nombre o de ese hash.
+    Sin sondear más carpetas; None si no está.
+    """
+    stored = stored_attachment_path(relpath, root)
+    if stored and os.path.exists(stored):
+        return stored
+    store = get_attachment_store(root)
+    if store is None:
+        return None
+    return (store.resolve(relpath) if relpath else None) or store.find_hash(content_hash)
+
+
+def stored_attachment_path(relpath, root):
+    """Ruta absoluta de un attachment_relpath guardado (sin comprobar que exista)."""
+    if not relpath:
+        return None
+    native = relpath.replace('/', os.sep)
+    if os.path.isabs(native) or not root:
+        return native
+    return os.path.join(root, native)
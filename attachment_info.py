@@ -0,0 +1,184 @@
+"""
+Índice de metadatos de los anexos: páginas, tamaño, cifrado y errores de lectura.
+
+El organizador de anexos solo mostraba número de factura y archivo; los PDF
+dañados o con contraseña y el total de páginas se descubrían al exportar, cuando
+generate_professional_pdf intentaba unirlos. Aquí cada anexo se revisa una vez:
+
+- PDF: PdfReader(strict=False), como al exportar. Se guarda la cantidad de
+  páginas, si está cifrado (pypdf abre solo los de contraseña vacía) y, si no se
+  pudo leer, el error. También el tamaño de la primera página en puntos.
+- Imagen: solo el encabezado con PIL (ancho y alto, sin decodificar los píxeles).
+  Cada imagen ocupa una página del reporte.
+- Otro tipo: se marca como no soportado (la exportación lo omite).
+
+Los resultados se guardan en attachment_info.json, en la caché local de la raíz
+(page_cache.cache_dir_for), por hash de contenido (el de la caché de páginas, que no vuelve a leer un archivo
+sin cambios): un anexo movido o copiado no se revisa otra vez.
+
+    index = get_attachment_info_index(root)
+    info = index.info(path)          # AttachmentInfo
+    info.ok, info.pages, info.error
+    index.save()
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import namedtuple
+
+from PIL import Image
+from pypdf import PdfReader
+
+from page_cache import cache_dir_for, get_page_cache
+from report_generator import IMAGE_EXTENSIONS
+
+INFO_FILE = 'attachment_info.json'
+# Cambia si cambia lo que se guarda por anexo (descarta lo anterior)
+INFO_VERSION = 1
+# Entradas que se conservan (las usadas más recientemente)
+MAX_ENTRIES = 20000
+_ERROR_MAX_CHARS = 200
+
+
+class AttachmentInfo(namedtuple('AttachmentInfo', ('kind', 'pages', 'size', 'encrypted', 'error',
+                                                   'width', 'height'))):
+    """
+    Metadatos de un anexo. kind: 'pdf', 'image' u 'other'. pages: páginas que aporta
+    al reporte (0 si no se puede leer). width/height: píxeles de la imagen o puntos
+    de la primera página del PDF. error: texto del error de lectura o None.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """True si la exportación lo puede anexar."""
+        return self.error is None and self.kind != 'other'
+
+    def status(self):
+        """Texto corto para las vistas."""
+        if self.kind == 'other':
+            return "No soportado"
+        if self.error is not None:
+            return "Con contraseña" if self.encrypted else "Dañado"
+        return "Cifrado (se puede leer)" if self.encrypted else "OK"
+
+
+def _error_text(error):
+    text = f"{type(error).__name__}: {error}"
+    return text[:_ERROR_MAX_CHARS]
+
+
+def probe_attachment(path):
+    """Lee los metadatos de 'path' (sin caché). No lanza errores de lectura: los deja en .error."""
+    size = os.path.getsize(path)
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == '.pdf':
+        encrypted = False
+        try:
+            reader = PdfReader(path, strict=False)
+            encrypted = bool(reader.is_encrypted)
+            # Los cifrados con contraseña vacía se abren solos; con contraseña, falla aquí
+            pages = len(reader.pages)
+            width = height = None
+            if pages:
+                box = reader.pages[0].mediabox
+                width, height = int(round(float(box.width))), int(round(float(box.height)))
+            return AttachmentInfo('pdf', pages, size, encrypted, None, width, height)
+        except Exception as e:
+            return AttachmentInfo('pdf', 0, size, encrypted, _error_text(e), None, None)
+    if ext in IMAGE_EXTENSIONS:
+        try:
+            with Image.open(path) as img:  # Solo lee el encabezado
+                width, height = img.size
+            return AttachmentInfo('image', 1, size, False, None, width, height)
+        except Exception as e:
+            return AttachmentInfo('image', 0, size, False, _error_text(e), None, None)
+    return AttachmentInfo('other', 0, size, False, None, None, None)
+
+
+class AttachmentInfoIndex:
+    """Metadatos por hash de contenido, guardados en 'directory'."""
+
+    def __init__(self, directory, hashes):
+        self.directory = directory
+        self.info_path = os.path.join(directory, INFO_FILE)
+        self._hashes = hashes
+        self._lock = threading.RLock()
+        self._entries = None  # hash -> [campos de AttachmentInfo..., último uso]
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.info_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get('version') == INFO_VERSION:
+                    self._entries = data.get('entries') or {}
+            except (OSError, ValueError):
+                pass
+        return self._entries
+
+    def info(self, path):
+        """AttachmentInfo de 'path': la guardada si el contenido no cambió o una nueva lectura."""
+        content_hash, _size = self._hashes.content_hash(path)
+        with self._lock:
+            entry = self._load().get(content_hash)
+            if isinstance(entry, list) and len(entry) == len(AttachmentInfo._fields) + 1:
+                entry[-1] = time.time()
+                self._dirty = True
+                return AttachmentInfo(*entry[:-1])
+        info = probe_attachment(path)
+        with self._lock:
+            self._load()[content_hash] = list(info) + [time.time()]
+            self._dirty = True
+        return info
+
+    def save(self):
+        """Guarda el índice (y el de hashes de la caché de páginas) si hubo cambios."""
+        self._hashes.prune()
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            entries = self._entries
+            if len(entries) > MAX_ENTRIES:
+                recent = sorted(entries.items(), key=lambda item: item[1][-1], reverse=True)[:MAX_ENTRIES]
+                entries = self._entries = dict(recent)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix='.attachment-info-', suffix='.tmp', dir=self.directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': INFO_VERSION, 'entries': entries}, f)
+                os.replace(tmp_path, self.info_path)
+                self._dirty = False
+            except OSError as e:
+                print(f"No se pudo guardar el índice de metadatos de anexos: {e}")
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_attachment_info_index(attachment_root=None):
+    """Instancia compartida para esa raíz de adjuntos."""
+    directory = os.path.abspath(cache_dir_for(attachment_root))
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = AttachmentInfoIndex(directory, get_page_cache(attachment_root))
+        return index
+
+
+def summarize(infos):
+    """(páginas que se anexarán, bytes, cantidad con problemas) de una lista de AttachmentInfo/None."""
+    pages = size = problems = 0
+    for info in infos:
+        if info is None or not info.ok:
+            problems += 1
+            continue
+        pages += info.pages
+        size += info.size
+    return pages, size, problems
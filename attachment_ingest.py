@@ -0,0 +1,245 @@
+"""
+Ingreso de anexos: normaliza las fotos antes de guardarlas en la carpeta de adjuntos.
+
+Las fotos de teléfono (4-12 MB, orientadas por EXIF) se copiaban tal cual a la
+carpeta de Dropbox, y cada exportación las volvía a decodificar y reducir. Aquí
+se hace una sola vez, al adjuntarlas:
+
+- se orientan según EXIF y se aplanan a RGB sobre blanco;
+- el lado mayor se limita a lo que ocupa un A4 a 'attachment_ingest_dpi' (config.json);
+- se recomprimen como JPEG con 'attachment_ingest_quality';
+- se escriben de forma atómica (archivo temporal + os.replace);
+- el original se conserva en '<raíz>/.originales/' solo si
+  'attachment_keep_original' es verdadero.
+
+Un JPEG ya derecho y dentro del tamaño se copia sin recomprimir. Las imágenes de
+varias páginas o cuadros (TIFF multipágina, GIF/WebP animados) también se copian
+tal cual y con su extensión: un JPEG solo guardaría la primera. Los PDF y otros
+archivos se copian tal cual (también de forma atómica). El resultado cae en el
+camino rápido de report_generator._prepare_image (se incrusta sin decodificar).
+
+Si el árbol de adjuntos usa el almacén por contenido (attachment_store), el
+archivo se guarda como blob y el nombre de destino se registra en el manifiesto:
+un comprobante repetido no ocupa espacio otra vez.
+
+    policy = get_ingest_policy()
+    dest = folder / ("factura_123" + stored_extension(source))
+    result = ingest_attachment(source, dest, root, policy)   # en un hilo secundario
+"""
+import io
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from PIL import Image, ImageOps
+
+from settings_service import get_settings
+from attachment_store import get_attachment_store, normalize_name
+
+# Extensiones que se normalizan (se guardan como .jpg)
+INGEST_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tiff', '.tif')
+STORED_IMAGE_EXTENSION = '.jpg'
+ORIGINALS_DIRNAME = '.originales'
+
+DEFAULT_DPI = 200
+DEFAULT_QUALITY = 85
+# Lado mayor de un A4 en pulgadas (297 mm)
+A4_LONG_SIDE_IN = 297 / 25.4
+
+_EXIF_ORIENTATION = 0x0112
+
+
+class IngestPolicy(namedtuple('IngestPolicy', ('dpi', 'quality', 'keep_original'))):
+    """Parámetros de normalización de imágenes anexas."""
+
+    __slots__ = ()
+
+    @property
+    def max_px(self):
+        """Lado mayor permitido en píxeles (un A4 a la resolución de la política)."""
+        return int(round(A4_LONG_SIDE_IN * self.dpi))
+
+
+def get_ingest_policy():
+    """Política configurada en config.json (con valores por defecto si falta o es inválida)."""
+    settings = get_settings()
+    try:
+        dpi = min(max(int(settings.get('attachment_ingest_dpi', DEFAULT_DPI)), 72), 600)
+    except (TypeError, ValueError):
+        dpi = DEFAULT_DPI
+    try:
+        quality = min(max(int(settings.get('attachment_ingest_quality', DEFAULT_QUALITY)), 30), 95)
+    except (TypeError, ValueError):
+        quality = DEFAULT_QUALITY
+    return IngestPolicy(dpi, quality, bool(settings.get('attachment_keep_original', False)))
+
+
+# Resultado de ingest_attachment: ruta final, bytes del origen y guardados, si se recomprimió,
+# dónde quedó el original y, con el almacén por contenido, el nombre registrado y el hash
+IngestResult = namedtuple('IngestResult', ('path', 'source_bytes', 'stored_bytes', 'normalized', 'original_path',
+                                           'name', 'content_hash', 'deduplicated'),
+                          defaults=(None, None, False))
+
+
+def is_ingest_image(path):
+    return os.path.splitext(str(path))[1].lower() in INGEST_IMAGE_EXTENSIONS
+
+
+def is_multi_frame(img):
+    """True si la imagen tiene varias páginas o cuadros (TIFF multipágina, GIF/WebP animado)."""
+    return getattr(img, 'n_frames', 1) > 1
+
+
+def _multi_frame_file(path):
+    try:
+        with Image.open(path) as img:
+            return is_multi_frame(img)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+
+
+def stored_extension(source_path):
+    """
+    Extensión con la que se guarda el archivo: .jpg para imágenes de un solo cuadro
+    y la original para el resto (lee solo el encabezado de las imágenes).
+    """
+    ext = os.path.splitext(str(source_path))[1].lower()
+    if ext in INGEST_IMAGE_EXTENSIONS and not _multi_frame_file(source_path):
+        return STORED_IMAGE_EXTENSION
+    return ext
+
+
+# --- Imágenes ---
+
+def needs_normalizing(img, max_px):
+    """False si la imagen ya es un JPEG RGB/gris derecho y dentro de max_px (se usa tal cual)."""
+    orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+    return not (img.format == 'JPEG' and img.mode in ('RGB', 'L') and orientation == 1
+                and max(img.size) <= max_px)
+
+
+def fitted_size(size, max_px):
+    """Tamaño (ancho, alto) con el lado mayor reducido a max_px (sin agrandar)."""
+    width, height = size
+    scale = min(1.0, max_px / float(max(width, height, 1)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalized_image(img, max_px):
+    """Copia de 'img' orientada según EXIF, en RGB sobre blanco y con el lado mayor <= max_px."""
+    # JPEG: decodifica ya reducido. draft() solo reduce si ambos lados siguen cubriendo
+    # la caja pedida, así que se pide el tamaño final y no un cuadrado de max_px
+    img.draft('RGB', fitted_size(img.size, max_px))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        img = Image.new('RGB', rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel('A'))
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+    return img
+
+
+def normalize_image_bytes(path, policy):
+    """JPEG normalizado de la imagen como bytes, o None si ya cumple la política o tiene varios cuadros."""
+    with Image.open(path) as img:
+        if is_multi_frame(img) or not needs_normalizing(img, policy.max_px):
+            return None
+        img = normalized_image(img, policy.max_px)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=policy.quality, optimize=True)
+        return buffer.getvalue()
+
+
+# --- Escritura atómica ---
+
+def _atomic_write(dest_path, data=None, source_path=None):
+    """Escribe 'data' (o copia 'source_path') en dest_path mediante un temporal en la misma carpeta."""
+    directory = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.ingest-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if data is not None:
+                f.write(data)
+            else:
+                with open(source_path, 'rb') as src:
+                    shutil.copyfileobj(src, f, 1024 * 1024)
+        if source_path is not None:
+            shutil.copystat(source_path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)  # mkstemp crea el archivo solo para el dueño
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def original_path_for(dest_path, source_path, root=None):
+    """Dónde se conserva el original: '<raíz>/.originales/<misma subcarpeta>/<nombre><ext. original>'."""
+    dest_path = os.path.abspath(dest_path)
+    stem = os.path.splitext(os.path.basename(dest_path))[0]
+    name = stem + os.path.splitext(str(source_path))[1].lower()
+    folder = os.path.dirname(dest_path)
+    if root:
+        root = os.path.abspath(root)
+        try:
+            relative = os.path.relpath(folder, root)
+        except ValueError:
+            relative = os.pardir
+        if not relative.startswith(os.pardir):
+            return os.path.join(root, ORIGINALS_DIRNAME, relative, name)
+    return os.path.join(folder, ORIGINALS_DIRNAME, name)
+
+
+def ingest_attachment(source_path, dest_path, root=None, policy=None):
+    """
+    Guarda 'source_path' en 'dest_path' (cuya extensión debe venir de stored_extension).
+    Las imágenes se normalizan según la política; si la imagen no se puede leer,
+    se copia tal cual con la extensión de origen. Con el almacén por contenido activo en 'root', dest_path
+    solo da el nombre (si ya apunta a otro contenido, se le agrega fecha y hora).
+    Pensado para un hilo secundario: no toca la interfaz. Retorna un IngestResult.
+    """
+    policy = policy or get_ingest_policy()
+    source_path, dest_path = str(source_path), str(dest_path)
+    source_bytes = os.path.getsize(source_path)
+    data = None
+    if is_ingest_image(source_path):
+        try:
+            data = normalize_image_bytes(source_path, policy)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"[WARN] No se pudo normalizar la imagen {source_path}: {e}")
+            # Copia tal cual con su propia extensión: los bytes no son un JPEG
+            dest_path = os.path.splitext(dest_path)[0] + os.path.splitext(source_path)[1].lower()
+        else:
+            if data is None:
+                # Copia tal cual: una imagen de varios cuadros conserva su extensión
+                dest_path = os.path.splitext(dest_path)[0] + stored_extension(source_path)
+
+    store = get_attachment_store(root) if root else None
+    if store is not None:
+        name = normalize_name(os.path.relpath(os.path.abspath(dest_path), store.root))
+        if data is None:
+            blob = store.put_file(source_path, name)
+        else:
+            blob = store.put_bytes(data, name)
+        dest_path = os.path.join(store.root, blob.name.replace('/', os.sep))
+    elif data is None:
+        _atomic_write(dest_path, source_path=source_path)
+    else:
+        _atomic_write(dest_path, data=data)
+
+    original = None
+    if data is not None and policy.keep_original:
+        original = original_path_for(dest_path, source_path, root)
+        _atomic_write(original, source_path=source_path)
+    stored_bytes = source_bytes if data is None else len(data)
+    if store is not None:
+        return IngestResult(blob.path, source_bytes, stored_bytes, data is not None, original,
+                            blob.name, blob.content_hash, blob.deduplicated)
+    return IngestResult(dest_path, source_bytes, stored_bytes, data is not None, original)
@@ -0,0 +1,484 @@
+"""
+Almacén de anexos por contenido (sin copias repetidas).
+
+La carpeta de adjuntos acumulaba el mismo comprobante varias veces con nombres
+distintos (p. ej. 'E3100..._131417442.jpg' y 'E3100..._131417442_20251013_132804.jpg').
+Cada copia se subía a Dropbox y tenía su propia entrada en la caché de páginas.
+Aquí cada contenido se guarda una sola vez:
+
+- '<raíz>/.blobs_anexos/ab/<sha256><ext>': un archivo por contenido (blob); el
+  nombre es el hash, así que la identidad del anexo no cambia al renombrarlo.
+- '<raíz>/.blobs_anexos/manifest.json': nombre de factura (ruta relativa con '/',
+  p. ej. 'Empresa/2025/10/E310000023990_131417442.jpg') -> blob.
+
+El almacén se activa cuando existe el manifiesto: 'db_maintenance.py
+dedupe-attachments --apply' lo crea al migrar el árbol existente. Como el
+manifiesto vive dentro de la raíz, viaja con Dropbox y todos los equipos ven el
+mismo modo. Mientras no exista, los anexos se siguen guardando con su nombre.
+
+    store = get_attachment_store(root)          # None si el árbol no está migrado
+    blob = store.put_file(source, "Empresa/2025/10/factura.jpg")
+    path = store.resolve("Empresa/2025/10/factura.jpg")
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+STORE_DIRNAME = '.blobs_anexos'
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+_HASH_CHUNK = 1024 * 1024
+# Durante la migración el manifiesto se guarda cada tantos archivos copiados
+_SAVE_EVERY = 200
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]{1,8})?$')
+
+# Resultado de put_*: ruta del blob, hash, tamaño, nombre registrado y si el contenido ya existía
+StoredBlob = namedtuple('StoredBlob', ('path', 'content_hash', 'size', 'name', 'deduplicated'))
+
+
+def hash_file(path):
+    """SHA-256 (hex) del contenido de un archivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_name(name):
+    """Nombre de manifiesto: ruta relativa con '/' y sin './' ni barras sobrantes."""
+    return os.path.normpath(str(name).strip().replace('\\', '/')).replace(os.sep, '/').strip('/')
+
+
+def blob_hash(path):
+    """Hash del contenido si 'path' es un blob del almacén (sin leer el archivo); si no, None."""
+    if not path:
+        return None
+    parent = os.path.dirname(os.path.abspath(str(path)))
+    if os.path.basename(os.path.dirname(parent)) != STORE_DIRNAME:
+        return None
+    match = _BLOB_NAME.match(os.path.basename(str(path)))
+    return match.group(1) if match else None
+
+
+def store_dir_for(root):
+    return os.path.join(os.path.abspath(root), STORE_DIRNAME)
+
+
+def _copy_atomic(source_path, dest_path, data=None):
+    """Copia (o escribe 'data') en dest_path mediante un temporal en la misma carpeta."""
+    directory = os.path.dirname(dest_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.blob-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if data is not None:
+                f.write(data)
+            else:
+                with open(source_path, 'rb') as src:
+                    shutil.copyfileobj(src, f, _HASH_CHUNK)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class AttachmentStore:
+    """Blobs por contenido bajo 'root' y el manifiesto nombre -> blob."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.directory = store_dir_for(self.root)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        self._lock = threading.RLock()
+        self._names = None        # nombre -> nombre del blob ('<hash><ext>')
+        self._by_lower = {}       # nombre en minúsculas -> nombre
+        self._by_base = {}        # último componente en minúsculas -> [nombres]
+        self._signature = None
+
+    # --- Manifiesto ---
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        """Lee el manifiesto si cambió en disco (otro equipo lo actualizó por Dropbox)."""
+        signature = self._file_signature()
+        if self._names is not None and signature == self._signature:
+            return
+        names = {}
+        if signature is not None:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION:
+                    names = {k: v for k, v in (data.get('names') or {}).items() if _BLOB_NAME.match(str(v))}
+            except (OSError, ValueError):
+                names = {}
+        self._set_names(names)
+        self._signature = signature
+
+    def _set_names(self, names):
+        by_lower, by_base = {}, {}
+        for name in names:
+            lower = name.lower()
+            by_lower.setdefault(lower, name)
+            by_base.setdefault(lower.rsplit('/', 1)[-1], []).append(name)
+        self._names, self._by_lower, self._by_base = names, by_lower, by_base
+
+    def save(self):
+        """Guarda el manifiesto de forma atómica."""
+        with self._lock:
+            if self._names is None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', suffix='.tmp', dir=self.directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': MANIFEST_VERSION, 'names': self._names}, f,
+                              ensure_ascii=False, indent=0, sort_keys=True)
+                os.replace(tmp_path, self.manifest_path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._signature = self._file_signature()
+
+    def names(self):
+        """Copia del manifiesto {nombre: nombre del blob}."""
+        with self._lock:
+            self._load()
+            return dict(self._names)
+
+    def names_for(self, content_hash):
+        with self._lock:
+            self._load()
+            return sorted(n for n, blob in self._names.items() if blob.startswith(content_hash))
+
+    def name_hash(self, name):
+        """Hash registrado para ese nombre (o None)."""
+        with self._lock:
+            self._load()
+            blob = self._names.get(normalize_name(name))
+            return blob[:64] if blob else None
+
+    # --- Blobs ---
+
+    def blob_path(self, blob_name):
+        return os.path.join(self.directory, blob_name[:2], blob_name)
+
+    def find_hash(self, content_hash):
+        """Ruta del blob con ese contenido (cualquier extensión), o None."""
+        if not content_hash or not _BLOB_NAME.match(content_hash):
+            return None
+        folder = os.path.join(self.directory, content_hash[:2])
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.name.startswith(content_hash):
+                        return entry.path
+        except OSError:
+            pass
+        return None
+
+    def resolve(self, name):
+        """
+        Blob de un nombre del manifiesto: exacto, sin distinguir mayúsculas o, si no,
+        por el último componente (se prefiere el que termina igual). None si no está.
+        """
+        if not name:
+            return None
+        normalized = normalize_name(name)
+        if os.path.isabs(str(name)):
+            try:
+                relative = os.path.relpath(os.path.abspath(str(name)), self.root)
+            except ValueError:
+                relative = None
+            if relative and not relative.startswith(os.pardir):
+                normalized = normalize_name(relative)
+        with self._lock:
+            self._load()
+            blob = self._names.get(normalized)
+            if blob is None:
+                actual = self._by_lower.get(normalized.lower())
+                if actual is None:
+                    suffix = '/' + normalized.lower()
+                    candidates = self._by_base.get(normalized.lower().rsplit('/', 1)[-1], ())
+                    ranked = sorted(candidates, key=lambda n: (not ('/' + n.lower()).endswith(suffix), n.count('/'), n))
+                    actual = ranked[0] if ranked else None
+                blob = self._names.get(actual) if actual else None
+        if blob is None:
+            return None
+        path = self.blob_path(blob)
+        return path if os.path.exists(path) else None
+
+    def _free_name(self, name, content_hash):
+        """'name' si está libre o ya apunta a este contenido; si no, con sufijo de fecha y hora."""
+        current = self._names.get(name)
+        if current is None or current.startswith(content_hash):
+            return name
+        stem, ext = os.path.splitext(name)
+        candidate = f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+        counter = 2
+        while candidate in self._names and not self._names[candidate].startswith(content_hash):
+            candidate = f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{counter}{ext}"
+            counter += 1
+        return candidate
+
+    def _register(self, content_hash, ext, name, write, save=True):
+        blob_name = content_hash + ext.lower()
+        with self._lock:
+            self._load()
+            existing = self.find_hash(content_hash)
+            if existing is None:
+                existing = self.blob_path(blob_name)
+                write(existing)
+            else:
+                blob_name = os.path.basename(existing)
+            final_name = None
+            if name:
+                final_name = self._free_name(normalize_name(name), content_hash)
+                self._names[final_name] = blob_name
+                self._set_names(self._names)
+                if save:
+                    self.save()
+            return existing, blob_name, final_name
+
+    def link(self, name, blob_name, save=True):
+        """Apunta 'name' al blob indicado, aunque antes apuntara a otro contenido."""
+        with self._lock:
+            self._load()
+            self._names[normalize_name(name)] = blob_name
+            self._set_names(self._names)
+            if save:
+                self.save()
+
+    def unlink(self, name):
+        """
+        Quita 'name' del manifiesto y borra su blob si ningún otro nombre lo usa.
+        Retorna True si el nombre existía.
+        """
+        with self._lock:
+            self._load()
+            normalized = normalize_name(name)
+            actual = normalized if normalized in self._names else self._by_lower.get(normalized.lower())
+            if actual is None:
+                return False
+            blob_name = self._names.pop(actual)
+            self._set_names(self._names)
+            self.save()
+            if blob_name not in self._names.values():
+                try:
+                    os.remove(self.blob_path(blob_name))
+                except OSError:
+                    pass
+            return True
+
+    def put_file(self, source_path, name=None, move=False, save=True, ext=None, content_hash=None):
+        """
+        Guarda el contenido de 'source_path' (si no estaba ya) y registra 'name'.
+        Si el nombre ya apunta a otro contenido se le agrega la fecha y hora.
+        move=True mueve el archivo (o lo borra si el contenido ya existía).
+        'ext' (extensión del blob) sale de 'name' o del archivo si no se indica.
+        """
+        content_hash = content_hash or hash_file(source_path)
+        size = os.path.getsize(source_path)
+        if ext is None:
+            ext = os.path.splitext(str(name or source_path))[1]
+        written = []
+
+        def write(dest):
+            if move:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(source_path, dest)
+            else:
+                _copy_atomic(source_path, dest)
+            written.append(dest)
+
+        path, _blob, final_name = self._register(content_hash, ext, name, write, save)
+        if move and not written:
+            os.remove(source_path)
+        return StoredBlob(path, content_hash, size, final_name, not written)
+
+    def put_bytes(self, data, name, ext=None, save=True):
+        """Como put_file, para contenido ya en memoria (p. ej. una imagen normalizada)."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        written = []
+
+        def write(dest):
+            _copy_atomic(None, dest, data=data)
+            written.append(dest)
+
+        path, _blob, final_name = self._register(
+            content_hash, ext if ext is not None else os.path.splitext(str(name))[1], name, write, save)
+        return StoredBlob(path, content_hash, len(data), final_name, not written)
+
+    def replace_content(self, old_hash, source_path):
+        """
+        Guarda el contenido editado de un blob y apunta a él todos los nombres que
+        usaban el anterior (eran el mismo comprobante). Retorna el StoredBlob nuevo.
+        """
+        with self._lock:
+            self._load()
+            names = [n for n, blob in self._names.items() if blob.startswith(old_hash)]
+            old_path = self.find_hash(old_hash)
+            ext = os.path.splitext(old_path)[1] if old_path else None
+            stored = self.put_file(source_path, None, save=False, ext=ext)
+            new_blob = os.path.basename(stored.path)
+            for name in names:
+                self._names[name] = new_blob
+            self._set_names(self._names)
+            self.save()
+            if old_path and stored.content_hash != old_hash:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+            return stored._replace(name=names[0] if names else None)
+
+    def unreferenced_blobs(self):
+        """Blobs que ningún nombre del manifiesto usa."""
+        with self._lock:
+            self._load()
+            used = set(self._names.values())
+        orphans = []
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            if dirpath == self.directory:
+                continue
+            orphans.extend(os.path.join(dirpath, n) for n in filenames if _BLOB_NAME.match(n) and n not in used)
+        return orphans
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_attachment_store(root, create=False):
+    """
+    Almacén compartido de esa raíz, o None si el árbol no está migrado (no hay
+    manifiesto) y create=False.
+    """
+    if not root or not os.path.isdir(root):
+        return None
+    key = os.path.normcase(os.path.abspath(root))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = AttachmentStore(root)
+    if not create and not store.exists():
+        return None
+    return store
+
+
+# --- Migración del árbol existente ---
+
+DedupeReport = namedtuple('DedupeReport', ('files', 'unique', 'duplicates', 'bytes_total', 'bytes_saved', 'groups'))
+
+
+def _tree_files(root):
+    """Archivos bajo 'root' sin entrar en carpetas ocultas (caché, almacén, originales)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for name in sorted(filenames):
+            if not name.startswith('.'):
+                yield os.path.join(dirpath, name)
+
+
+def dedupe_tree(root, apply=False, progress_callback=None):
+    """
+    Recorre el árbol de adjuntos y agrupa los archivos por contenido. Sin apply
+    solo informa. Con apply=True, en este orden:
+
+    1. copia cada contenido una sola vez al almacén y registra todos los nombres,
+       guardando el manifiesto cada _SAVE_EVERY archivos;
+    2. guarda el manifiesto;
+    3. solo entonces borra los originales (cuyo nombre ya resuelve a su blob) y
+       las carpetas que quedan vacías.
+
+    Si se interrumpe, ningún anexo queda sin ubicar: los originales siguen en su
+    lugar hasta estar registrados. Volver a ejecutarlo retoma lo pendiente (los
+    blobs ya copiados se reutilizan). Retorna un DedupeReport (groups: hash -> [nombres]).
+    """
+    root = os.path.abspath(root)
+    files = list(_tree_files(root))
+    groups, sizes = {}, {}
+    for done, path in enumerate(files):
+        if progress_callback:
+            progress_callback(done, len(files), "Calculando hash de los anexos...")
+        try:
+            content_hash = hash_file(path)
+            sizes[content_hash] = os.path.getsize(path)
+        except OSError as e:
+            print(f"[WARN] No se pudo leer {path}: {e}")
+            continue
+        groups.setdefault(content_hash, []).append(path)
+
+    bytes_total = sum(sizes[h] * len(paths) for h, paths in groups.items())
+    bytes_saved = sum(sizes[h] * (len(paths) - 1) for h, paths in groups.items())
+    report = DedupeReport(
+        files=sum(len(p) for p in groups.values()), unique=len(groups),
+        duplicates=sum(len(p) - 1 for p in groups.values()), bytes_total=bytes_total, bytes_saved=bytes_saved,
+        groups={h: [normalize_name(os.path.relpath(p, root)) for p in paths] for h, paths in groups.items()},
+    )
+    if not apply:
+        return report
+
+    store = get_attachment_store(root, create=True)
+    copied = []
+    try:
+        for content_hash, paths in groups.items():
+            for path in paths:
+                if progress_callback:
+                    progress_callback(len(copied), report.files, "Copiando anexos al almacén...")
+                name = normalize_name(os.path.relpath(path, root))
+                # El archivo en disco manda: su nombre apunta a su contenido actual
+                stored = store.put_file(path, None, save=False, ext=os.path.splitext(path)[1],
+                                        content_hash=content_hash)
+                store.link(name, os.path.basename(stored.path), save=False)
+                copied.append((path, name))
+                if len(copied) % _SAVE_EVERY == 0:
+                    store.save()
+    finally:
+        # También si se interrumpe: lo copiado queda registrado
+        store.save()
+
+    for done, (path, name) in enumerate(copied):
+        if progress_callback:
+            progress_callback(done, len(copied), "Borrando los originales...")
+        if store.resolve(name) is None:
+            print(f"[WARN] {name} no quedó en el almacén; se conserva el original")
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[WARN] No se pudo borrar {path}: {e}")
+
+    # Carpetas que quedaron vacías (de la más profunda a la raíz, sin borrar la raíz)
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath == root or os.path.basename(dirpath).startswith('.') or f"{os.sep}." in dirpath[len(root):]:
+            continue
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+    return report
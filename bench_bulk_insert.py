@@ -0,0 +1,99 @@
+"""
+Benchmark de ingesta de facturas: add_invoice (un commit por factura más el
+commit del tercero) frente a add_invoices_bulk (una sola transacción).
+
+Cada medición usa una base nueva en un directorio temporal; no toca la base real.
+
+Uso:
+    python bench_bulk_insert.py [--sizes 1000 10000 100000] [--baseline-max 10000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+from logic_qt import LogicControllerQt
+
+
+def synthetic_invoices(count, seed=7, duplicate_ratio=0.01):
+    """Genera facturas sintéticas; una pequeña fracción se repite para ejercitar los duplicados."""
+    rnd = random.Random(seed)
+    base = datetime.date(2022, 1, 1)
+    generated = []
+    for k in range(count):
+        if generated and rnd.random() < duplicate_ratio:
+            generated.append(dict(rnd.choice(generated)))
+            continue
+        day = base + datetime.timedelta(days=rnd.randrange(3 * 365))
+        total = round(rnd.uniform(100, 50000), 2)
+        rnc = f"{rnd.randrange(1000):09d}"
+        generated.append({
+            "company_id": 1,
+            "invoice_type": rnd.choice(("emitida", "gasto")),
+            "invoice_date": day.isoformat(),
+            "invoice_number": f"B{k:010d}",
+            "rnc": rnc,
+            "third_party_name": f"Tercero {rnc}",
+            "currency": "RD$",
+            "itbis": round(total * 0.18 / 1.18, 2),
+            "total_amount": total,
+            "exchange_rate": 1.0,
+            "total_amount_rd": total,
+        })
+    return generated
+
+
+def _new_controller(tmp, name):
+    controller = LogicControllerQt(os.path.join(tmp, name))
+    controller.conn.execute("INSERT INTO companies (id, name) VALUES (1, 'Empresa Benchmark')")
+    controller.conn.commit()
+    return controller
+
+
+def bench_single(tmp, invoices):
+    controller = _new_controller(tmp, f"single_{len(invoices)}.db")
+    started = time.perf_counter()
+    for invoice in invoices:
+        controller.add_invoice(invoice)
+    elapsed = time.perf_counter() - started
+    controller.close_connection()
+    return elapsed
+
+
+def bench_bulk(tmp, invoices):
+    controller = _new_controller(tmp, f"bulk_{len(invoices)}.db")
+    started = time.perf_counter()
+    results = controller.add_invoices_bulk(invoices)
+    elapsed = time.perf_counter() - started
+    controller.close_connection()
+    inserted = sum(1 for r in results if r["status"] == "inserted")
+    duplicates = sum(1 for r in results if r["status"] == "duplicate")
+    return elapsed, inserted, duplicates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--baseline-max", type=int, default=10000,
+                        help="tamaño máximo para medir add_invoice fila por fila (es lento)")
+    args = parser.parse_args(argv)
+
+    print(f"{'filas':>8} | {'add_invoice':>16} | {'add_invoices_bulk':>18} | {'insertadas':>10} | {'duplicadas':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            invoices = synthetic_invoices(size)
+            if size <= args.baseline_max:
+                single = f"{size / bench_single(tmp, invoices):10.0f} filas/s"
+            else:
+                single = "(omitido)"
+            elapsed, inserted, duplicates = bench_bulk(tmp, invoices)
+            bulk = f"{size / elapsed:10.0f} filas/s"
+            print(f"{size:>8} | {single:>16} | {bulk:>18} | {inserted:>10} | {duplicates:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
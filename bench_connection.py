@@ -0,0 +1,184 @@
+"""
+Benchmark de la conexión SQLite: configuración original (journal por defecto,
+una conexión compartida) frente a ConnectionManager (WAL, PRAGMA ajustados y
+lectores de solo lectura por hilo).
+
+Genera una base sintética (200k facturas por defecto) en un directorio temporal;
+no toca la base de datos real.
+
+Uso:
+    python bench_connection.py [--invoices 200000] [--companies 5] [--writes 2000] [--seconds 5]
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import threading
+
+from db_connection import ConnectionManager
+from logic_qt import LogicControllerQt
+
+
+def build_database(path, invoices, companies, seed=1):
+    """Crea el esquema de la aplicación y lo llena con facturas sintéticas."""
+    controller = LogicControllerQt(path)
+    controller.close_connection()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executemany("INSERT INTO companies (id, name, rnc) VALUES (?, ?, ?)",
+                     [(i + 1, f"Empresa {i + 1}", f"1{i:08d}") for i in range(companies)])
+    rnd = random.Random(seed)
+    base = datetime.date(2019, 1, 1)
+
+    def rows():
+        for k in range(invoices):
+            day = base + datetime.timedelta(days=rnd.randrange(6 * 365))
+            total = round(rnd.uniform(100, 50000), 2)
+            currency, rate = ("USD", 58.5) if rnd.random() < 0.15 else ("RD$", 1.0)
+            yield (1 + k % companies, rnd.choice(("emitida", "gasto")), day.isoformat(), day.isoformat(),
+                   f"B{k:010d}", f"{rnd.randrange(10**8, 10**9)}", f"Tercero {rnd.randrange(2000)}",
+                   currency, round(total * 0.18 / 1.18, 2), total, rate, round(total * rate, 2))
+
+    conn.executemany("""
+        INSERT INTO invoices (company_id, invoice_type, invoice_date, imputation_date, invoice_number,
+                              rnc, third_party_name, currency, itbis, total_amount, exchange_rate, total_amount_rd)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+REPORT_SQL = """
+    SELECT invoice_type, SUM(total_amount_rd), SUM(itbis * exchange_rate), COUNT(*)
+    FROM invoices WHERE company_id = ? AND invoice_date >= ? AND invoice_date < ?
+    GROUP BY invoice_type
+"""
+
+
+def _month_ranges():
+    for year in range(2019, 2025):
+        for month in range(1, 13):
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year + (month == 12), month % 12 + 1, 1)
+            yield start.isoformat(), end.isoformat()
+
+
+def run_reports(conn, companies, seconds, stop=None):
+    """Ejecuta reportes mensuales durante 'seconds'; retorna la cantidad ejecutada."""
+    ranges = list(_month_ranges())
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline and not (stop and stop.is_set()):
+        start, end = ranges[done % len(ranges)]
+        conn.execute(REPORT_SQL, (1 + done % companies, start, end)).fetchall()
+        done += 1
+    return done
+
+
+def run_writes(conn, writes, companies, offset):
+    """Inserta facturas una por una con commit individual (como add_invoice)."""
+    latencies = []
+    for k in range(writes):
+        started = time.perf_counter()
+        conn.execute("""
+            INSERT INTO invoices (company_id, invoice_type, invoice_date, invoice_number, rnc,
+                                  third_party_name, currency, itbis, total_amount, exchange_rate, total_amount_rd)
+            VALUES (?, 'gasto', '2024-06-15', ?, '999999999', 'Bench', 'RD$', 18.0, 118.0, 1.0, 118.0)""",
+                     (1 + k % companies, f"W{offset}-{k:08d}"))
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies
+
+
+def bench(label, make_writer, make_reader, companies, writes, seconds):
+    print(f"\n=== {label} ===")
+    writer = make_writer()
+
+    # 1) Escrituras aisladas
+    started = time.perf_counter()
+    run_writes(writer, writes, companies, "solo")
+    elapsed = time.perf_counter() - started
+    print(f"escrituras (commit por fila): {writes / elapsed:10.1f} filas/s")
+
+    # 2) Lecturas aisladas
+    reader = make_reader()
+    done = run_reports(reader, companies, seconds)
+    print(f"reportes mensuales:           {done / seconds:10.1f} consultas/s")
+
+    # 3) Lectores en otro hilo mientras el hilo principal escribe
+    stop = threading.Event()
+    result = {}
+    error = []
+
+    def _background():
+        try:
+            conn = make_reader()
+            result["done"] = run_reports(conn, companies, seconds, stop)
+        except sqlite3.Error as e:
+            error.append(e)
+
+    thread = threading.Thread(target=_background)
+    started = time.perf_counter()
+    thread.start()
+    latencies = []
+    try:
+        latencies = run_writes(writer, writes, companies, "mix")
+    except sqlite3.Error as e:
+        error.append(e)
+    stop.set()
+    thread.join()
+    elapsed = time.perf_counter() - started
+
+    if error:
+        print(f"mixto: ERROR {error[0]}")
+    else:
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+        print(f"mixto: escrituras             {writes / elapsed:10.1f} filas/s (p95 {p95:.2f} ms)")
+        print(f"mixto: reportes en paralelo   {result.get('done', 0) / elapsed:10.1f} consultas/s")
+    writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=200000)
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        print(f"Generando base sintética con {args.invoices} facturas...")
+        started = time.perf_counter()
+        build_database(template, args.invoices, args.companies)
+        print(f"Listo en {time.perf_counter() - started:.1f}s")
+
+        # Antes: journal por defecto, sin PRAGMA, conexión estándar
+        before = os.path.join(tmp, "before.db")
+        shutil.copy(template, before)
+        bench("Antes (journal por defecto)",
+              lambda: sqlite3.connect(before),
+              lambda: sqlite3.connect(before, timeout=5),
+              args.companies, args.writes, args.seconds)
+
+        # Después: ConnectionManager
+        after = os.path.join(tmp, "after.db")
+        shutil.copy(template, after)
+        manager = ConnectionManager(after)
+        bench("Después (WAL + PRAGMA + lectores por hilo)",
+              manager.open,
+              manager.reader,
+              args.companies, args.writes, args.seconds)
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Benchmark de tablas grandes en PDF: una llamada a cell() por celda (como dibujaba
+antes generate_professional_pdf) frente a pdf_table.PdfTable.
+
+Se mide el dibujo más pdf.output() (en memoria), con las columnas del reporte mensual
+y nombres de terceros de largo variable. No escribe archivos salvo con --out.
+
+Uso:
+    python bench_pdf_tables.py [--sizes 10000 50000] [--baseline-max 10000] [--out carpeta]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import warnings
+
+from report_generator import PDF
+from pdf_table import PdfTable, TableColumn
+
+WIDTHS = [15, 15, 45, 12.5, 12.5]
+HEADERS = ['Fecha', 'No. Fact.', 'Empresa', 'ITBIS (RD$)', 'Total (RD$)']
+
+
+def synthetic_rows(count, seed=11):
+    """Filas (fecha, número, tercero, ITBIS, total); algunos nombres no caben en su columna."""
+    rnd = random.Random(seed)
+    base = datetime.date(2024, 1, 1)
+    words = ("Servicios", "Constructora", "Distribuidora", "Inversiones", "del", "Caribe", "Industrial",
+             "Comercial", "Dominicana", "Hermanos", "Importadora", "Ferretería", "Grupo", "Técnico")
+    rows = []
+    for k in range(count):
+        name = " ".join(rnd.choice(words) for _ in range(rnd.randrange(2, 12))) + " SRL"
+        total = round(rnd.uniform(100, 250000), 2)
+        rows.append(((base + datetime.timedelta(days=rnd.randrange(366))).isoformat(), f"B{k:010d}",
+                     name, round(total * 0.18 / 1.18, 2), total))
+    return rows
+
+
+def _new_pdf():
+    pdf = PDF(orientation='L', company_name="Empresa Benchmark", report_title="Reporte Anual",
+              report_period="2024")
+    pdf.add_page()
+    return pdf
+
+
+def render_cells(rows):
+    """Dibujo anterior: set_fill_color + cell() por celda y saltos de página automáticos."""
+    pdf = _new_pdf()
+    page_width = pdf.w - 2 * pdf.l_margin
+    widths = [w / 100.0 * page_width for w in WIDTHS]
+    pdf.set_font('Arial', 'B', 9)
+    pdf.set_fill_color(220, 220, 220)
+    for i, header in enumerate(HEADERS):
+        pdf.cell(widths[i], 8, header, 1, 0, 'C', 1)
+    pdf.ln()
+    pdf.set_font('Arial', '', 8)
+    fill = False
+    for date, number, name, itbis, total in rows:
+        pdf.set_fill_color(245, 245, 245) if fill else pdf.set_fill_color(255, 255, 255)
+        for i, datum in enumerate((date, number, name, f"{itbis:,.2f}", f"{total:,.2f}")):
+            pdf.cell(widths[i], 6, str(datum), 1, 0, 'L' if i < 3 else 'R', 1)
+        pdf.ln()
+        fill = not fill
+    return pdf
+
+
+def render_table(rows, overflow):
+    def amount(value):
+        return f"{value:,.2f}"
+
+    pdf = _new_pdf()
+    columns = [TableColumn(HEADERS[0], WIDTHS[0]), TableColumn(HEADERS[1], WIDTHS[1]),
+               TableColumn(HEADERS[2], WIDTHS[2]), TableColumn(HEADERS[3], WIDTHS[3], 'R', amount),
+               TableColumn(HEADERS[4], WIDTHS[4], 'R', amount)]
+    PdfTable(pdf, columns, overflow=overflow).render(rows)
+    return pdf
+
+
+def _measure(render, *args):
+    started = time.perf_counter()
+    pdf = render(*args)
+    data = bytes(pdf.output())
+    return time.perf_counter() - started, pdf.page_no(), data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--baseline-max", type=int, default=10000,
+                        help="tamaño máximo para medir el dibujo celda por celda (es lento)")
+    parser.add_argument("--out", help="guardar aquí los PDF generados para revisarlos")
+    args = parser.parse_args(argv)
+    # fpdf2 avisa en cada llamada que 'Arial' se sustituye por Helvetica
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    print(f"{'filas':>8} | {'cell() por celda':>22} | {'PdfTable recorte':>22} | {'PdfTable 2 renglones':>22}")
+    for size in args.sizes:
+        rows = synthetic_rows(size)
+        results = []
+        variants = [("celdas", render_cells, (rows,)), ("recorte", render_table, (rows, 'truncate')),
+                    ("renglones", render_table, (rows, 'wrap'))]
+        for name, render, render_args in variants:
+            if render is render_cells and size > args.baseline_max:
+                results.append("(omitido)")
+                continue
+            elapsed, pages, data = _measure(render, *render_args)
+            results.append(f"{elapsed:6.2f}s {pages:5d} págs")
+            if args.out:
+                os.makedirs(args.out, exist_ok=True)
+                with open(os.path.join(args.out, f"tabla_{size}_{name}.pdf"), "wb") as f:
+                    f.write(data)
+        print(f"{size:>8} | " + " | ".join(f"{r:>22}" for r in results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Verifica que las consultas por período del controlador usen los índices de
+'invoices' (búsquedas por rango) y no recorran la tabla completa.
+
+Uso:
+    python check_query_plans.py            # usa una base de datos temporal
+    python check_query_plans.py ruta.db    # analiza una base de datos existente
+
+Termina con código 1 si alguna consulta produce un 'SCAN invoices'.
+"""
+import os
+import sys
+import datetime
+import tempfile
+
+from logic_qt import LogicControllerQt
+
+
+def _capture_period_queries(controller, company_id):
+    """Ejecuta las consultas por período y devuelve el SQL (ya expandido) que generaron."""
+    statements = []
+
+    def _trace(sql):
+        if sql.lstrip().upper().startswith("SELECT") and "invoices" in sql:
+            statements.append(sql)
+
+    controller.conn.set_trace_callback(_trace)
+    try:
+        controller.get_dashboard_summary(company_id)
+        controller.get_dashboard_summary(company_id, filter_month=3, filter_year=2024)
+        controller.get_dashboard_summary(company_id, specific_date=datetime.date(2024, 3, 15))
+        controller.get_dashboard_transactions(company_id, filter_month=12, filter_year=2024)
+        controller.get_dashboard_transactions(company_id, specific_date=datetime.date(2024, 3, 15))
+        controller.get_transactions_page(company_id, after=("2024-06-30", 1000))
+        controller.get_transactions_page(company_id, filter_month=3, filter_year=2024, invoice_type="gasto",
+                                         after=("2024-03-20", 1000))
+        controller.get_unique_invoice_years(company_id)
+        controller.get_emitted_invoices_for_period(company_id, "2024-01-01", "2024-03-31")
+    finally:
+        controller.conn.set_trace_callback(None)
+
+    # Conservamos el orden pero sin repetir la misma sentencia
+    return list(dict.fromkeys(statements))
+
+
+def check_plans(controller, company_id):
+    """Devuelve una lista de (sql, plan, ok) para cada consulta capturada."""
+    results = []
+    cursor = controller.conn.cursor()
+    for sql in _capture_period_queries(controller, company_id):
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        plan = [row["detail"] for row in cursor.fetchall()]
+        ok = not any(step.startswith("SCAN invoices") for step in plan)
+        results.append((sql, plan, ok))
+    return results
+
+
+def main(argv):
+    temp_dir = None
+    if len(argv) > 1:
+        db_path = argv[1]
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "plan_check.db")
+
+    controller = LogicControllerQt(db_path)
+    if not controller.conn:
+        print("[ERROR] No se pudo abrir la base de datos.")
+        return 1
+
+    try:
+        if temp_dir:
+            controller.conn.execute("INSERT INTO companies (id, name) VALUES (1, 'Empresa de prueba')")
+            controller.conn.commit()
+            company_id = 1
+        else:
+            row = controller.conn.execute("SELECT id FROM companies ORDER BY id LIMIT 1").fetchone()
+            company_id = row["id"] if row else 1
+
+        # ANALYZE da al planificador estadísticas reales (como ocurre con una base en uso)
+        controller.conn.execute("ANALYZE")
+
+        failures = 0
+        for sql, plan, ok in check_plans(controller, company_id):
+            status = "OK   " if ok else "FALLA"
+            print(f"[{status}] {' '.join(sql.split())}")
+            for step in plan:
+                print(f"         {step}")
+            if not ok:
+                failures += 1
+
+        if failures:
+            print(f"\n{failures} consulta(s) recorren la tabla 'invoices' completa.")
+            return 1
+        print("\nTodas las consultas por período usan índices.")
+        return 0
+    finally:
+        controller.close_connection()
+        if temp_dir:
+            temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
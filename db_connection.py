@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+
+
+# Ajustes aplicados a cada conexión. journal_mode=WAL es persistente en el archivo,
+# el resto se aplica por conexión.
+DEFAULT_PRAGMAS = {
+    "synchronous": "NORMAL",        # con WAL es seguro y evita un fsync por commit
+    "cache_size": -64000,           # ~64 MB de caché de páginas (valor negativo = KiB)
+    "mmap_size": 268435456,         # 256 MB de lectura por memoria mapeada
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,           # ms de espera si otra conexión tiene el bloqueo
+}
+
+
+class ConnectionManager:
+    """
+    Administra las conexiones SQLite de la aplicación.
+
+    - Una conexión de escritura (la que usa el hilo principal), en modo WAL.
+    - Una conexión de solo lectura por hilo, creada bajo demanda. Con WAL, los
+      lectores no bloquean al escritor ni al revés, así que reportes y tareas en
+      segundo plano pueden leer mientras el usuario sigue guardando facturas.
+    """
+
+    def __init__(self, db_path, pragmas=None, wal=True, factory=sqlite3.Connection):
+        self.db_path = db_path
+        # Clase de conexión (p. ej. la de query_stats para medir cada sentencia)
+        self.factory = factory
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.wal = wal
+        self._local = threading.local()
+        self._readers = []
+        self._lock = threading.Lock()
+        self.writer = None
+        self.journal_mode = None
+
+    # ------------------------
+    # Apertura y cierre
+    # ------------------------
+    def open(self):
+        """Abre la conexión de escritura y aplica los PRAGMA. Retorna la conexión."""
+        conn = sqlite3.connect(self.db_path, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        if self.wal:
+            row = conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            self.journal_mode = row[0] if row else None
+            if self.journal_mode != "wal":
+                print(f"[WARN] No se pudo activar WAL (journal_mode={self.journal_mode}).")
+        self._apply_pragmas(conn)
+        self.writer = conn
+        return conn
+
+    def _apply_pragmas(self, conn):
+        for name, value in self.pragmas.items():
+            try:
+                conn.execute(f"PRAGMA {name}={value}")
+            except sqlite3.Error as e:
+                print(f"[WARN] PRAGMA {name} no aplicado: {e}")
+
+    def reader(self):
+        """
+        Devuelve la conexión de solo lectura del hilo actual (la crea si no existe).
+        Si la base no admite el modo de solo lectura (p. ej. ':memory:'), usa el escritor.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if self.db_path == ":memory:":
+            return self.writer
+        conn = sqlite3.connect(self._readonly_uri(), uri=True, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        self._apply_pragmas(conn)
+        conn.execute("PRAGMA query_only=ON")
+        self._local.conn = conn
+        with self._lock:
+            self._readers.append(conn)
+        return conn
+
+    def _readonly_uri(self):
+        path = str(self.db_path).replace("\\", "/").replace("?", "%3F").replace("#", "%23")
+        if not path.startswith("/"):
+            # Rutas de Windows ("C:/...") y relativas
+            path = "/" + path if len(path) > 1 and path[1] == ":" else path
+        return f"file:{path}?mode=ro"
+
+    def close_reader(self):
+        """Cierra la conexión de lectura del hilo actual (para hilos que terminan)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if conn in self._readers:
+                self._readers.remove(conn)
+        conn.close()
+
+    def close(self):
+        """Cierra todas las conexiones (lectores y escritor)."""
+        with self._lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        if self.writer is not None:
+            try:
+                # Traspasa el WAL al archivo principal antes de cerrar
+                if self.journal_mode == "wal":
+                    self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error:
+                pass
+            self.writer.close()
+            self.writer = None
+
+    # ------------------------
+    # Lecturas consistentes
+    # ------------------------
+    def snapshot(self):
+        """
+        Contexto que abre una transacción de lectura en el lector del hilo actual:
+        todas las consultas dentro del bloque ven la misma versión de la base.
+
+            with manager.snapshot() as conn:
+                ...
+        """
+        return _ReadSnapshot(self.reader())
+
+
+class _ReadSnapshot:
+    def __init__(self, conn):
+        self.conn = conn
+        self._owns = False
+
+    def __enter__(self):
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+            self._owns = True
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._owns:
+            self.conn.execute("COMMIT")
+        return False
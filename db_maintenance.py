@@ -0,0 +1,190 @@
+"""
+Tareas de mantenimiento de la base de datos, desde la línea de comandos.
+
+Uso:
+    python db_maintenance.py [--db ruta.db] rebuild-rollups
+    python db_maintenance.py [--db ruta.db] query-stats [--slow-ms 50] [--months 12] [--json salida.json]
+    python db_maintenance.py show-stats [query_stats.json]
+    python db_maintenance.py [--db ruta.db] backfill-attachments [--root carpeta]
+    python db_maintenance.py [--db ruta.db] relink-attachments [--root carpeta]
+    python db_maintenance.py [--db ruta.db] dedupe-attachments [--root carpeta] [--apply]
+
+Si no se indica --db se usa la base configurada en config.json ('facturas_config'),
+igual que main_qt.py.
+"""
+import os
+import sys
+import json
+import argparse
+
+from logic_qt import LogicControllerQt
+from settings_service import get_settings
+import query_stats
+import attachment_store
+
+
+def _default_db_path():
+    return get_settings().get("facturas_config", "database.db")
+
+
+def cmd_rebuild_rollups(controller, args):
+    """Recalcula monthly_totals y monthly_totals_imputation a partir de invoices."""
+    ok, message = controller.rebuild_monthly_totals()
+    print(message)
+    return 0 if ok else 1
+
+
+def _profile_workload(controller, months):
+    """Ejecuta las consultas de las pantallas principales para cada empresa."""
+    for company in controller.get_companies():
+        company_id = company["id"]
+        controller.get_dashboard_data(company_id)
+        years = controller.get_unique_invoice_years(company_id)
+        periods = [(int(year), month) for year in years for month in range(12, 0, -1)][:months]
+        for year, month in periods:
+            controller.get_dashboard_data(company_id, filter_month=month, filter_year=year)
+            controller.get_transactions_page(company_id, filter_month=month, filter_year=year)
+            controller.get_monthly_report_data(company_id, month, year)
+        if years:
+            year = years[0]
+            controller.get_emitted_invoices_for_period(company_id, f"{year}-01-01", f"{year}-12-31")
+        row = controller.conn.execute(
+            "SELECT rnc FROM invoices WHERE company_id = ? AND rnc IS NOT NULL LIMIT 1", (company_id,)).fetchone()
+        if row:
+            controller.get_report_by_third_party(company_id, row["rnc"])
+
+
+def cmd_query_stats(controller, args):
+    """Mide las consultas de las pantallas principales e imprime p50/p95 y los planes lentos."""
+    _profile_workload(controller, args.months)
+    snapshot = controller.stats.snapshot()
+    print(query_stats.format_snapshot(snapshot, limit=args.limit))
+    if args.json:
+        controller.stats.save(args.json)
+        print(f"Resumen guardado en {args.json}")
+    return 0
+
+
+def cmd_show_stats(args):
+    """Imprime un resumen guardado por la aplicación (query_stats.json)."""
+    try:
+        with open(args.path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] No se pudo leer {args.path}: {e}")
+        return 1
+    print(query_stats.format_snapshot(snapshot, limit=args.limit))
+    return 0
+
+
+def _print_progress(done, total, message):
+    print(f"\r{message} ({done}/{total})", end="", flush=True)
+
+
+def cmd_backfill_attachments(controller, args):
+    """Completa hash, tamaño y ruta relativa de los anexos que aún no los tienen."""
+    updated, missing = controller.backfill_attachment_metadata(args.root, progress_callback=_print_progress)
+    print(f"\nFacturas actualizadas: {updated}. Anexos no encontrados: {len(missing)}.")
+    if missing:
+        print("Ids sin archivo:", ", ".join(str(i) for i in missing[:50]) + (" ..." if len(missing) > 50 else ""))
+    return 0
+
+
+def cmd_relink_attachments(controller, args):
+    """Reubica por contenido (hash) los anexos cuya ruta guardada ya no existe."""
+    relinked, missing = controller.relink_moved_attachments(args.root, progress_callback=_print_progress)
+    print(f"\nAnexos reubicados: {len(relinked)}. Siguen sin encontrarse: {len(missing)}.")
+    for invoice_id, path in sorted(relinked.items()):
+        print(f"  factura {invoice_id} -> {path}")
+    return 0
+
+
+def cmd_dedupe_attachments(controller, args):
+    """
+    Pasa el árbol de adjuntos al almacén por contenido (attachment_store): cada
+    comprobante repetido queda una sola vez. Sin --apply solo muestra el ahorro.
+    Si se interrumpe, volver a ejecutarlo con --apply termina la migración.
+    """
+    root = args.root or controller.get_attachment_base_path()
+    if not root or not os.path.isdir(root):
+        print(f"[ERROR] No existe la carpeta de adjuntos: {root}")
+        return 1
+    if args.apply:
+        # Antes de mover nada, cada factura guarda el hash de su anexo (su identidad en el almacén)
+        updated, missing = controller.backfill_attachment_metadata(root, progress_callback=_print_progress)
+        print(f"\nMetadatos completados: {updated} facturas ({len(missing)} anexos no encontrados).")
+
+    report = attachment_store.dedupe_tree(root, apply=args.apply, progress_callback=_print_progress)
+    mb = 1024 * 1024
+    print(f"\nArchivos: {report.files}. Contenidos distintos: {report.unique}. "
+          f"Copias repetidas: {report.duplicates} ({report.bytes_saved / mb:.1f} MB de {report.bytes_total / mb:.1f} MB).")
+    repeated = sorted((names for names in report.groups.values() if len(names) > 1), key=len, reverse=True)
+    for names in repeated[:args.limit]:
+        print(f"  {len(names)} copias: " + ", ".join(names))
+    if args.apply:
+        print(f"Almacén: {attachment_store.store_dir_for(root)}")
+    elif report.duplicates:
+        print("Use --apply para mover los anexos al almacén y borrar las copias.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos de facturas.")
+    parser.add_argument("--db", help="ruta de la base de datos (por defecto la de config.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-rollups", help="reconstruye los totales mensuales (por fecha de factura y de imputación)")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("query-stats", help="mide las consultas principales (p50/p95, filas, planes lentos)")
+    p.add_argument("--slow-ms", type=float, default=query_stats.DEFAULT_SLOW_MS,
+                   help="umbral para registrar el EXPLAIN QUERY PLAN en el log lento")
+    p.add_argument("--months", type=int, default=12, help="meses a recorrer por empresa")
+    p.add_argument("--limit", type=int, default=30, help="filas a mostrar por tabla")
+    p.add_argument("--json", help="guardar además el resumen en este archivo")
+    p.set_defaults(func=cmd_query_stats, stats=True)
+
+    p = sub.add_parser("show-stats", help="muestra un resumen guardado por la aplicación")
+    p.add_argument("path", nargs="?", default=query_stats.STATS_FILE)
+    p.add_argument("--limit", type=int, default=30, help="filas a mostrar por tabla")
+    p.set_defaults(func=cmd_show_stats, offline=True)
+
+    p = sub.add_parser("backfill-attachments", help="guarda hash/tamaño/ruta de los anexos existentes")
+    p.add_argument("--root", help="raíz de adjuntos (por defecto la configurada)")
+    p.set_defaults(func=cmd_backfill_attachments)
+
+    p = sub.add_parser("relink-attachments", help="reubica por contenido los anexos movidos o renombrados")
+    p.add_argument("--root", help="raíz de adjuntos (por defecto la configurada)")
+    p.set_defaults(func=cmd_relink_attachments)
+
+    p = sub.add_parser("dedupe-attachments", help="guarda cada anexo una sola vez (almacén por contenido)")
+    p.add_argument("--root", help="raíz de adjuntos (por defecto la configurada)")
+    p.add_argument("--apply", action="store_true", help="mover los archivos (sin esto solo informa)")
+    p.add_argument("--limit", type=int, default=20, help="grupos de copias a listar")
+    p.set_defaults(func=cmd_dedupe_attachments)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "offline", False):
+        return args.func(args)
+    db_path = args.db or _default_db_path()
+    if not os.path.exists(db_path):
+        print(f"[ERROR] No existe la base de datos: {db_path}")
+        return 1
+
+    stats = None
+    if getattr(args, "stats", False):
+        stats = query_stats.QueryStats(slow_ms=args.slow_ms)
+    controller = LogicControllerQt(db_path, stats=stats)
+    if not controller.conn:
+        return 1
+    try:
+        return args.func(controller, args)
+    finally:
+        controller.close_connection()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTabWidget,
+    QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox, QFileDialog, QCheckBox
+)
+from PyQt6.QtGui import QColor
+from PyQt6.QtCore import Qt
+
+import query_stats
+
+
+class DiagnosticsWindowQt(QDialog):
+    """
+    Muestra las métricas de query_stats: llamadas, p50/p95 y filas por método
+    del controlador y por sentencia SQL. Las sentencias cuyo plan recorre una
+    tabla completa se resaltan (el plan se ve en el tooltip).
+    """
+    COLUMNS = ["Nombre", "Llamadas", "p50 (ms)", "p95 (ms)", "Máx (ms)", "Total (ms)", "Filas prom.", "Errores"]
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.parent = parent
+        self.controller = controller
+        self.stats = getattr(controller, "stats", None)
+        self.setWindowTitle("Diagnóstico de Consultas")
+        self.resize(1000, 600)
+        self._build_ui()
+        self._refresh()
+
+    def _build_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.info_label = QLabel()
+        self.info_label.setWordWrap(True)
+        layout.addWidget(self.info_label)
+
+        self.tabs = QTabWidget()
+        self.methods_table = self._make_table()
+        self.sql_table = self._make_table()
+        self.tabs.addTab(self.methods_table, "Métodos")
+        self.tabs.addTab(self.sql_table, "Sentencias SQL")
+        layout.addWidget(self.tabs)
+
+        # Activar/desactivar para el próximo inicio (la conexión se crea al arrancar)
+        self.enable_check = QCheckBox("Activar la instrumentación al iniciar la aplicación")
+        self.enable_check.setChecked(bool(self.controller.get_setting("diagnostics_enabled", False)))
+        self.enable_check.toggled.connect(self._toggle_enabled)
+        layout.addWidget(self.enable_check)
+
+        btn_row = QHBoxLayout()
+        self.btn_refresh = QPushButton("Actualizar")
+        self.btn_refresh.clicked.connect(self._refresh)
+        btn_row.addWidget(self.btn_refresh)
+        self.btn_reset = QPushButton("Reiniciar Contadores")
+        self.btn_reset.clicked.connect(self._reset)
+        btn_row.addWidget(self.btn_reset)
+        self.btn_save = QPushButton("Guardar JSON...")
+        self.btn_save.clicked.connect(self._save)
+        btn_row.addWidget(self.btn_save)
+        btn_row.addStretch()
+        btn_close = QPushButton("Cerrar")
+        btn_close.clicked.connect(self.accept)
+        btn_row.addWidget(btn_close)
+        layout.addLayout(btn_row)
+
+        for btn in (self.btn_refresh, self.btn_reset, self.btn_save):
+            btn.setEnabled(self.stats is not None)
+
+    def _make_table(self):
+        table = QTableWidget(0, len(self.COLUMNS))
+        table.setHorizontalHeaderLabels(self.COLUMNS)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        table.setSortingEnabled(True)
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for col in range(1, len(self.COLUMNS)):
+            header.setSectionResizeMode(col, QHeaderView.ResizeMode.ResizeToContents)
+        return table
+
+    def _refresh(self):
+        if self.stats is None:
+            self.info_label.setText(
+                "La instrumentación está desactivada. Actívela abajo (o con la variable de entorno "
+                f"{query_stats.ENV_FLAG}=1) y reinicie la aplicación.")
+            return
+
+        snapshot = self.stats.snapshot()
+        scans = set(query_stats.full_scans(snapshot))
+        self.info_label.setText(
+            f"Desde {snapshot['started']}. Sentencias de más de {snapshot['slow_ms']:.0f} ms se registran "
+            f"con su plan en '{self.stats.log_path}'. Recorridos completos detectados: {len(scans)}.")
+        self._fill(self.methods_table, snapshot["methods"])
+        self._fill(self.sql_table, snapshot["statements"], scans)
+
+    def _fill(self, table, entries, scans=()):
+        table.setSortingEnabled(False)
+        table.setRowCount(0)
+        for name, info in sorted(entries.items(), key=lambda kv: kv[1]["total_ms"], reverse=True):
+            row = table.rowCount()
+            table.insertRow(row)
+            name_item = QTableWidgetItem(name)
+            plan = info.get("plan")
+            if plan:
+                name_item.setToolTip("\n".join(plan))
+            table.setItem(row, 0, name_item)
+            values = [info["count"], info["p50_ms"], info["p95_ms"], info["max_ms"], info["total_ms"],
+                      info["avg_rows"], info["errors"]]
+            for col, value in enumerate(values, start=1):
+                item = QTableWidgetItem()
+                # DisplayRole numérico para que el orden de la columna sea numérico
+                item.setData(Qt.ItemDataRole.DisplayRole, round(value, 2) if isinstance(value, float) else value)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                table.setItem(row, col, item)
+            if name in scans:
+                for col in range(table.columnCount()):
+                    table.item(row, col).setBackground(QColor("#FDE2E1"))
+        table.setSortingEnabled(True)
+
+    def _reset(self):
+        self.stats.reset()
+        self._refresh()
+
+    def _save(self):
+        fname, _ = QFileDialog.getSaveFileName(self, "Guardar estadísticas", query_stats.STATS_FILE,
+                                               "JSON (*.json)")
+        if not fname:
+            return
+        try:
+            self.stats.save(fname)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo guardar: {e}")
+
+    def _toggle_enabled(self, checked):
+        self.controller.set_setting("diagnostics_enabled", bool(checked))
+        if bool(checked) != (self.stats is not None):
+            QMessageBox.information(self, "Diagnóstico", "El cambio se aplicará al reiniciar la aplicación.")
@@ -0,0 +1,225 @@
+"""
+Exportación de facturas a Excel por flujo (openpyxl en modo write-only).
+
+Las filas se escriben a medida que llegan (de un cursor o de una lista), así que
+un reporte de varios años o de todas las empresas ocupa memoria constante:
+openpyxl guarda cada hoja en un archivo temporal y solo arma el .xlsx al final.
+
+- Las columnas (nombre, orden y tipo) son las mismas de la tabla del reporte en
+  pantalla (INVOICE_SHEET_COLUMNS). Los montos se escriben como números
+  con formato y las fechas como fechas reales de Excel, no como texto.
+- Una hoja se parte en 'Ingresos', 'Ingresos (2)', ... al llegar a
+  rows_per_sheet filas (Excel admite 1.048.576 por hoja).
+- La hoja Resumen va primero, pero sus totales se calculan mientras se
+  escriben las facturas.
+
+    with ExcelReportWriter(path) as xl:
+        xl.write_invoices('Ingresos', emitted)      # cualquier iterable de Invoice/dict
+        xl.write_invoices('Gastos', expenses)
+
+    export_report_excel(controller, path, company_id=None,       # todas las empresas
+                        start_date='2020-01-01', end_date='2024-12-31')
+"""
+import sqlite3
+import datetime
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from invoice_record import period_date
+
+# Límite de filas de datos por hoja (Excel: 1.048.576 filas incluyendo el encabezado)
+MAX_ROWS_PER_SHEET = 1_048_575
+
+NUMBER_FORMAT = '#,##0.00'
+RATE_FORMAT = '#,##0.0000'
+DATE_FORMAT = 'yyyy-mm-dd'
+
+
+def _to_date(value):
+    """'YYYY-MM-DD' (o date) a datetime.date; si no se puede, el texto tal cual."""
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return value or None
+
+
+def _to_float(value):
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _rate(inv):
+    return _to_float(inv.get('exchange_rate')) or 1.0
+
+
+def _itbis_rd(inv):
+    return _to_float(inv.get('itbis')) * _rate(inv)
+
+
+def _total_rd(inv):
+    return _to_float(inv.get('total_amount_rd')) or _to_float(inv.get('total_amount')) * _rate(inv)
+
+
+# (encabezado, tipo, valor): las columnas de la tabla del reporte en pantalla.
+# 'Monto Original' se separa en número + moneda para que siga siendo sumable.
+INVOICE_SHEET_COLUMNS = (
+    ('Fecha', 'date', lambda inv: inv.get('invoice_date')),
+    ('No. Fact.', 'text', lambda inv: inv.get('invoice_number')),
+    ('Empresa', 'text', lambda inv: inv.get('third_party_name')),
+    ('RNC', 'text', lambda inv: inv.get('rnc')),
+    ('Monto Original', 'number', lambda inv: inv.get('total_amount')),
+    ('Moneda', 'text', lambda inv: inv.get('currency') or 'RD$'),
+    ('Tasa', 'rate', _rate),
+    ('ITBIS RD$', 'number', _itbis_rd),
+    ('Total RD$', 'number', _total_rd),
+)
+
+SUMMARY_ROWS = (
+    ("Total Ingresos (RD$)", "total_ingresos"),
+    ("Total ITBIS Ingresos (RD$)", "itbis_ingresos"),
+    ("Total Gastos (RD$)", "total_gastos"),
+    ("Total ITBIS Gastos (RD$)", "itbis_gastos"),
+    ("ITBIS Neto (RD$)", "itbis_neto"),
+    ("Total Neto (RD$)", "total_neto"),
+)
+
+
+class ExcelReportWriter:
+    """Libro write-only con una hoja Resumen y hojas de facturas partidas por cantidad de filas."""
+
+    def __init__(self, path, rows_per_sheet=MAX_ROWS_PER_SHEET, columns=INVOICE_SHEET_COLUMNS,
+                 summary=True):
+        self.path = path
+        self.rows_per_sheet = max(1, min(int(rows_per_sheet), MAX_ROWS_PER_SHEET))
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self._bold = Font(bold=True)
+        self._summary_sheet = self.workbook.create_sheet('Resumen') if summary else None
+        self.totals = {key: 0.0 for _label, key in SUMMARY_ROWS}
+        self.row_counts = {}
+
+    # --- Celdas ---
+
+    def _header(self, sheet, labels):
+        cells = []
+        for label in labels:
+            cell = WriteOnlyCell(sheet, label)
+            cell.font = self._bold
+            cells.append(cell)
+        sheet.append(cells)
+
+    def _typed(self, sheet, kind, value):
+        if kind == 'text':
+            return '' if value is None else str(value)
+        if kind == 'date':
+            cell = WriteOnlyCell(sheet, _to_date(value))
+            cell.number_format = DATE_FORMAT
+            return cell
+        cell = WriteOnlyCell(sheet, _to_float(value))
+        cell.number_format = RATE_FORMAT if kind == 'rate' else NUMBER_FORMAT
+        return cell
+
+    def _new_sheet(self, title, part):
+        sheet = self.workbook.create_sheet(title if part == 1 else f"{title} ({part})")
+        self._header(sheet, [label for label, _kind, _get in self.columns])
+        return sheet
+
+    # --- Hojas ---
+
+    def write_invoices(self, title, invoices, progress_callback=None):
+        """
+        Escribe las facturas (iterable de Invoice o dict) en la hoja 'title', partiéndola
+        cada rows_per_sheet filas, y las suma al Resumen según su invoice_type
+        ('emitida' o 'gasto'). Retorna la cantidad de filas escritas.
+        """
+        part, in_sheet, written = 1, 0, 0
+        sheet = self._new_sheet(title, part)
+        columns = self.columns
+        totals = self.totals
+        for inv in invoices:
+            if in_sheet >= self.rows_per_sheet:
+                part += 1
+                in_sheet = 0
+                sheet = self._new_sheet(title, part)
+            sheet.append([self._typed(sheet, kind, get(inv)) for _label, kind, get in columns])
+            in_sheet += 1
+            written += 1
+
+            invoice_type = inv.get('invoice_type')
+            if invoice_type == 'emitida':
+                totals['total_ingresos'] += _total_rd(inv)
+                totals['itbis_ingresos'] += _itbis_rd(inv)
+            elif invoice_type == 'gasto':
+                totals['total_gastos'] += _total_rd(inv)
+                totals['itbis_gastos'] += _itbis_rd(inv)
+            if progress_callback and written % 5000 == 0:
+                progress_callback(written, 0, f"{title}: {written} filas")
+        self.row_counts[title] = written
+        return written
+
+    def write_summary(self, summary=None):
+        """Llena la hoja Resumen con 'summary' o, si no se pasa, con los totales acumulados."""
+        if self._summary_sheet is None:
+            return
+        if summary:
+            values = dict(summary)
+        else:
+            values = dict(self.totals)
+            values['itbis_neto'] = values['itbis_ingresos'] - values['itbis_gastos']
+            values['total_neto'] = values['total_ingresos'] - values['total_gastos']
+        sheet, self._summary_sheet = self._summary_sheet, None
+        self._header(sheet, ["Descripción", "Monto"])
+        for label, key in SUMMARY_ROWS:
+            sheet.append([label, self._typed(sheet, 'number', values.get(key, 0.0))])
+
+    def close(self, summary=None):
+        """Completa el Resumen (si no se escribió) y guarda el archivo."""
+        self.write_summary(summary)
+        self.workbook.save(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+
+def export_report_excel(controller, save_path, company_id=None, start_date=None, end_date=None,
+                        rows_per_sheet=MAX_ROWS_PER_SHEET, progress_callback=None, date_field='invoice_date'):
+    """
+    Exporta directamente desde la base (controller.iter_report_invoices) las hojas
+    Resumen, Ingresos y Gastos. Con company_id=None incluye todas las empresas y
+    agrega la columna 'Compañía'. Con date_field='imputation_date' el rango de fechas
+    es de imputación y se agrega la columna 'Fecha Imp.'. Retorna (bool, mensaje).
+    """
+    columns = INVOICE_SHEET_COLUMNS
+    if date_field == 'imputation_date':
+        columns = ((columns[0], ('Fecha Imp.', 'date', lambda inv: period_date(inv, 'imputation_date')))
+                   + columns[1:])
+    if company_id is None:
+        names = {c['id']: c['name'] for c in controller.get_companies() or []}
+        columns = (('Compañía', 'text', lambda inv: names.get(inv.get('company_id'), '')),) + columns
+    try:
+        writer = ExcelReportWriter(save_path, rows_per_sheet=rows_per_sheet, columns=columns)
+        for title, invoice_type in (('Ingresos', 'emitida'), ('Gastos', 'gasto')):
+            writer.write_invoices(
+                title,
+                controller.iter_report_invoices(company_id, invoice_type, start_date, end_date,
+                                                date_field=date_field),
+                progress_callback=progress_callback)
+        writer.close()
+    except sqlite3.Error as e:
+        return False, f"Error de base de datos al exportar: {e}"
+    except OSError as e:
+        return False, f"No se pudo guardar el Excel: {e}"
+    counts = writer.row_counts
+    return True, (f"Reporte Excel generado exitosamente "
+                  f"({counts.get('Ingresos', 0)} ingresos, {counts.get('Gastos', 0)} gastos).")
@@ -0,0 +1,150 @@
+"""
+Registro compacto de factura (Invoice) que viaja sin copias desde SQLite hasta
+las ventanas y report_generator.
+
+- Invoice usa __slots__ (sin __dict__ por instancia) y se comporta como un
+  diccionario de solo las columnas leídas: inv['total_amount_rd'],
+  inv.get('attachment_path'), dict(inv), 'rnc' in inv.
+- Cada vista pide solo las columnas que muestra (proyecciones *_COLUMNS);
+  select_list() arma la lista del SELECT ya normalizada (nulos a ''/0.0 y tasa
+  0 -> 1.0), así nadie más tiene que rellenar ni convertir filas.
+- invoice_row_factory(columns) se asigna como row_factory del cursor y crea los
+  Invoice directamente, sin pasar por sqlite3.Row ni dict.
+"""
+from collections.abc import Mapping
+
+# Columnas de la tabla invoices, en el orden del esquema (las de anexo se agregan por migración)
+INVOICE_FIELDS = (
+    'id', 'company_id', 'invoice_type', 'invoice_date', 'imputation_date', 'invoice_number',
+    'invoice_category', 'rnc', 'third_party_name', 'currency', 'itbis', 'total_amount',
+    'exchange_rate', 'total_amount_rd', 'attachment_path', 'client_name', 'client_rnc',
+    'excel_path', 'pdf_path', 'due_date', 'attachment_hash', 'attachment_size', 'attachment_relpath',
+)
+
+# --- Proyecciones por vista ---
+
+# Tabla de transacciones del dashboard
+TRANSACTION_COLUMNS = (
+    'id', 'invoice_date', 'invoice_type', 'invoice_number', 'third_party_name',
+    'currency', 'itbis', 'exchange_rate', 'total_amount', 'total_amount_rd',
+)
+
+# Tabla paginada del dashboard: además, el anexo para la columna de miniaturas
+DASHBOARD_COLUMNS = TRANSACTION_COLUMNS + ('attachment_path', 'attachment_relpath', 'attachment_hash')
+
+# Reporte mensual (ventana, PDF con anexos y Excel)
+REPORT_COLUMNS = TRANSACTION_COLUMNS + ('company_id', 'rnc', 'imputation_date', 'attachment_path', 'attachment_relpath',
+                                         'attachment_hash')
+
+# Reporte por cliente/proveedor
+THIRD_PARTY_COLUMNS = TRANSACTION_COLUMNS + ('rnc',)
+
+# Calculadoras de retención
+RETENTION_COLUMNS = TRANSACTION_COLUMNS + ('rnc',)
+
+_TEXT_DEFAULTS = ('invoice_date', 'invoice_type', 'invoice_number', 'third_party_name', 'currency')
+_NUMBER_DEFAULTS = ('itbis', 'total_amount', 'total_amount_rd')
+
+
+def select_list(columns, table=None):
+    """
+    Lista de columnas para el SELECT con la misma normalización que antes hacía
+    _normalize_transaction_row: textos nulos a '', montos nulos a 0.0 y una tasa
+    nula o en 0 se lee como 1.0.
+    """
+    prefix = f"{table}." if table else ""
+    parts = []
+    for column in columns:
+        ref = prefix + column
+        if column in _TEXT_DEFAULTS:
+            parts.append(f"COALESCE({ref}, '') AS {column}")
+        elif column in _NUMBER_DEFAULTS:
+            parts.append(f"COALESCE({ref}, 0.0) AS {column}")
+        elif column == 'exchange_rate':
+            parts.append(f"(CASE WHEN COALESCE({ref}, 0) = 0 THEN 1.0 ELSE {ref} END) AS {column}")
+        else:
+            parts.append(ref)
+    return ", ".join(parts)
+
+
+class Invoice(Mapping):
+    """Factura de solo las columnas leídas; acceso tipo dict sin copiar la fila."""
+
+    __slots__ = INVOICE_FIELDS
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in _SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in _SLOTS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        if key in _SLOTS:
+            return getattr(self, key, default)
+        return default
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in _SLOTS and hasattr(self, key)
+
+    def __repr__(self):
+        return f"Invoice({', '.join(f'{k}={getattr(self, k)!r}' for k in self)})"
+
+    def __reduce__(self):
+        # Los slots no se serializan solos; se reconstruye con sus valores
+        return (_rebuild_invoice, (dict(self),))
+
+
+_SLOTS = frozenset(Invoice.__slots__)
+
+
+def _rebuild_invoice(values):
+    return Invoice(**values)
+
+
+def invoice_row_factory(columns):
+    """
+    row_factory para un cursor cuya consulta selecciona exactamente 'columns'
+    (en ese orden). Crea cada Invoice asignando los slots directamente.
+    """
+    unknown = [c for c in columns if c not in _SLOTS]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas para Invoice: {unknown}")
+    setters = tuple(getattr(Invoice, column).__set__ for column in columns)
+    new = Invoice.__new__
+
+    def factory(cursor, row):
+        invoice = new(Invoice)
+        for setter, value in zip(setters, row):
+            setter(invoice, value)
+        return invoice
+
+    return factory
+
+
+def period_date(invoice, date_field='invoice_date'):
+    """
+    Fecha que ubica la factura en un período: la de la factura o, con
+    date_field='imputation_date', la de imputación (si falta, la de la factura).
+    """
+    if date_field == 'imputation_date':
+        return invoice.get('imputation_date') or invoice.get('invoice_date', '')
+    return invoice.get('invoice_date', '')
@@ -0,0 +1,185 @@
+"""
+Ejecución de tareas en segundo plano (QThreadPool) para llamadas al controlador
+y a report_generator, sin congelar la ventana.
+
+Uso típico desde una ventana:
+
+    job = self.jobs.submit(self.controller.get_dashboard_summary, company_id,
+                           key="dashboard", on_finished=self._on_summary_ready)
+
+- Cada envío retorna un Job con un concurrent.futures.Future (job.future) y
+  señales Qt (finished/failed/cancelled/progress) entregadas en el hilo de la GUI.
+  Los manejadores se pasan a submit (on_finished, on_failed, on_cancelled,
+  on_progress) para conectarlos ANTES de que la tarea arranque: una tarea rápida
+  puede terminar antes de que el código que llamó a submit alcance a conectarse.
+- Si se envía una tarea con la misma 'key' que otra aún pendiente, la anterior
+  se cancela y su resultado se descarta (p. ej. al cambiar de empresa mientras
+  se refresca el dashboard).
+- Si la función acepta el argumento 'job', recibe el Job para reportar progreso
+  (job.report_progress) y consultar job.is_cancelled(). report_progress lanza
+  JobCancelled cuando la tarea fue cancelada, lo que la detiene en el acto.
+
+Importante: en hilos secundarios el controlador solo debe usarse para lecturas
+(usa una conexión de solo lectura por hilo); las escrituras siguen en el hilo principal.
+"""
+import inspect
+import threading
+import traceback
+from concurrent.futures import Future, CancelledError
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class JobCancelled(BaseException):
+    """
+    Se lanza dentro de una tarea cancelada. Hereda de BaseException (como
+    asyncio.CancelledError) para atravesar los 'except Exception' del código llamado.
+    """
+
+
+class JobSignals(QObject):
+    finished = pyqtSignal(object)          # resultado
+    failed = pyqtSignal(str)               # mensaje de error
+    cancelled = pyqtSignal()
+    progress = pyqtSignal(int, int, str)   # (hecho, total, mensaje)
+
+
+class Job:
+    """Tarea enviada al ejecutor: futuro, señales y bandera de cancelación."""
+
+    def __init__(self, fn, args, kwargs, key=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.future = Future()
+        self.signals = JobSignals()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Marca la tarea como cancelada. Si aún no empezó, no llegará a ejecutarse."""
+        self._cancel_event.set()
+        self.future.cancel()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report_progress(self, done, total, message=""):
+        """Emite progreso; lanza JobCancelled si la tarea fue cancelada."""
+        if self.is_cancelled():
+            raise JobCancelled()
+        self.signals.progress.emit(int(done), int(total), str(message))
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class _JobRunnable(QRunnable):
+    def __init__(self, job, on_done):
+        super().__init__()
+        self.job = job
+        self._on_done = on_done
+        self.setAutoDelete(True)
+
+    def run(self):
+        job = self.job
+        try:
+            if not job.future.set_running_or_notify_cancel():
+                job.signals.cancelled.emit()
+                return
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except JobCancelled:
+                job.future.set_exception(CancelledError())
+                job.signals.cancelled.emit()
+                return
+            except Exception as e:
+                traceback.print_exc()
+                job.future.set_exception(e)
+                if not job.is_cancelled():
+                    job.signals.failed.emit(str(e))
+                return
+
+            job.future.set_result(result)
+            # Un resultado que llega después de cancelar ya no interesa a nadie
+            if job.is_cancelled():
+                job.signals.cancelled.emit()
+            else:
+                job.signals.finished.emit(result)
+        finally:
+            self._on_done(job)
+
+
+class JobExecutor(QObject):
+    """Pool de hilos para tareas de la GUI, con cancelación de tareas obsoletas por clave."""
+
+    def __init__(self, parent=None, max_threads=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._pending = set()
+
+    def submit(self, fn, *args, key=None, on_finished=None, on_failed=None, on_cancelled=None,
+               on_progress=None, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) en el pool y retorna el Job.
+        Si fn tiene un parámetro 'job', se le pasa el propio Job.
+        """
+        job = Job(fn, args, kwargs, key=key)
+        if _accepts_job(fn):
+            job.kwargs = dict(kwargs, job=job)
+        for signal, handler in ((job.signals.finished, on_finished), (job.signals.failed, on_failed),
+                                (job.signals.cancelled, on_cancelled), (job.signals.progress, on_progress)):
+            if handler is not None:
+                signal.connect(handler)
+
+        with self._lock:
+            if key is not None:
+                previous = self._active.get(key)
+                if previous is not None:
+                    previous.cancel()
+                self._active[key] = job
+            self._pending.add(job)
+
+        self.pool.start(_JobRunnable(job, self._job_done))
+        return job
+
+    def _job_done(self, job):
+        with self._lock:
+            self._pending.discard(job)
+            if job.key is not None and self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def cancel(self, key):
+        """Cancela la tarea activa con la clave indicada (si existe)."""
+        with self._lock:
+            job = self._active.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        """Cancela todas las tareas pendientes o en ejecución."""
+        with self._lock:
+            jobs = list(self._pending)
+            self._active.clear()
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait_ms=-1):
+        """Cancela lo pendiente y espera a que terminen las tareas en curso."""
+        self.cancel_all()
+        self.pool.clear()
+        return self.pool.waitForDone(wait_ms)
+
+
+def _accepts_job(fn):
+    try:
+        return "job" in inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
@@ -3,33 +3,140 @@ import sqlite3
 import os
 import json
 import datetime
+import threading
+import contextlib
+from collections import OrderedDict
 from tkinter import simpledialog
 # En el archivo: logic.py (al inicio)
-from utils import find_dropbox_folder
+from settings_service import get_settings
+from db_connection import ConnectionManager
+import query_stats
+from attachment_index import (resolve_attachment, get_attachment_index, attachment_metadata,
+                              locate_attachment, normalize_relpath, hash_file)
+from invoice_record import (TRANSACTION_COLUMNS, DASHBOARD_COLUMNS, REPORT_COLUMNS, THIRD_PARTY_COLUMNS,
+                            RETENTION_COLUMNS, select_list, invoice_row_factory)
+
+# Tasa de cambio normalizada en SQL: una tasa nula o en 0 se interpreta como 1.0
+_RATE_SQL = "(CASE WHEN COALESCE(exchange_rate, 0) = 0 THEN 1.0 ELSE exchange_rate END)"
+
+
+# Fecha de cada base de período: la de la factura o la de imputación (si falta, la de la
+# factura, como en gestion_facturas.generar_reporte_por_imputacion). El SQL debe coincidir
+# exactamente con el del índice idx_invoices_company_imputation para que SQLite lo use.
+_IMPUTATION_SQL = "COALESCE(NULLIF({p}imputation_date, ''), {p}invoice_date)"
+PERIOD_DATE_FIELDS = ('invoice_date', 'imputation_date')
+
+# Tabla de totales mensuales de cada base de período (mantenidas por triggers)
+_ROLLUP_TABLES = {'invoice_date': 'monthly_totals', 'imputation_date': 'monthly_totals_imputation'}
+
+
+def _period_date_sql(date_field, row=None):
+    """Expresión SQL de la fecha que define el período ('invoice_date' o 'imputation_date')."""
+    prefix = f"{row}." if row else ""
+    if date_field == 'imputation_date':
+        return _IMPUTATION_SQL.format(p=prefix)
+    return f"{prefix}invoice_date"
+
+
+def _rollup_values(row, date_field='invoice_date'):
+    """Expresiones SQL (año, mes, total RD$, ITBIS RD$) de una fila de invoices ('NEW', 'OLD' o la tabla)."""
+    date_sql = _period_date_sql(date_field, row)
+    return {
+        "year": f"substr({date_sql}, 1, 4)",
+        "month": f"substr({date_sql}, 6, 2)",
+        "total_rd": f"COALESCE({row}.total_amount_rd, 0.0)",
+        "itbis_rd": f"COALESCE({row}.itbis, 0.0) * (CASE WHEN COALESCE({row}.exchange_rate, 0) = 0 THEN 1.0 ELSE {row}.exchange_rate END)",
+    }
+
+
+def _rollup_add_sql(row, date_field='invoice_date'):
+    v = _rollup_values(row, date_field)
+    table = _ROLLUP_TABLES[date_field]
+    return f"""
+        INSERT INTO {table} (company_id, year, month, invoice_type, count, total_rd, itbis_rd)
+        VALUES ({row}.company_id, {v['year']}, {v['month']}, {row}.invoice_type, 1, {v['total_rd']}, {v['itbis_rd']})
+        ON CONFLICT (company_id, year, month, invoice_type) DO UPDATE SET
+            count = count + 1,
+            total_rd = total_rd + excluded.total_rd,
+            itbis_rd = itbis_rd + excluded.itbis_rd;"""
+
+
+def _rollup_remove_sql(row, date_field='invoice_date'):
+    v = _rollup_values(row, date_field)
+    table = _ROLLUP_TABLES[date_field]
+    key = (f"company_id = {row}.company_id AND year = {v['year']} AND month = {v['month']} "
+           f"AND invoice_type = {row}.invoice_type")
+    return f"""
+        UPDATE {table} SET
+            count = count - 1,
+            total_rd = total_rd - {v['total_rd']},
+            itbis_rd = itbis_rd - {v['itbis_rd']}
+        WHERE {key};
+        DELETE FROM {table} WHERE {key} AND count <= 0;"""
 
 class LogicControllerQt:
     """
     Maneja toda la lógica de negocio y la interacción con la base de datos.
     """
-    def __init__(self, db_path):
+    # Columnas con la ubicación verificada del anexo (ver attachment_index.attachment_metadata)
+    ATTACHMENT_META_COLUMNS = ('attachment_hash', 'attachment_size', 'attachment_relpath')
+    # Conjuntos de datos de reportes que se guardan en memoria (los usados más recientemente)
+    REPORT_CACHE_SIZE = 8
+
+    def __init__(self, db_path, stats=None):
         """
         Inicializa el controlador y establece la conexión con la base de datos.
+        'stats' (query_stats.QueryStats) activa la instrumentación; si no se pasa,
+        se activa según config.json / FACTURAS_QUERY_STATS.
         """
         self.db_path = db_path
+        self.settings = get_settings()
+        if stats is None and query_stats.is_enabled(self.settings):
+            stats = query_stats.QueryStats.from_settings(self.settings)
+        self.stats = stats
         self.conn = None
+        self.db = None
+        self._writer_thread = None
+        # (company_id, año, mes, tipo de reporte, versión de datos) -> datos del reporte
+        self._report_cache = OrderedDict()
+        self._report_cache_lock = threading.Lock()
         self._connect()
         self._initialize_db()
+        if self.stats is not None:
+            self.stats.instrument(self)
 
     def _connect(self):
         """Establece la conexión a la base de datos SQLite."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
+            # WAL + PRAGMA ajustados; los lectores de otros hilos usan conexiones propias
+            factory = self.stats.connection_factory() if self.stats else sqlite3.Connection
+            self.db = ConnectionManager(self.db_path, factory=factory)
+            self.conn = self.db.open()
+            self._writer_thread = threading.get_ident()
             print("Conexión a la base de datos establecida exitosamente.")
         except sqlite3.Error as e:
             print(f"Error al conectar con la base de datos: {e}")
             self.conn = None
 
+    def _reader(self):
+        """
+        Conexión para consultas de solo lectura.
+        En el hilo principal es la misma conexión de escritura (ve sus propios cambios);
+        en cualquier otro hilo es una conexión de solo lectura propia de ese hilo.
+        """
+        if self.db is None or threading.get_ident() == self._writer_thread:
+            return self.conn
+        return self.db.reader()
+
+    def _read_snapshot(self):
+        """
+        Contexto para que varias consultas de un hilo secundario lean la misma
+        versión de la base aunque el hilo principal siga guardando.
+        """
+        if self.db is None or threading.get_ident() == self._writer_thread:
+            return contextlib.nullcontext(self.conn)
+        return self.db.snapshot()
+
 
 # En el archivo: logic.py
 
@@ -50,7 +157,8 @@ class LogicControllerQt:
             cursor.execute("PRAGMA table_info(companies);")
             company_columns = [info['name'] for info in cursor.fetchall()]
             
-            if 'rnc' not in company_columns:
+            # En una base de datos nueva la tabla aún no existe: no hay nada que migrar
+            if company_columns and 'rnc' not in company_columns:
                 print("Ejecutando migración avanzada para añadir la columna 'rnc'...")
                 cursor.execute('BEGIN TRANSACTION;')
                 cursor.execute('''CREATE TABLE companies_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, rnc TEXT UNIQUE, address TEXT, legacy_filename TEXT, itbis_adelantado REAL DEFAULT 0.0);''')
@@ -62,7 +170,7 @@ class LogicControllerQt:
                 cursor.execute("PRAGMA table_info(companies);")
                 company_columns = [info['name'] for info in cursor.fetchall()]
 
-            if 'address' not in company_columns:
+            if company_columns and 'address' not in company_columns:
                 print("Ejecutando migración: Añadiendo 'address' a la tabla 'companies'...")
                 cursor.execute("ALTER TABLE companies ADD COLUMN address TEXT;")
                 self.conn.commit()
@@ -70,12 +178,22 @@ class LogicControllerQt:
 
             cursor.execute("PRAGMA table_info(invoices);")
             invoice_columns = [info['name'] for info in cursor.fetchall()]
-            if 'attachment_path' not in invoice_columns:
+            if invoice_columns and 'attachment_path' not in invoice_columns:
                 print("Ejecutando migración: Añadiendo 'attachment_path' a 'invoices'...")
                 cursor.execute("ALTER TABLE invoices ADD COLUMN attachment_path TEXT;")
                 self.conn.commit()
                 print("Migración de 'invoices' completada.")
 
+            # Ubicación verificada del anexo (hash, tamaño y ruta relativa a la raíz de adjuntos)
+            missing_attachment_meta = [c for c in self.ATTACHMENT_META_COLUMNS if c not in invoice_columns]
+            if invoice_columns and missing_attachment_meta:
+                print("Ejecutando migración: Añadiendo metadatos de anexo a 'invoices'...")
+                for column in missing_attachment_meta:
+                    column_type = "INTEGER" if column == 'attachment_size' else "TEXT"
+                    cursor.execute(f"ALTER TABLE invoices ADD COLUMN {column} {column_type};")
+                self.conn.commit()
+                print("Migración de metadatos de anexo completada.")
+
             # --- CREACIÓN DE TABLAS (si no existen) ---
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS companies (
@@ -92,7 +210,8 @@ class LogicControllerQt:
                 invoice_category TEXT, rnc TEXT, third_party_name TEXT,
                 currency TEXT, itbis REAL DEFAULT 0.0, total_amount REAL DEFAULT 0.0,
                 exchange_rate REAL DEFAULT 1.0, total_amount_rd REAL DEFAULT 0.0,
-                attachment_path TEXT,
+                attachment_path TEXT, attachment_hash TEXT, attachment_size INTEGER,
+                attachment_relpath TEXT,
                 FOREIGN KEY (company_id) REFERENCES companies (id)
             );''')
             
@@ -129,6 +248,20 @@ class LogicControllerQt:
             CREATE UNIQUE INDEX IF NOT EXISTS idx_unique_invoice 
             ON invoices (company_id, rnc, invoice_number);
             ''')
+            # Los filtros por período usan rangos semiabiertos sobre invoice_date,
+            # por lo que estos índices resuelven cada consulta sin recorrer la tabla.
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_company_date ON invoices (company_id, invoice_date);")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_company_type_date ON invoices (company_id, invoice_type, invoice_date);")
+            # Reubicar anexos movidos por su contenido
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_attachment_hash ON invoices (attachment_hash);")
+            # Reportes por período de imputación (misma expresión que _period_date_sql)
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_invoices_company_imputation "
+                           f"ON invoices (company_id, {_period_date_sql('imputation_date')});")
+
+            # --- TOTALES MENSUALES (mantenidos por triggers) ---
+            self._create_monthly_totals(cursor)
+            # --- VERSIÓN DE DATOS (invalida las cachés de reportes) ---
+            self._create_data_version(cursor)
             
             # --- DATOS INICIALES ---
             cursor.execute("INSERT OR IGNORE INTO currencies (name) VALUES ('RD$'), ('USD');")
@@ -139,6 +272,142 @@ class LogicControllerQt:
             print(f"Error al inicializar o migrar las tablas: {e}")
             self.conn.rollback()
 
+    def _create_monthly_totals(self, cursor):
+        """
+        Crea las tablas de totales mensuales (un renglón por empresa/año/mes/tipo) y los
+        triggers que las mantienen al día con cada INSERT/UPDATE/DELETE sobre invoices:
+        monthly_totals por fecha de factura y monthly_totals_imputation por fecha de
+        imputación. Si una tabla es nueva y ya hay facturas, la llena desde cero.
+        """
+        for date_field, table in _ROLLUP_TABLES.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            existed = cursor.fetchone() is not None
+
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                company_id INTEGER NOT NULL, year TEXT NOT NULL, month TEXT NOT NULL,
+                invoice_type TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+                total_rd REAL NOT NULL DEFAULT 0.0, itbis_rd REAL NOT NULL DEFAULT 0.0,
+                PRIMARY KEY (company_id, year, month, invoice_type)
+            ) WITHOUT ROWID;''')
+
+            # Los triggers originales (por fecha de factura) conservan su nombre
+            prefix = "trg_invoices_rollup" if date_field == 'invoice_date' else "trg_invoices_imputation_rollup"
+            date_columns = "invoice_date" if date_field == 'invoice_date' else "invoice_date, imputation_date"
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_insert AFTER INSERT ON invoices
+            BEGIN {_rollup_add_sql('NEW', date_field)}
+            END;""")
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_delete AFTER DELETE ON invoices
+            BEGIN {_rollup_remove_sql('OLD', date_field)}
+            END;""")
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_update
+            AFTER UPDATE OF company_id, invoice_type, {date_columns}, total_amount_rd, itbis, exchange_rate ON invoices
+            BEGIN {_rollup_remove_sql('OLD', date_field)} {_rollup_add_sql('NEW', date_field)}
+            END;""")
+
+            if not existed:
+                self._fill_monthly_totals(cursor, date_field)
+
+    @staticmethod
+    def _create_data_version(cursor):
+        """
+        Crea el contador data_versions['invoices'] y los triggers que lo incrementan con
+        cada INSERT/UPDATE/DELETE sobre invoices. Al vivir en la base, también detecta
+        los cambios hechos por otra instancia o por report_batch/db_maintenance.
+        """
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;''')
+        cursor.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('invoices', 0);")
+        bump = "UPDATE data_versions SET version = version + 1 WHERE name = 'invoices';"
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_version_{event.lower()} AFTER {event} ON invoices
+            BEGIN {bump}
+            END;""")
+
+    def get_data_version(self):
+        """Versión actual de los datos de facturas (cambia con cualquier escritura), o None."""
+        if not self.conn:
+            return None
+        try:
+            return self._data_version(self._reader())
+        except sqlite3.Error as e:
+            print(f"Error al leer la versión de datos: {e}")
+            return None
+
+    @staticmethod
+    def _data_version(conn):
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'invoices'").fetchone()
+        return row[0] if row else 0
+
+    def _cached_report(self, kind, company_id, year, month, load):
+        """
+        Datos de un reporte desde la caché en memoria o, si la versión de datos cambió,
+        desde load(). La versión se lee en la misma instantánea que los datos, así que
+        lo guardado corresponde exactamente a esa versión.
+        Lanza sqlite3.Error (igual que load).
+        """
+        with self._read_snapshot() as conn:
+            version = self._data_version(conn)
+            key = (company_id, int(year), int(month), kind, version)
+            with self._report_cache_lock:
+                data = self._report_cache.get(key)
+                if data is not None:
+                    self._report_cache.move_to_end(key)
+            if data is None:
+                data = load()
+                if data is not None:
+                    with self._report_cache_lock:
+                        # Las versiones anteriores ya no se van a pedir
+                        for old in [k for k in self._report_cache if k[:4] == key[:4]]:
+                            del self._report_cache[old]
+                        self._report_cache[key] = data
+                        while len(self._report_cache) > self.REPORT_CACHE_SIZE:
+                            self._report_cache.popitem(last=False)
+        return data
+
+    def clear_report_cache(self):
+        with self._report_cache_lock:
+            self._report_cache.clear()
+
+    @staticmethod
+    def _fill_monthly_totals(cursor, date_field='invoice_date'):
+        v = _rollup_values("invoices", date_field)
+        table = _ROLLUP_TABLES[date_field]
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} (company_id, year, month, invoice_type, count, total_rd, itbis_rd)
+            SELECT company_id, {v['year']}, {v['month']}, invoice_type, COUNT(*), SUM({v['total_rd']}), SUM({v['itbis_rd']})
+            FROM invoices
+            GROUP BY company_id, {v['year']}, {v['month']}, invoice_type
+        """)
+
+    def rebuild_monthly_totals(self):
+        """
+        Recalcula monthly_totals y monthly_totals_imputation completos a partir de
+        invoices (corrige cualquier desajuste).
+        """
+        if not self.conn:
+            return False, "Sin conexión a la base de datos."
+        try:
+            cursor = self.conn.cursor()
+            for date_field in _ROLLUP_TABLES:
+                self._fill_monthly_totals(cursor, date_field)
+            self.conn.commit()
+            counts = []
+            for table in _ROLLUP_TABLES.values():
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                counts.append(cursor.fetchone()[0])
+            return True, f"Totales mensuales reconstruidos ({' + '.join(str(n) for n in counts)} registros)."
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            return False, f"Error de base de datos: {e}"
+
 
 # <<-- AÑADE ESTOS NUEVOS MÉTODOS AL FINAL DE LA CLASE LogicController -->>
 
@@ -185,7 +454,7 @@ class LogicControllerQt:
     def get_tax_calculations(self, company_id):
         """Obtiene la lista de cálculos guardados para una empresa."""
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT id, name, creation_date FROM tax_calculations WHERE company_id = ? ORDER BY creation_date DESC", (company_id,))
             return cursor.fetchall()
         except sqlite3.Error as e:
@@ -195,7 +464,7 @@ class LogicControllerQt:
     def get_tax_calculation_details(self, calculation_id):
         """Obtiene todos los detalles de un cálculo específico."""
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             # Obtener datos maestros del cálculo
             cursor.execute("SELECT * FROM tax_calculations WHERE id = ?", (calculation_id,))
             calc_data = cursor.fetchone()
@@ -295,7 +564,7 @@ class LogicControllerQt:
         """Recupera todas las empresas (id, name, rnc) de la base de datos."""
         if not self.conn: return []
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             # Añadimos la columna RNC a la consulta
             cursor.execute("SELECT id, name, rnc FROM companies ORDER BY name ASC")
             return cursor.fetchall()
@@ -304,85 +573,192 @@ class LogicControllerQt:
             return []            
 
 
-    def get_dashboard_data(self, company_id, filter_month=None, filter_year=None, specific_date=None):
+    def _select_invoices(self, columns, where, params, order_by="invoice_date DESC, id DESC", limit=None):
         """
-        Obtiene facturas y calcula totales para el dashboard, aplicando filtros opcionales.
-        Siempre retorna todas las claves esperadas en cada transacción.
+        Lee facturas como registros Invoice con solo 'columns' (ver invoice_record).
+        Lanza sqlite3.Error; cada método público decide qué retornar ante un error.
+        """
+        # ORDER BY calificado con la tabla: sin prefijo SQLite usaría el alias normalizado
+        # (COALESCE(...) AS invoice_date) y ya no podría recorrer el índice en orden
+        order = ", ".join(f"invoices.{term.strip()}" for term in order_by.split(","))
+        sql = f"SELECT {select_list(columns)} FROM invoices WHERE {where} ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = list(params) + [int(limit)]
+        cursor = self._reader().cursor()
+        cursor.row_factory = invoice_row_factory(columns)
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    @staticmethod
+    def _month_bounds(month, year):
+        """
+        Devuelve el rango semiabierto [inicio, fin) de un mes como textos 'YYYY-MM-DD'.
+        Comparar invoice_date contra un rango (en lugar de strftime) permite usar los índices.
+        """
+        month, year = int(month), int(year)
+        start = datetime.date(year, month, 1)
+        end = datetime.date(year + 1, 1, 1) if month == 12 else datetime.date(year, month + 1, 1)
+        return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _day_after(date_str):
+        """Devuelve el día siguiente a 'YYYY-MM-DD' (límite superior exclusivo de un rango)."""
+        day = datetime.datetime.strptime(str(date_str)[:10], '%Y-%m-%d').date()
+        return (day + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+    @classmethod
+    def _dashboard_filter(cls, company_id, filter_month=None, filter_year=None, specific_date=None,
+                          date_field='invoice_date'):
+        """
+        Construye la cláusula WHERE (y sus parámetros) que comparten el resumen
+        y el listado de transacciones del dashboard. Todos los períodos se expresan
+        como rangos semiabiertos sobre invoice_date (idx_invoices_company_date) o,
+        con date_field='imputation_date', sobre la fecha de imputación
+        (idx_invoices_company_imputation).
+        """
+        where = "company_id = ?"
+        params = [company_id]
+
+        if specific_date:
+            # Si se provee una fecha específica, este filtro tiene prioridad
+            day = specific_date.strftime('%Y-%m-%d')
+            where += " AND invoice_date >= ? AND invoice_date < ?"
+            params.extend([day, cls._day_after(day)])
+        elif filter_month and filter_year:
+            # Filtros de mes y año
+            date_sql = _period_date_sql(date_field)
+            where += f" AND {date_sql} >= ? AND {date_sql} < ?"
+            params.extend(cls._month_bounds(filter_month, filter_year))
+
+        return where, params
+
+    @staticmethod
+    def _build_summary(total_ingresos, total_gastos, itbis_ingresos, itbis_gastos):
+        """Arma el diccionario de resumen con las mismas claves que espera la UI."""
+        return {
+            "total_ingresos": total_ingresos, "total_gastos": total_gastos,
+            "itbis_ingresos": itbis_ingresos, "itbis_gastos": itbis_gastos,
+            "total_neto": total_ingresos - total_gastos,
+            "itbis_neto": itbis_ingresos - itbis_gastos
+        }
+
+    def get_dashboard_summary(self, company_id, filter_month=None, filter_year=None, specific_date=None,
+                              date_field='invoice_date'):
+        """
+        Calcula los totales del dashboard en SQLite sin traer ninguna factura a memoria.
+        Para mes/año o sin filtro lee la tabla monthly_totals (mantenida por triggers),
+        así que el costo no depende de cuántas facturas existan. Con
+        date_field='imputation_date' los meses son de imputación (monthly_totals_imputation).
         """
         if not self.conn or company_id is None:
             return None
 
-        def _normalize_transaction_row(row):
-            """
-            Asegura que cada registro tenga todos los campos requeridos.
-            """
-            expected_fields = [
-                'id', 'invoice_date', 'invoice_type', 'invoice_number', 'third_party_name',
-                'itbis', 'exchange_rate', 'total_amount', 'currency', 'total_amount_rd'
-            ]
-            # Convierte a dict si es necesario
-            if not isinstance(row, dict):
-                row = dict(row)
-            # Completa faltantes
-            for key in expected_fields:
-                if key not in row or row[key] is None:
-                    row[key] = '' if key in ('invoice_date', 'invoice_type', 'invoice_number', 'third_party_name', 'currency') else 0.0
-            # exchange_rate nunca debe ser 0
-            try:
-                if float(row['exchange_rate']) == 0.0:
-                    row['exchange_rate'] = 1.0
-            except Exception:
-                row['exchange_rate'] = 1.0
-            return row
-
         try:
-            cursor = self.conn.cursor()
-            
-            # Construcción de la consulta SQL dinámica
-            query = "SELECT * FROM invoices WHERE company_id = ?"
-            params = [company_id]
-            
+            cursor = self._reader().cursor()
             if specific_date:
-                # Si se provee una fecha específica, este filtro tiene prioridad
-                query += " AND invoice_date = ?"
-                params.append(specific_date.strftime('%Y-%m-%d'))
-            elif filter_month and filter_year:
-                # Filtros de mes y año
-                query += " AND strftime('%Y', invoice_date) = ? AND strftime('%m', invoice_date) = ?"
-                params.append(str(filter_year))
-                params.append(str(filter_month).zfill(2))
-
-            cursor.execute(query, params)
-            all_invoices = cursor.fetchall()
-            # Normalizar todos los registros
-            normalized_invoices = [_normalize_transaction_row(row) for row in all_invoices]
-
-            emitted = [row for row in normalized_invoices if row['invoice_type'] == 'emitida']
-            expenses = [row for row in normalized_invoices if row['invoice_type'] == 'gasto']
-
-            total_ingresos = sum(float(f['total_amount_rd']) for f in emitted)
-            total_gastos = sum(float(f['total_amount_rd']) for f in expenses)
-            itbis_ingresos = sum(float(f['itbis']) * float(f['exchange_rate']) for f in emitted)
-            itbis_gastos = sum(float(f['itbis']) * float(f['exchange_rate']) for f in expenses)
+                # Un día concreto: se suma directamente sobre invoices (índice por fecha)
+                where, params = self._dashboard_filter(company_id, filter_month, filter_year, specific_date)
+                # Misma normalización que invoice_record.select_list: nulos a 0 y tasa 0 -> 1.0
+                cursor.execute(f"""
+                    SELECT invoice_type,
+                           COALESCE(SUM(COALESCE(total_amount_rd, 0.0)), 0.0) AS total_rd,
+                           COALESCE(SUM(COALESCE(itbis, 0.0) * {_RATE_SQL}), 0.0) AS itbis_rd
+                    FROM invoices
+                    WHERE {where}
+                    GROUP BY invoice_type
+                """, params)
+            else:
+                # Mes/año o todo el historial: unos pocos renglones pre-agregados de monthly_totals
+                where, params = "company_id = ?", [company_id]
+                if filter_month and filter_year:
+                    where += " AND year = ? AND month = ?"
+                    params.extend([str(int(filter_year)), str(int(filter_month)).zfill(2)])
+                cursor.execute(f"""
+                    SELECT invoice_type,
+                           COALESCE(SUM(total_rd), 0.0) AS total_rd,
+                           COALESCE(SUM(itbis_rd), 0.0) AS itbis_rd
+                    FROM {_ROLLUP_TABLES[date_field]}
+                    WHERE {where}
+                    GROUP BY invoice_type
+                """, params)
+            totals = {row['invoice_type']: row for row in cursor.fetchall()}
+
+            emitted = totals.get('emitida')
+            expenses = totals.get('gasto')
+            return self._build_summary(
+                float(emitted['total_rd']) if emitted else 0.0,
+                float(expenses['total_rd']) if expenses else 0.0,
+                float(emitted['itbis_rd']) if emitted else 0.0,
+                float(expenses['itbis_rd']) if expenses else 0.0,
+            )
+        except Exception as e:
+            print(f"Error al obtener el resumen del dashboard: {e}")
+            return None
 
-            return {
-                "all_transactions": sorted(normalized_invoices, key=lambda x: x['invoice_date'], reverse=True),
-                "summary": {
-                    "total_ingresos": total_ingresos, "total_gastos": total_gastos,
-                    "itbis_ingresos": itbis_ingresos, "itbis_gastos": itbis_gastos,
-                    "total_neto": total_ingresos - total_gastos,
-                    "itbis_neto": itbis_ingresos - itbis_gastos
-                }
-            }
+    def get_dashboard_transactions(self, company_id, filter_month=None, filter_year=None, specific_date=None):
+        """
+        Obtiene las facturas del dashboard (más recientes primero), aplicando filtros opcionales.
+        Siempre retorna todas las claves esperadas en cada transacción.
+        """
+        if not self.conn or company_id is None:
+            return None
 
+        try:
+            where, params = self._dashboard_filter(company_id, filter_month, filter_year, specific_date)
+            return self._select_invoices(TRANSACTION_COLUMNS, where, params)
         except Exception as e:
-            print(f"Error al obtener datos del dashboard: {e}")
+            print(f"Error al obtener transacciones del dashboard: {e}")
+            return None
+
+    def get_transactions_page(self, company_id, filter_month=None, filter_year=None, specific_date=None,
+                              invoice_type=None, after=None, limit=200):
+        """
+        Obtiene una página de transacciones del dashboard con paginación por clave
+        (ORDER BY invoice_date DESC, id DESC).
+        'after' es la tupla (invoice_date, id) de la última fila de la página anterior;
+        la consulta continúa justo después de ella sin usar OFFSET.
+        """
+        if not self.conn or company_id is None:
+            return None
+
+        try:
+            where, params = self._dashboard_filter(company_id, filter_month, filter_year, specific_date)
+            if invoice_type:
+                where += " AND invoice_type = ?"
+                params.append(invoice_type)
+            if after is not None:
+                where += " AND (invoice_date, id) < (?, ?)"
+                params.extend(after)
+            return self._select_invoices(DASHBOARD_COLUMNS, where, params, limit=limit)
+        except sqlite3.Error as e:
+            print(f"Error al obtener la página de transacciones: {e}")
+            return None
+
+    def get_dashboard_data(self, company_id, filter_month=None, filter_year=None, specific_date=None):
+        """
+        Obtiene facturas y calcula totales para el dashboard, aplicando filtros opcionales.
+        Combina get_dashboard_summary (totales en SQL) y get_dashboard_transactions (filas).
+        """
+        if not self.conn or company_id is None:
             return None
 
+        with self._read_snapshot():
+            summary = self.get_dashboard_summary(company_id, filter_month, filter_year, specific_date)
+            transactions = self.get_dashboard_transactions(company_id, filter_month, filter_year, specific_date)
+        if summary is None or transactions is None:
+            return None
+
+        return {
+            "all_transactions": transactions,
+            "summary": summary
+        }
+
     def close_connection(self):
         """Cierra la conexión a la base de datos."""
         if self.conn:
-            self.conn.close()
+            self.db.close()
+            self.conn = None
             print("Conexión a la base de datos cerrada.")
 
 
@@ -394,14 +770,14 @@ class LogicControllerQt:
             return []
         
         try:
-            cursor = self.conn.cursor()
-            # La función strftime('%Y', ...) extrae el año de la fecha.
-            # DISTINCT asegura que cada año aparezca solo una vez.
-            query = "SELECT DISTINCT strftime('%Y', invoice_date) as year FROM invoices WHERE company_id = ? ORDER BY year DESC"
-            cursor.execute(query, (company_id,))
-            # Extraemos el valor de la columna 'year' para cada fila y lo convertimos a lista
-            years = [row['year'] for row in cursor.fetchall()]
-            return years
+            cursor = self._reader().cursor()
+            # Los años salen de monthly_totals (unos pocos renglones por empresa, por PK)
+            cursor.execute("""
+                SELECT DISTINCT year FROM monthly_totals
+                WHERE company_id = ? AND count > 0 AND year GLOB '[0-9][0-9][0-9][0-9]'
+                ORDER BY year DESC
+            """, (company_id,))
+            return [row['year'] for row in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"Error al obtener años únicos: {e}")
             return []
@@ -412,7 +788,7 @@ class LogicControllerQt:
         if not self.conn or company_id is None:
             return 0.0
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT itbis_adelantado FROM companies WHERE id = ?", (company_id,))
             result = cursor.fetchone()
             return result['itbis_adelantado'] if result else 0.0
@@ -456,10 +832,11 @@ class LogicControllerQt:
                 "total_amount_rd": invoice_data['total_amount_rd'],
                 "attachment_path": invoice_data.get('attachment_path')
             }
+            params.update(self._attachment_meta_params(invoice_data))
 
             cursor.execute(
-                """INSERT INTO invoices (company_id, invoice_type, invoice_date, imputation_date, invoice_number, invoice_category, rnc, third_party_name, currency, itbis, total_amount, exchange_rate, total_amount_rd, attachment_path)
-                VALUES (:company_id, :invoice_type, :invoice_date, :imputation_date, :invoice_number, :invoice_category, :rnc, :third_party_name, :currency, :itbis, :total_amount, :exchange_rate, :total_amount_rd, :attachment_path)""",
+                """INSERT INTO invoices (company_id, invoice_type, invoice_date, imputation_date, invoice_number, invoice_category, rnc, third_party_name, currency, itbis, total_amount, exchange_rate, total_amount_rd, attachment_path, attachment_hash, attachment_size, attachment_relpath)
+                VALUES (:company_id, :invoice_type, :invoice_date, :imputation_date, :invoice_number, :invoice_category, :rnc, :third_party_name, :currency, :itbis, :total_amount, :exchange_rate, :total_amount_rd, :attachment_path, :attachment_hash, :attachment_size, :attachment_relpath)""",
                 params
             )
             self.conn.commit()
@@ -476,7 +853,137 @@ class LogicControllerQt:
         except sqlite3.Error as e:
             self.conn.rollback()
             return False, f"Error de base de datos: {e}"
-        
+
+    @classmethod
+    def _attachment_meta_params(cls, invoice_data):
+        """
+        Metadatos del anexo calculados al guardarlo. Solo se aceptan si corresponden
+        al attachment_path que se guarda (un dict releído de la base y editado puede
+        traer los del anexo anterior); si no, van en None.
+        """
+        meta = {column: invoice_data.get(column) for column in cls.ATTACHMENT_META_COLUMNS}
+        path = str(invoice_data.get('attachment_path') or '').replace('\\', '/')
+        if not path or not meta['attachment_hash'] or meta['attachment_relpath'] != path:
+            return dict.fromkeys(cls.ATTACHMENT_META_COLUMNS)
+        return meta
+
+    _BULK_REQUIRED_FIELDS = ('company_id', 'invoice_type', 'invoice_date', 'invoice_number')
+
+    def add_invoices_bulk(self, invoices):
+        """
+        Inserta muchas facturas en UNA sola transacción (un único commit).
+
+        - Las filas que ya existen según idx_unique_invoice (company_id, rnc, invoice_number),
+          en la base o repetidas dentro del mismo lote, se reportan como 'duplicate' y no
+          detienen el lote.
+        - Los terceros se actualizan al final como un conjunto (un upsert por RNC).
+
+        Retorna una lista con un resultado por fila, en el mismo orden de entrada:
+            {"index": i, "invoice_number": ..., "status": "inserted" | "duplicate" | "error", "message": ...}
+        """
+        if not self.conn:
+            return []
+
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        results = []
+        rows = []          # (índice, params) listos para insertar
+        seen_keys = {}     # clave única -> índice de la primera aparición en el lote
+
+        for index, invoice_data in enumerate(invoices):
+            result = {"index": index, "invoice_number": None, "status": "inserted", "message": ""}
+            results.append(result)
+            try:
+                missing = [k for k in self._BULK_REQUIRED_FIELDS if invoice_data.get(k) in (None, '')]
+                if missing:
+                    raise ValueError(f"Faltan campos requeridos: {', '.join(missing)}")
+                params = (
+                    invoice_data['company_id'], invoice_data['invoice_type'], invoice_data['invoice_date'],
+                    invoice_data.get('imputation_date') or today, invoice_data['invoice_number'],
+                    invoice_data.get('invoice_category'), invoice_data.get('rnc'), invoice_data.get('third_party_name'),
+                    invoice_data.get('currency'), invoice_data.get('itbis', 0.0), invoice_data.get('total_amount', 0.0),
+                    invoice_data.get('exchange_rate', 1.0), invoice_data.get('total_amount_rd', 0.0),
+                    invoice_data.get('attachment_path'),
+                )
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                result.update(status="error", message=str(e))
+                continue
+
+            result["invoice_number"] = params[4]
+            # En el índice único los RNC nulos nunca chocan entre sí
+            if params[6] is not None:
+                key = (params[0], params[6], params[4])
+                if key in seen_keys:
+                    result.update(status="duplicate",
+                                  message=f"Repetida en el lote (fila {seen_keys[key]}).")
+                    continue
+                seen_keys[key] = index
+            rows.append((index, params))
+
+        try:
+            cursor = self.conn.cursor()
+            if not self.conn.in_transaction:
+                cursor.execute("BEGIN")
+
+            # 1. Duplicados contra la base: un JOIN por el índice único en vez de una consulta por fila
+            if seen_keys:
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_invoice_keys (pos INTEGER, company_id INTEGER, rnc TEXT, invoice_number TEXT)")
+                cursor.execute("DELETE FROM temp.bulk_invoice_keys")
+                cursor.executemany(
+                    "INSERT INTO temp.bulk_invoice_keys (pos, company_id, rnc, invoice_number) VALUES (?, ?, ?, ?)",
+                    ((pos, company_id, rnc, number) for (company_id, rnc, number), pos in seen_keys.items())
+                )
+                cursor.execute("""
+                    SELECT k.pos FROM temp.bulk_invoice_keys k
+                    JOIN invoices i ON i.company_id = k.company_id AND i.rnc = k.rnc AND i.invoice_number = k.invoice_number
+                """)
+                existing = {row[0] for row in cursor.fetchall()}
+                cursor.execute("DELETE FROM temp.bulk_invoice_keys")
+                if existing:
+                    for pos in existing:
+                        results[pos].update(status="duplicate",
+                                            message="Ya existe una factura con el mismo número para este RNC/Cédula.")
+                    rows = [(pos, params) for pos, params in rows if pos not in existing]
+
+            # 2. Inserción masiva
+            insert_sql = """INSERT INTO invoices (company_id, invoice_type, invoice_date, imputation_date, invoice_number, invoice_category, rnc, third_party_name, currency, itbis, total_amount, exchange_rate, total_amount_rd, attachment_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+            try:
+                cursor.execute("SAVEPOINT bulk_insert")
+                cursor.executemany(insert_sql, (params for _, params in rows))
+                cursor.execute("RELEASE SAVEPOINT bulk_insert")
+            except sqlite3.IntegrityError:
+                # Alguna fila violó otra restricción: repetir fila por fila dentro de la misma transacción
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_insert")
+                cursor.execute("RELEASE SAVEPOINT bulk_insert")
+                for pos, params in rows:
+                    try:
+                        cursor.execute(insert_sql, params)
+                    except sqlite3.IntegrityError as e:
+                        status = "duplicate" if 'UNIQUE constraint failed' in str(e) else "error"
+                        results[pos].update(status=status, message=str(e))
+
+            # 3. Terceros: un upsert por RNC (gana el último nombre del lote)
+            third_parties = {}
+            for pos, params in rows:
+                rnc, name = params[6], params[7]
+                if results[pos]["status"] == "inserted" and rnc and name:
+                    third_parties[str(rnc).strip()] = str(name).strip()
+            if third_parties:
+                cursor.executemany(
+                    """INSERT INTO third_parties (rnc, name) VALUES (?, ?)
+                    ON CONFLICT(rnc) DO UPDATE SET name=excluded.name""",
+                    third_parties.items()
+                )
+
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            for result in results:
+                if result["status"] == "inserted":
+                    result.update(status="error", message=f"Error de base de datos: {e}")
+
+        return results
+
     def get_currencies(self, company_id):
         """
         Devuelve la lista de monedas disponibles desde la base de datos.
@@ -485,7 +992,7 @@ class LogicControllerQt:
         if not self.conn:
             return ["RD$", "USD"] # Fallback por si no hay conexión
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT name FROM currencies ORDER BY name")
             return [row['name'] for row in cursor.fetchall()]
         except sqlite3.Error as e:
@@ -497,7 +1004,7 @@ class LogicControllerQt:
         if not self.conn or len(query) < 2:
             return []
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             column = 'name' if search_by == 'name' else 'rnc'
             
             # Usamos LIKE para buscar coincidencias que empiecen con la consulta
@@ -530,7 +1037,7 @@ class LogicControllerQt:
         if not self.conn or invoice_id is None:
             return None
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT * FROM invoices WHERE id = ?", (invoice_id,))
             result = cursor.fetchone()
             return dict(result) if result else None
@@ -554,7 +1061,10 @@ class LogicControllerQt:
                 "exchange_rate": invoice_data['exchange_rate'], "total_amount_rd": invoice_data['total_amount_rd'],
                 "attachment_path": invoice_data.get('attachment_path'), "invoice_id": invoice_id
             }
+            params.update(self._attachment_meta_params(invoice_data))
 
+            # Metadatos del anexo: los nuevos si vienen; si no, se conservan mientras
+            # attachment_path no cambie (a la derecha del SET se leen los valores anteriores)
             cursor.execute(
                 """UPDATE invoices SET
                     invoice_date = :invoice_date, invoice_number = :invoice_number,
@@ -562,7 +1072,13 @@ class LogicControllerQt:
                     third_party_name = :third_party_name, currency = :currency,
                     itbis = :itbis, total_amount = :total_amount,
                     exchange_rate = :exchange_rate, total_amount_rd = :total_amount_rd,
-                    attachment_path = :attachment_path
+                    attachment_path = :attachment_path,
+                    attachment_hash = CASE WHEN :attachment_hash IS NOT NULL THEN :attachment_hash
+                        WHEN attachment_path IS :attachment_path THEN attachment_hash END,
+                    attachment_size = CASE WHEN :attachment_hash IS NOT NULL THEN :attachment_size
+                        WHEN attachment_path IS :attachment_path THEN attachment_size END,
+                    attachment_relpath = CASE WHEN :attachment_hash IS NOT NULL THEN :attachment_relpath
+                        WHEN attachment_path IS :attachment_path THEN attachment_relpath END
                 WHERE id = :invoice_id""",
                 params
             )
@@ -594,76 +1110,118 @@ class LogicControllerQt:
             return False, f"Error de base de datos al eliminar: {e}"
         
 
-    def get_monthly_report_data(self, company_id, month, year):
+    def get_monthly_report_data(self, company_id, month, year, date_field='invoice_date'):
         """
         Obtiene los datos de facturas para un mes y año específicos para generar un reporte.
+        Con date_field='imputation_date' el mes es el de imputación (como el reporte por
+        imputación de gestion_facturas), con su propio índice y totales mensuales.
+        Mientras no cambie ninguna factura, el mismo período se sirve desde memoria.
         """
-        if not self.conn or company_id is None:
-            return None
-        
-        # Usamos el mismo método de filtrado que ya probamos
-        report_data = self.get_dashboard_data(company_id, filter_month=month, filter_year=year)
-        
-        if not report_data:
+        if not self.conn or company_id is None or date_field not in PERIOD_DATE_FIELDS:
             return None
 
-        # Separamos las listas para mayor claridad en el reporte
-        emitted_invoices = [dict(row) for row in report_data['all_transactions'] if row['invoice_type'] == 'emitida']
-        expense_invoices = [dict(row) for row in report_data['all_transactions'] if row['invoice_type'] == 'gasto']
+        def _load():
+            # Mismo filtro que el dashboard, con las columnas que necesita el reporte (anexos incluidos)
+            where, params = self._dashboard_filter(company_id, month, year, None, date_field)
+            summary = self.get_dashboard_summary(company_id, filter_month=month, filter_year=year,
+                                                 date_field=date_field)
+            if summary is None:
+                return None
+            invoices = self._select_invoices(REPORT_COLUMNS, where, params)
+            # Separamos las listas para mayor claridad en el reporte (mismos objetos, sin copiar)
+            return {
+                "summary": summary,
+                "emitted_invoices": [inv for inv in invoices if inv.invoice_type == 'emitida'],
+                "expense_invoices": [inv for inv in invoices if inv.invoice_type == 'gasto'],
+            }
 
+        try:
+            kind = 'monthly' if date_field == 'invoice_date' else 'monthly_imputation'
+            data = self._cached_report(kind, company_id, year, month, _load)
+        except sqlite3.Error as e:
+            print(f"Error al obtener datos del reporte mensual: {e}")
+            return None
+        if data is None:
+            return None
+        # Listas nuevas: quien las reciba puede reordenarlas o filtrarlas sin tocar la caché
         return {
-            "summary": report_data['summary'],
-            "emitted_invoices": emitted_invoices,
-            "expense_invoices": expense_invoices
+            "summary": dict(data["summary"]),
+            "emitted_invoices": list(data["emitted_invoices"]),
+            "expense_invoices": list(data["expense_invoices"]),
         }
-    
+
+    def iter_report_invoices(self, company_id=None, invoice_type=None, start_date=None, end_date=None,
+                             batch_size=500, date_field='invoice_date'):
+        """
+        Recorre las facturas del reporte (columnas REPORT_COLUMNS) sin cargarlas todas:
+        se leen de a 'batch_size' filas del cursor. company_id=None recorre todas las
+        empresas; start_date/end_date ('YYYY-MM-DD', ambos incluidos) son opcionales y se
+        comparan con la fecha de factura o, con date_field='imputation_date', la de imputación.
+        Todo el recorrido ve la misma versión de la base. Lanza sqlite3.Error; con una
+        end_date inválida no recorre nada.
+        """
+        if not self.conn:
+            return
+        date_sql = _period_date_sql(date_field)
+        conditions, params = [], []
+        if company_id is not None:
+            conditions.append("company_id = ?")
+            params.append(company_id)
+        if invoice_type:
+            conditions.append("invoice_type = ?")
+            params.append(invoice_type)
+        if start_date:
+            conditions.append(f"{date_sql} >= ?")
+            params.append(str(start_date)[:10])
+        if end_date:
+            try:
+                end_bound = self._day_after(end_date)
+            except ValueError as e:
+                print(f"Fecha final inválida para el reporte: {end_date!r} ({e})")
+                return
+            conditions.append(f"{date_sql} < ?")
+            params.append(end_bound)
+        where = " AND ".join(conditions) or "1 = 1"
+        order = "invoices.invoice_date DESC, invoices.id DESC"
+
+        with self._read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = invoice_row_factory(REPORT_COLUMNS)
+            cursor.execute(f"SELECT {select_list(REPORT_COLUMNS)} FROM invoices WHERE {where} ORDER BY {order}",
+                           params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
 
     def get_emitted_invoices_for_period(self, company_id, start_date, end_date):
         """Obtiene todas las facturas emitidas para una empresa dentro de un rango de fechas."""
         if not self.conn or not all([company_id, start_date, end_date]):
             return []
         try:
-            cursor = self.conn.cursor()
-            query = """
-                SELECT * FROM invoices 
-                WHERE company_id = ? 
-                AND invoice_type = 'emitida'
-                AND invoice_date BETWEEN ? AND ?
-                ORDER BY invoice_date
-            """
-            cursor.execute(query, (company_id, start_date, end_date))
-            return [dict(row) for row in cursor.fetchall()]
-        except sqlite3.Error as e:
+            # Rango semiabierto [start_date, end_date + 1 día) sobre idx_invoices_company_type_date
+            return self._select_invoices(
+                RETENTION_COLUMNS,
+                "company_id = ? AND invoice_type = 'emitida' AND invoice_date >= ? AND invoice_date < ?",
+                (company_id, start_date, self._day_after(end_date)),
+                order_by="invoice_date")
+        except (sqlite3.Error, ValueError) as e:
+            # ValueError: end_date no es una fecha 'YYYY-MM-DD'
             print(f"Error al obtener facturas emitidas por período: {e}")
             return []
         
 
     def get_setting(self, key, default=None):
-        if not os.path.exists("config.json"):
-            return default
-        try:
-            with open("config.json", "r") as f:
-                config = json.load(f)
-            return config.get(key, default)
-        except Exception:
-            return default
+        return self.settings.get(key, default)
 
     def set_setting(self, key, value):
-        config = {}
-        if os.path.exists("config.json"):
-            try:
-                with open("config.json", "r") as f:
-                    config = json.load(f)
-            except Exception:
-                config = {}
-        config[key] = value
-        with open("config.json", "w") as f:
-            json.dump(config, f, indent=2)
+        self.settings.set(key, value)
 
     def get_all_currencies(self):
         """Obtiene todas las monedas de la base de datos."""
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT name FROM currencies ORDER BY name")
             return [row['name'] for row in cursor.fetchall()]
         except sqlite3.Error as e:
@@ -687,10 +1245,8 @@ class LogicControllerQt:
             return None
 
         try:
-            cursor = self.conn.cursor()
-            query = "SELECT * FROM invoices WHERE company_id = ? AND rnc = ? ORDER BY invoice_date DESC"
-            cursor.execute(query, (company_id, third_party_rnc))
-            all_invoices = [dict(row) for row in cursor.fetchall()]
+            all_invoices = self._select_invoices(THIRD_PARTY_COLUMNS, "company_id = ? AND rnc = ?",
+                                                 (company_id, third_party_rnc), order_by="invoice_date DESC")
 
             emitted = [f for f in all_invoices if f['invoice_type'] == 'emitida']
             expenses = [f for f in all_invoices if f['invoice_type'] == 'gasto']
@@ -743,7 +1299,7 @@ class LogicControllerQt:
         if not self.conn or not company_id:
             return None
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT * FROM companies WHERE id = ?", (company_id,))
             result = cursor.fetchone()
             return dict(result) if result else None
@@ -809,13 +1365,182 @@ class LogicControllerQt:
         Construye la ruta base completa para los adjuntos combinando
         la ruta de Dropbox detectada y la subcarpeta configurada.
         """
-        dropbox_path = find_dropbox_folder()
-        subfolder_name = self.get_setting('attachment_subfolder')
+        return self.settings.attachment_root()
 
-        if dropbox_path and subfolder_name:
-            return os.path.join(dropbox_path, subfolder_name)
-        
-        return None
+    def collect_attachment_metadata(self, root=None, progress_callback=None):
+        """
+        Calcula hash, tamaño y ruta relativa de los anexos guardados que aún no los
+        tienen. Solo lee la base (puede correr en un hilo secundario); el resultado
+        se guarda con apply_attachment_metadata.
+        Retorna (updates, missing): updates son tuplas (hash, tamaño, relpath, id,
+        attachment_path) y missing los ids cuyo archivo no se encontró.
+        """
+        if not self.conn:
+            return [], []
+        root = root if root is not None else self.get_attachment_base_path()
+        try:
+            cursor = self._reader().cursor()
+            cursor.execute("""SELECT id, attachment_path FROM invoices
+                WHERE attachment_path IS NOT NULL AND attachment_path != '' AND attachment_hash IS NULL
+                ORDER BY id""")
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error al leer los anexos pendientes: {e}")
+            return [], []
+
+        updates, missing = [], []
+        for done, row in enumerate(rows):
+            if progress_callback:
+                progress_callback(done, len(rows), f"Anexo {done + 1} de {len(rows)}")
+            full_path = resolve_attachment(row['attachment_path'], root)
+            if not full_path:
+                missing.append(row['id'])
+                continue
+            try:
+                meta = attachment_metadata(full_path, root)
+            except OSError:
+                missing.append(row['id'])
+                continue
+            updates.append((meta['attachment_hash'], meta['attachment_size'], meta['attachment_relpath'],
+                            row['id'], row['attachment_path']))
+        return updates, missing
+
+    def apply_attachment_metadata(self, updates, batch_size=500):
+        """
+        Guarda los resultados de collect_attachment_metadata, un commit por lote.
+        Una factura cuyo anexo cambió mientras tanto no se toca.
+        Retorna la cantidad de facturas actualizadas.
+        """
+        if not self.conn or not updates:
+            return 0
+        updated = 0
+        try:
+            cursor = self.conn.cursor()
+            for start in range(0, len(updates), batch_size):
+                cursor.executemany(
+                    """UPDATE invoices SET attachment_hash = ?, attachment_size = ?, attachment_relpath = ?
+                    WHERE id = ? AND attachment_path IS ? AND attachment_hash IS NULL""",
+                    updates[start:start + batch_size]
+                )
+                updated += max(cursor.rowcount, 0)
+                self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error al guardar los metadatos de anexos: {e}")
+        return updated
+
+    def backfill_attachment_metadata(self, root=None, progress_callback=None):
+        """Completa los metadatos de todos los anexos existentes. Retorna (actualizadas, ids sin archivo)."""
+        updates, missing = self.collect_attachment_metadata(root, progress_callback)
+        return self.apply_attachment_metadata(updates), missing
+
+    def find_moved_attachments(self, root=None, invoice_ids=None, progress_callback=None):
+        """
+        Busca los anexos cuya ruta guardada ya no existe: un archivo con el mismo
+        contenido (attachment_hash) bajo la raíz de adjuntos, primero por nombre en
+        el índice y luego entre los archivos del mismo tamaño. Solo lee la base
+        (puede correr en un hilo secundario); se guarda con apply_relinked_attachments.
+        'invoice_ids' limita la búsqueda a esas facturas.
+        Retorna (encontrados {id: ruta absoluta}, ids que siguen sin encontrarse).
+        """
+        if not self.conn:
+            return {}, []
+        root = root if root is not None else self.get_attachment_base_path()
+        index = get_attachment_index(root)
+        sql = """SELECT id, attachment_path, attachment_hash, attachment_size, attachment_relpath
+            FROM invoices WHERE attachment_hash IS NOT NULL"""
+        params = ()
+        if invoice_ids is not None:
+            sql += " AND id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps([int(i) for i in invoice_ids]),)
+        try:
+            cursor = self._reader().cursor()
+            cursor.execute(sql, params)
+            lost = [row for row in cursor.fetchall()
+                    if not locate_attachment(row['attachment_relpath'] or row['attachment_path'], root,
+                                             row['attachment_hash'])]
+        except sqlite3.Error as e:
+            print(f"Error al leer los anexos para reubicar: {e}")
+            return {}, []
+        if not lost or index is None:
+            return {}, [row['id'] for row in lost]
+
+        hashes = {}
+
+        def same_content(path, row):
+            try:
+                if os.path.getsize(path) != row['attachment_size']:
+                    return False
+                if path not in hashes:
+                    hashes[path] = hash_file(path)
+            except OSError:
+                return False
+            return hashes[path] == row['attachment_hash']
+
+        found = {}
+        pending = []
+        for row in lost:
+            stored = row['attachment_relpath'] or row['attachment_path']
+            candidate = index.find(stored)
+            if candidate and same_content(candidate, row):
+                found[row['id']] = candidate
+            else:
+                pending.append(row)
+
+        # Renombrados: comparar contra los archivos del mismo tamaño (un solo recorrido del índice)
+        if pending:
+            by_size = {}
+            for row in pending:
+                by_size.setdefault(row['attachment_size'], []).append(row)
+            files = list(index.iter_files())
+            for done, path in enumerate(files):
+                if progress_callback and done % 500 == 0:
+                    progress_callback(done, len(files), "Buscando anexos movidos...")
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                for row in by_size.get(size, ()):
+                    if row['id'] not in found and same_content(path, row):
+                        found[row['id']] = path
+
+        return found, [row['id'] for row in lost if row['id'] not in found]
+
+    def apply_relinked_attachments(self, found, root=None):
+        """
+        Guarda los resultados de find_moved_attachments (attachment_path y
+        attachment_relpath) en una sola transacción. Retorna True si se guardaron.
+        """
+        if not self.conn:
+            return False
+        if not found:
+            return True
+        root = root if root is not None else self.get_attachment_base_path()
+        updates = []
+        for invoice_id, path in found.items():
+            relpath = normalize_relpath(path, root)
+            updates.append((relpath.replace('/', os.sep), relpath, invoice_id))
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                "UPDATE invoices SET attachment_path = ?, attachment_relpath = ? WHERE id = ?", updates)
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error al reubicar anexos: {e}")
+            return False
+
+    def relink_moved_attachments(self, root=None, invoice_ids=None, progress_callback=None):
+        """
+        Busca (find_moved_attachments) y guarda (apply_relinked_attachments) los
+        anexos movidos o renombrados, en el hilo que tiene la conexión de escritura.
+        Retorna (reubicados {id: ruta absoluta}, ids que siguen sin encontrarse).
+        """
+        found, missing = self.find_moved_attachments(root, invoice_ids, progress_callback)
+        if not self.apply_relinked_attachments(found, root):
+            return {}, missing + list(found)
+        return found, missing
 
 
     def get_companies(self):
@@ -823,7 +1548,7 @@ class LogicControllerQt:
         if not self.conn:
             return []
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT * FROM companies ORDER BY name")
             return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
@@ -835,7 +1560,7 @@ class LogicControllerQt:
         if not self.conn:
             return []
         try:
-            cursor = self.conn.cursor()
+            cursor = self._reader().cursor()
             cursor.execute("SELECT * FROM companies ORDER BY name")
             return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
@@ -1,21 +1,14 @@
 import sys
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from app_gui_qt import MainApplicationQt
 
 from logic_qt import LogicControllerQt
-import os
-import json
+from settings_service import get_settings
 
 def main():
     # Lee facturas_config desde config.json si existe
-    config = {}
-    if os.path.exists("config.json"):
-        with open("config.json", "r") as f:
-            try:
-                config = json.load(f)
-            except Exception:
-                config = {}
-    db_path = config.get("facturas_config", "database.db")
+    db_path = get_settings().get("facturas_config", "database.db")
 
     app = QApplication(sys.argv)
     logic = LogicControllerQt(db_path)
@@ -24,4 +17,6 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    # Necesario en el ejecutable empaquetado: report_generator usa procesos para los anexos
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Caché en disco de las páginas PDF generadas a partir de anexos (imágenes).
+
+Volver a exportar un reporte no debería decodificar y redibujar las mismas
+fotos de recibos otra vez. Cada página convertida se guarda en la carpeta de
+caché local de este equipo (cache_dir_for) con una clave que combina:
+- el hash SHA-256 y el tamaño del archivo de origen, y
+- los parámetros de dibujo (versión, resolución, calidad, encabezado...).
+
+Para no leer cada archivo en todas las exportaciones, el hash se guarda en
+index.json junto con el tamaño y el mtime. Solo se recalcula si alguno de los
+dos cambió. Por eso, un archivo movido o copiado con el mismo contenido sigue
+usando su página ya convertida.
+
+La caché no va dentro de la raíz de adjuntos: esa carpeta se sincroniza con
+Dropbox y subiría cientos de MB de archivos regenerables a todos los equipos
+(además, index.json guarda rutas absolutas de cada equipo). Se usa una carpeta
+por usuario (%LOCALAPPDATA%, ~/Library/Caches o $XDG_CACHE_HOME) con una
+subcarpeta por raíz de adjuntos; 'attachment_cache_dir' en config.json la cambia.
+
+Al superar el tamaño máximo se borran las páginas usadas hace más tiempo (LRU).
+Cada acceso actualiza el mtime de la página.
+
+    cache = get_page_cache(attachment_root)
+    key = cache.key(path, "image-page", 1, company, invoice_number)
+    data = cache.get(key)
+    if data is None:
+        data = render(path)
+        cache.put(key, data)
+    cache.prune()
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from settings_service import get_settings
+from attachment_store import blob_hash
+
+APP_CACHE_DIRNAME = 'FacturasPyQt6'
+NO_ROOT_DIRNAME = 'sin_raiz'
+INDEX_FILE = 'index.json'
+DEFAULT_MAX_MB = 512
+# Entradas de index.json que se conservan (las usadas más recientemente)
+MAX_INDEX_ENTRIES = 20000
+
+_HASH_CHUNK = 1024 * 1024
+
+
+class PageCache:
+    """Páginas convertidas en 'directory', con límite de tamaño 'max_bytes'."""
+
+    # Extensión de los archivos de la caché (las subclases guardan otros formatos)
+    EXTENSION = '.pdf'
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_dirty = False
+
+    # --- Hash de los archivos de origen ---
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self._index_path(), 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                self._index = loaded if isinstance(loaded, dict) else {}
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def content_hash(self, path):
+        """SHA-256 del archivo; se reutiliza el guardado si no cambiaron tamaño ni mtime."""
+        st = os.stat(path)
+        stored_hash = blob_hash(path)
+        if stored_hash:
+            return stored_hash, st.st_size  # Blob del almacén: el nombre es el hash
+        abs_path = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            entry = self._load_index().get(abs_path)
+            if (isinstance(entry, list) and len(entry) == 4
+                    and entry[0] == st.st_size and entry[1] == st.st_mtime_ns):
+                entry[3] = time.time()
+                self._index_dirty = True
+                return entry[2], st.st_size
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._load_index()[abs_path] = [st.st_size, st.st_mtime_ns, content_hash, time.time()]
+            self._index_dirty = True
+        return content_hash, st.st_size
+
+    def key(self, path, *settings):
+        """Clave de la página de 'path' dibujada con 'settings', o None si no se puede leer."""
+        try:
+            content_hash, size = self.content_hash(path)
+        except OSError:
+            return None
+        raw = json.dumps([content_hash, size, list(settings)], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # --- Páginas ---
+
+    def _page_path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.EXTENSION)
+
+    def has(self, key):
+        return key is not None and os.path.exists(self._page_path(key))
+
+    def get(self, key):
+        """Bytes de la página o None. Marca la página como usada (LRU)."""
+        if key is None:
+            return None
+        path = self._page_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        """Guarda la página de forma atómica. Un error de disco no interrumpe la exportación."""
+        if key is None:
+            return
+        path = self._page_path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.page-', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            print(f"No se pudo guardar la página en caché: {e}")
+
+    # --- Mantenimiento ---
+
+    def prune(self):
+        """
+        Borra las páginas menos usadas hasta quedar bajo max_bytes y guarda
+        index.json. Retorna (páginas borradas, bytes liberados).
+        """
+        with self._lock:
+            pages = []
+            total = 0
+            for dirpath, _dirnames, filenames in os.walk(self.directory):
+                for name in filenames:
+                    if not name.endswith(self.EXTENSION):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    pages.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            removed, freed = 0, 0
+            if total > self.max_bytes:
+                for _mtime, size, path in sorted(pages):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    removed += 1
+                    freed += size
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._save_index()
+            return removed, freed
+
+    def clear(self):
+        """Borra todas las páginas y el índice."""
+        with self._lock:
+            max_bytes, self.max_bytes = self.max_bytes, 0
+            try:
+                self.prune()
+            finally:
+                self.max_bytes = max_bytes
+            self._index = {}
+            self._index_dirty = True
+            self._save_index()
+
+    def _save_index(self):
+        if not self._index_dirty or self._index is None:
+            return
+        index = self._index
+        if len(index) > MAX_INDEX_ENTRIES:
+            recent = sorted(index.items(), key=_last_used, reverse=True)[:MAX_INDEX_ENTRIES]
+            index = self._index = dict(recent)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.index-', suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path())
+            self._index_dirty = False
+        except OSError as e:
+            print(f"No se pudo guardar el índice de la caché de anexos: {e}")
+
+
+def _last_used(item):
+    entry = item[1]
+    return entry[3] if isinstance(entry, list) and len(entry) == 4 else 0
+
+
+def local_cache_base():
+    """Carpeta base de las cachés de este usuario ('attachment_cache_dir' en config.json la cambia)."""
+    configured = get_settings().get('attachment_cache_dir')
+    if configured:
+        return os.path.abspath(os.path.expanduser(str(configured)))
+    if os.name == 'nt':
+        base = os.getenv('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.getenv('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(base, APP_CACHE_DIRNAME)
+
+
+def cache_dir_for(attachment_root):
+    """
+    Carpeta de la caché para esa raíz de adjuntos: una subcarpeta de
+    local_cache_base() con el nombre de la raíz y un hash de su ruta, o
+    'sin_raiz' si no hay raíz.
+    """
+    base = local_cache_base()
+    if not attachment_root:
+        return os.path.join(base, NO_ROOT_DIRNAME)
+    root = os.path.abspath(attachment_root)
+    label = re.sub(r'[^A-Za-z0-9_-]+', '_', os.path.basename(root.rstrip('\\/')))[:40] or 'raiz'
+    digest = hashlib.sha1(os.path.normcase(root).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base, 'anexos', f"{label}-{digest}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_page_cache(attachment_root=None):
+    """Instancia compartida de la caché para esa raíz de adjuntos (tamaño: 'page_cache_max_mb')."""
+    directory = os.path.abspath(cache_dir_for(attachment_root))
+    try:
+        max_mb = float(get_settings().get('page_cache_max_mb', DEFAULT_MAX_MB))
+    except (TypeError, ValueError):
+        max_mb = DEFAULT_MAX_MB
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = PageCache(directory)
+        cache.max_bytes = int(max_mb * 1024 * 1024)
+        return cache
@@ -1,7 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
 import report_generator
 import os
+import math
+
+from attachment_index import locate_attachment, resolve_attachment
+from attachment_info import get_attachment_info_index, summarize
+from thumbnail_cache import thumbnail_file
+
+# Lado mayor de la miniatura en el árbol y de la vista previa del anexo seleccionado
+TREE_THUMB_PX = 32
+PREVIEW_PX = 256
+# Cada cuánto se revisan las miniaturas y los metadatos terminados (ms)
+POLL_MS = 100
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{max(size, 1) / 1024:.0f} KB"
+
 
 class PDFOrganizerWindow(tk.Toplevel):
 # En el archivo: pdf_organizer_window.py
@@ -18,13 +37,31 @@ class PDFOrganizerWindow(tk.Toplevel):
         self.year = year
         
         self.attachments_list = [f for f in self.report_data['expense_invoices'] if f.get('attachment_path')]
+        self.attachment_base_path = self.controller.get_setting('attachment_base_path')
+
+        # Miniaturas: se generan en un hilo solo para las filas visibles (tk.PhotoImage
+        # se crea en este hilo); iid -> PNG en caché (o None) / futuro pendiente
+        self._thumb_executor = ThreadPoolExecutor(max_workers=1)
+        self._thumb_files = {}
+        self._thumb_futures = {}
+        self._thumb_images = {}  # referencias para que tkinter no libere las imágenes
+        self._preview_image = None
+        self._closed = False
+        # Metadatos (páginas, tamaño, archivos dañados): se revisan todos en otro hilo
+        # al abrir la ventana; iid -> AttachmentInfo (None si no se encontró) / futuro
+        self._info_executor = ThreadPoolExecutor(max_workers=1)
+        self._infos = {}
+        self._info_futures = {}
 
         self.title("Organizador de Anexos para el Reporte")
-        self.geometry("700x500")
+        self.geometry("900x550")
         self.grab_set()
         
         self._build_ui()
         self._populate_tree()
+        self._start_info_scan()
+        self.bind('<Destroy>', self._on_destroy)
+        self.after(POLL_MS, self._poll_background)
 
     def _build_ui(self):
         main_frame = ttk.Frame(self, padding=10)
@@ -33,14 +70,28 @@ class PDFOrganizerWindow(tk.Toplevel):
         list_frame = ttk.LabelFrame(main_frame, text="Anexos a Incluir (en orden)", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
         
-        columns = ('invoice_number', 'third_party', 'file')
-        self.tree = ttk.Treeview(list_frame, columns=columns, show='headings')
+        columns = ('invoice_number', 'third_party', 'file', 'pages', 'size', 'status')
+        ttk.Style(self).configure('Anexos.Treeview', rowheight=TREE_THUMB_PX + 4)
+        self.tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', style='Anexos.Treeview')
+        self.tree.column('#0', width=TREE_THUMB_PX + 24, stretch=False)
         self.tree.heading('invoice_number', text='No. Factura')
         self.tree.column('invoice_number', width=150)
         self.tree.heading('third_party', text='Proveedor')
         self.tree.column('third_party', width=250)
         self.tree.heading('file', text='Archivo')
+        self.tree.heading('pages', text='Págs.')
+        self.tree.column('pages', width=50, anchor=tk.E, stretch=False)
+        self.tree.heading('size', text='Tamaño')
+        self.tree.column('size', width=70, anchor=tk.E, stretch=False)
+        self.tree.heading('status', text='Estado')
+        self.tree.column('status', width=110, stretch=False)
+        self.tree.tag_configure('problem', foreground='red')
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=lambda first, last: (scrollbar.set(first, last),
+                                                               self._request_visible_thumbnails()))
+        scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
         self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.bind('<<TreeviewSelect>>', lambda _event: self._show_preview())
 
         buttons_frame = ttk.Frame(main_frame, padding=(10, 0))
         buttons_frame.pack(fill=tk.Y, side=tk.LEFT)
@@ -48,9 +99,15 @@ class PDFOrganizerWindow(tk.Toplevel):
         ttk.Button(buttons_frame, text="↑ Subir", command=self._move_up).pack(pady=2, fill=tk.X)
         ttk.Button(buttons_frame, text="↓ Bajar", command=self._move_down).pack(pady=2, fill=tk.X)
         ttk.Button(buttons_frame, text="Excluir", command=self._exclude, style="Accent.TButton").pack(pady=10, fill=tk.X)
+        # Vista previa del anexo seleccionado (desde la caché de miniaturas)
+        self.preview_label = ttk.Label(buttons_frame, text="Sin vista previa", anchor=tk.CENTER,
+                                       width=PREVIEW_PX // 8)
+        self.preview_label.pack(pady=10, fill=tk.BOTH, expand=True)
 
         action_frame = ttk.Frame(self, padding=10)
         action_frame.pack(fill=tk.X)
+        self.summary_label = ttk.Label(action_frame, text="Analizando anexos...")
+        self.summary_label.pack(side=tk.LEFT)
         ttk.Button(action_frame, text="Generar PDF Final", command=self._generate_final_pdf, style="Accent.TButton").pack(side=tk.RIGHT)
         ttk.Button(action_frame, text="Cancelar", command=self.destroy).pack(side=tk.RIGHT, padx=10)
 
@@ -60,7 +117,150 @@ class PDFOrganizerWindow(tk.Toplevel):
         
         for item_data in self.attachments_list:
             file_name = os.path.basename(item_data['attachment_path'])
-            self.tree.insert('', 'end', values=(item_data['invoice_number'], item_data['third_party_name'], file_name), iid=str(item_data['id']))
+            self.tree.insert('', 'end', values=(item_data['invoice_number'], item_data['third_party_name'], file_name, '', '', '...'), iid=str(item_data['id']))
+        self._request_visible_thumbnails()
+
+    def _resolve(self, item_data):
+        """Ruta existente del anexo de la factura (se llama desde los hilos), o None."""
+        relpath = item_data.get('attachment_relpath') or item_data.get('attachment_path')
+        return (locate_attachment(relpath, self.attachment_base_path, item_data.get('attachment_hash'))
+                or resolve_attachment(relpath, self.attachment_base_path))
+
+    # --- Metadatos ---
+
+    def _start_info_scan(self):
+        """Revisa todos los anexos en otro hilo (los ya vistos salen del índice en disco)."""
+        index = get_attachment_info_index(self.attachment_base_path)
+        for item_data in self.attachments_list:
+            self._info_futures[str(item_data['id'])] = self._info_executor.submit(self._info_for, index, item_data)
+        # Último en la cola (un solo hilo): guarda el índice cuando terminaron todos
+        self._info_executor.submit(index.save)
+
+    def _info_for(self, index, item_data):
+        path = self._resolve(item_data)
+        return index.info(path) if path else None
+
+    def _set_row_info(self, iid):
+        if not self.tree.exists(iid):
+            return
+        info = self._infos.get(iid)
+        values = list(self.tree.item(iid, 'values'))[:3]
+        if info is None:
+            values += ['', '', "No encontrado"]
+        else:
+            values += [info.pages if info.ok else '', _format_size(info.size), info.status()]
+        self.tree.item(iid, values=values, tags=() if self._info_ok(iid) else ('problem',))
+
+    def _info_ok(self, iid):
+        info = self._infos.get(iid)
+        return info is not None and info.ok
+
+    def _update_summary(self):
+        iids = [str(item['id']) for item in self.attachments_list]
+        pending = sum(1 for iid in iids if iid in self._info_futures)
+        pages, size, problems = summarize(self._infos[iid] for iid in iids if iid in self._infos)
+        text = f"Anexos: {len(iids)} · {pages} páginas · {_format_size(size)}"
+        if problems:
+            text += f" · {problems} con problemas (no se incluirán)"
+        if pending:
+            text += f" · analizando {len(iids) - pending} de {len(iids)}..."
+        self.summary_label.configure(text=text, foreground='red' if problems else '')
+
+    # --- Miniaturas ---
+
+    def _request_visible_thumbnails(self):
+        """Pide las miniaturas de las filas visibles y descarta las pedidas que ya no se ven."""
+        items = self.tree.get_children()
+        if not items:
+            return
+        first, last = self.tree.yview()
+        visible = items[int(first * len(items)):math.ceil(last * len(items))]
+        for iid in list(self._thumb_futures):
+            if iid not in visible and self._thumb_futures[iid].cancel():
+                del self._thumb_futures[iid]
+        for iid in visible:
+            if iid in self._thumb_files or iid in self._thumb_futures:
+                continue
+            item_data = next((item for item in self.attachments_list if str(item['id']) == iid), None)
+            if item_data is not None:
+                self._thumb_futures[iid] = self._thumb_executor.submit(self._thumbnail_for, item_data)
+
+    def _thumbnail_for(self, item_data):
+        """En el hilo de miniaturas: PNG en caché del anexo de la factura, o None."""
+        path = self._resolve(item_data)
+        return thumbnail_file(path, self.attachment_base_path) if path else None
+
+    def _poll_background(self):
+        if self._closed:
+            return
+        for iid, future in list(self._thumb_futures.items()):
+            if not future.done():
+                continue
+            del self._thumb_futures[iid]
+            try:
+                self._thumb_files[iid] = future.result()
+            except Exception as e:
+                print(f"[WARN] Miniatura del anexo {iid}: {e}")
+                self._thumb_files[iid] = None
+            self._set_tree_thumbnail(iid)
+            if iid == self.tree.focus():
+                self._show_preview()
+        infos_done = False
+        for iid, future in list(self._info_futures.items()):
+            if not future.done():
+                continue
+            del self._info_futures[iid]
+            try:
+                self._infos[iid] = future.result()
+            except Exception as e:
+                print(f"[WARN] Metadatos del anexo {iid}: {e}")
+                self._infos[iid] = None
+            self._set_row_info(iid)
+            infos_done = True
+        if infos_done:
+            self._update_summary()
+        self.after(POLL_MS, self._poll_background)
+
+    def _load_photo(self, png_path, max_px):
+        """tk.PhotoImage del PNG reducido (por un factor entero) a un lado mayor <= max_px."""
+        photo = tk.PhotoImage(master=self, file=png_path)
+        factor = math.ceil(max(photo.width(), photo.height()) / max_px)
+        return photo.subsample(factor) if factor > 1 else photo
+
+    def _set_tree_thumbnail(self, iid):
+        png_path = self._thumb_files.get(iid)
+        if not png_path or not self.tree.exists(iid):
+            return
+        try:
+            photo = self._load_photo(png_path, TREE_THUMB_PX)
+        except tk.TclError:
+            return
+        self._thumb_images[iid] = photo
+        self.tree.item(iid, image=photo)
+
+    def _show_preview(self):
+        iid = self.tree.focus()
+        png_path = self._thumb_files.get(iid)
+        if not png_path:
+            self._preview_image = None
+            text = "Cargando..." if iid in self._thumb_futures else "Sin vista previa"
+            self.preview_label.configure(image='', text=text)
+            return
+        try:
+            self._preview_image = self._load_photo(png_path, PREVIEW_PX)
+        except tk.TclError:
+            self._preview_image = None
+            self.preview_label.configure(image='', text="Sin vista previa")
+            return
+        self.preview_label.configure(image=self._preview_image, text='')
+
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self._closed = True
+            for future in list(self._thumb_futures.values()) + list(self._info_futures.values()):
+                future.cancel()
+            self._thumb_executor.shutdown(wait=False)
+            self._info_executor.shutdown(wait=False)
 
     def _move_up(self):
         selected_item = self.tree.focus()
@@ -90,8 +290,24 @@ class PDFOrganizerWindow(tk.Toplevel):
         
         self.tree.delete(selected_item)
         self.attachments_list = [item for item in self.attachments_list if str(item['id']) != selected_item]
+        self._thumb_images.pop(selected_item, None)
+        self._request_visible_thumbnails()
+        self._update_summary()
 
     def _generate_final_pdf(self):
+        # Antes de elegir el archivo: avisar de los anexos que la exportación omitirá
+        problems = [item for item in self.attachments_list
+                    if str(item['id']) in self._infos and not self._info_ok(str(item['id']))]
+        if problems:
+            numbers = ", ".join(str(item['invoice_number']) for item in problems[:10])
+            if not messagebox.askyesno(
+                    "Anexos con problemas",
+                    f"{len(problems)} anexo(s) no se pueden incluir (no encontrados, dañados, con "
+                    f"contraseña o de tipo no soportado): {numbers}"
+                    f"{'...' if len(problems) > 10 else ''}\n\n¿Generar el PDF sin ellos?",
+                    parent=self):
+                return
+
         save_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("Archivos PDF", "*.pdf")],
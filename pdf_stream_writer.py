@@ -0,0 +1,171 @@
+"""
+Escritor de PDF por flujo para unir documentos sin tenerlos todos en memoria.
+
+pypdf.PdfWriter conserva cada página y cada imagen agregada hasta el write()
+final, así que un reporte con cientos de anexos ocupa en RAM todo el archivo
+resultante. StreamingPdfWriter escribe al archivo de salida los objetos de cada
+página en cuanto se agrega el documento (renumerados), y solo guarda en memoria
+la tabla de desplazamientos (xref) y la lista de páginas.
+
+    with open(path, "wb") as out:
+        writer = StreamingPdfWriter(out)
+        writer.append(PdfReader(io.BytesIO(data)))
+        writer.append(PdfReader("anexo.pdf", strict=False))
+        writer.close()
+
+No copia marcadores (outlines) ni formularios del documento de origen; solo las
+páginas con todo lo que referencian (contenido, recursos, imágenes, anotaciones).
+"""
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, StreamObject, NameObject,
+)
+
+_PARENT = NameObject("/Parent")
+
+
+class StreamingPdfWriter:
+    """Escribe un PDF nuevo en 'stream' agregando páginas de otros documentos."""
+
+    PAGES_ID = 1
+    CATALOG_ID = 2
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._offsets = {}
+        self._next_id = 3
+        self._page_ids = []
+        self._closed = False
+        self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _new_id(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def append(self, reader):
+        """
+        Agrega todas las páginas de un PdfReader (que puede descartarse después).
+        Si el documento falla a mitad de camino se deshace lo escrito y se relanza el error.
+        """
+        start = self.stream.tell()
+        next_id, page_count = self._next_id, len(self._page_ids)
+        try:
+            self._append(reader)
+        except Exception:
+            self.stream.seek(start)
+            self.stream.truncate()
+            for object_id in range(next_id, self._next_id):
+                self._offsets.pop(object_id, None)
+            self._next_id = next_id
+            del self._page_ids[page_count:]
+            raise
+
+    def _append(self, reader):
+        if getattr(reader, "is_encrypted", False):
+            # Los PDF protegidos solo con contraseña de permisos se abren con ""
+            reader.decrypt("")
+        pages = list(reader.pages)
+        # Ids nuevos para todas las páginas antes de escribir: así los enlaces
+        # internos (/Dest, /P) apuntan a la copia y no arrastran la página de nuevo
+        remap = {}
+        for page in pages:
+            page_id = self._new_id()
+            ref = page.indirect_reference
+            if ref is not None:
+                remap[(ref.idnum, ref.generation)] = page_id
+            self._page_ids.append(page_id)
+
+        pending = []
+        for page, page_id in zip(pages, self._page_ids[-len(pages):]):
+            self._write_object(page_id, page, remap, pending, is_page=True)
+            while pending:
+                object_id, obj = pending.pop()
+                self._write_object(object_id, obj, remap, pending)
+
+    def _write_object(self, object_id, obj, remap, pending, is_page=False):
+        out = self.stream
+        self._offsets[object_id] = out.tell()
+        out.write(b"%d 0 obj\n" % object_id)
+        if is_page:
+            self._write_dict(obj, remap, pending, extra={_PARENT: b"%d 0 R" % self.PAGES_ID})
+        else:
+            self._write_value(obj, remap, pending)
+        out.write(b"\nendobj\n")
+
+    def _ref(self, indirect, remap, pending):
+        key = (indirect.idnum, indirect.generation)
+        object_id = remap.get(key)
+        if object_id is None:
+            object_id = remap[key] = self._new_id()
+            pending.append((object_id, indirect.get_object()))
+        return b"%d 0 R" % object_id
+
+    def _write_value(self, value, remap, pending):
+        out = self.stream
+        if isinstance(value, IndirectObject):
+            out.write(self._ref(value, remap, pending))
+        elif isinstance(value, StreamObject):
+            data = value._data
+            if not isinstance(data, bytes):
+                data = bytes(data)
+            self._write_dict(value, remap, pending, extra={NameObject("/Length"): b"%d" % len(data)})
+            out.write(b"\nstream\n")
+            out.write(data)
+            out.write(b"\nendstream")
+        elif isinstance(value, DictionaryObject):
+            self._write_dict(value, remap, pending)
+        elif isinstance(value, ArrayObject):
+            out.write(b"[")
+            for item in value:
+                out.write(b" ")
+                self._write_value(item, remap, pending)
+            out.write(b" ]")
+        else:
+            value.write_to_stream(out)
+
+    def _write_dict(self, dictionary, remap, pending, extra=None):
+        out = self.stream
+        out.write(b"<<")
+        # Las anotaciones con /Rect usan /P para su página: se omite (es opcional)
+        skip_p = "/Rect" in dictionary
+        for key, value in dictionary.items():
+            if key == _PARENT or (extra and key in extra) or (skip_p and key == "/P"):
+                continue
+            out.write(b"\n")
+            NameObject(key).write_to_stream(out)
+            out.write(b" ")
+            self._write_value(value, remap, pending)
+        for key, raw in (extra or {}).items():
+            out.write(b"\n")
+            key.write_to_stream(out)
+            out.write(b" " + raw)
+        out.write(b"\n>>")
+
+    def close(self):
+        """Escribe el árbol de páginas, el catálogo, la tabla xref y el trailer."""
+        if self._closed:
+            return
+        self._closed = True
+        out = self.stream
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids)
+        self._offsets[self.PAGES_ID] = out.tell()
+        out.write(b"%d 0 obj\n<< /Type /Pages /Kids [ %s ] /Count %d >>\nendobj\n"
+                  % (self.PAGES_ID, kids, len(self._page_ids)))
+        self._offsets[self.CATALOG_ID] = out.tell()
+        out.write(b"%d 0 obj\n<< /Type /Catalog /Pages %d 0 R >>\nendobj\n" % (self.CATALOG_ID, self.PAGES_ID))
+
+        xref_offset = out.tell()
+        size = self._next_id
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for object_id in range(1, size):
+            offset = self._offsets.get(object_id)
+            if offset is None:
+                out.write(b"0000000000 65535 f \n")
+            else:
+                out.write(b"%010d 00000 n \n" % offset)
+        out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                  % (size, self.CATALOG_ID, xref_offset))
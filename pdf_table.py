@@ -0,0 +1,227 @@
+"""
+Tablas grandes para los reportes PDF (fpdf2) sin una llamada a cell() por celda.
+
+FPDF.cell() procesa cada texto (normalización, fragmentos, borde, relleno, salto
+automático de página), y eso domina el tiempo de un reporte anual con decenas de
+miles de filas. PdfTable trabaja por columnas y dibuja con primitivas:
+
+- Cada columna se formatea de una vez (su formatter sobre todos los valores).
+- Los anchos de texto salen de la tabla de anchos de la fuente, sin get_string_width
+  por celda. Solo se miden los textos que podrían no caber en su columna.
+- Los textos largos se recortan con '...' o, con overflow='wrap', se parten en
+  hasta max_lines renglones.
+- Cada fila es un rect() de relleno (alternado), text() por celda y una línea
+  inferior. Las líneas verticales se trazan una vez por página.
+- El salto de página se calcula aquí y el encabezado se repite en cada página.
+
+    table = PdfTable(pdf, [
+        TableColumn('Fecha', 15),
+        TableColumn('Empresa', 45),
+        TableColumn('Total (RD$)', 15, 'R', lambda v: f"{v:,.2f}"),
+    ], overflow='wrap')
+    table.render(rows)          # rows: secuencias con un valor por columna
+"""
+from collections import namedtuple
+
+# Encabezado, ancho (% del ancho útil de la página), alineación ('L', 'C', 'R') y
+# función que convierte el valor en texto
+TableColumn = namedtuple('TableColumn', ('header', 'width', 'align', 'formatter'), defaults=('L', str))
+
+ELLIPSIS = '...'
+HEADER_FILL = (220, 220, 220)
+ROW_FILL_ALT = (245, 245, 245)
+
+
+def _latin1(text):
+    """Las fuentes estándar de PDF solo tienen Latin-1: el resto se reemplaza por '?'."""
+    if text.isascii():
+        return text
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+class PdfTable:
+    """Tabla con encabezado repetido por página para un FPDF ya creado (con una página abierta)."""
+
+    def __init__(self, pdf, columns, row_height=6, font=('Arial', '', 8), header_font=('Arial', 'B', 9),
+                 header_height=8, header_fill=HEADER_FILL, alt_fill=ROW_FILL_ALT,
+                 overflow='truncate', max_lines=2):
+        self.pdf = pdf
+        self.columns = [c if isinstance(c, TableColumn) else TableColumn(*c) for c in columns]
+        self.row_height = row_height
+        self.font = font
+        self.header_font = header_font
+        self.header_height = header_height
+        self.header_fill = header_fill
+        self.alt_fill = alt_fill
+        self.overflow = overflow
+        self.max_lines = max(1, int(max_lines)) if overflow == 'wrap' else 1
+
+    # --- Medición ---
+
+    def _width_function(self):
+        """
+        Función texto -> ancho (unidades de la página) con la fuente actual. Con las
+        fuentes estándar suma la tabla de anchos por carácter; con fuentes TTF usa
+        get_string_width.
+        """
+        pdf = self.pdf
+        cw = getattr(pdf.current_font, 'cw', None)
+        if not isinstance(cw, dict):
+            return pdf.get_string_width, None
+        scale = pdf.font_size / 1000.0
+        default = cw.get('?', 500)
+        # Ancho por byte Latin-1: los textos ya pasaron por _latin1, así que map() en C
+        # sobre los bytes reemplaza la búsqueda carácter por carácter
+        by_byte = [cw.get(chr(code), default) * scale for code in range(256)].__getitem__
+
+        def width(text):
+            return sum(map(by_byte, text.encode('latin-1')))
+
+        return width, max(cw.values()) * scale
+
+    def _fit(self, text, available, width):
+        """Recorta 'text' con '...' para que quepa en 'available'."""
+        if width(text) <= available:
+            return text
+        room = available - width(ELLIPSIS)
+        # Búsqueda binaria sobre la cantidad de caracteres que caben
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if width(text[:mid]) <= room:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo].rstrip() + ELLIPSIS
+
+    def _wrap(self, text, available, width):
+        """Parte 'text' en palabras hasta max_lines renglones; el último se recorta si sobra."""
+        lines, current = [], ''
+        words = text.split(' ')
+        for index, word in enumerate(words):
+            candidate = f"{current} {word}" if current else word
+            if width(candidate) <= available:
+                current = candidate
+                continue
+            if current:
+                lines.append(current)
+            current = word
+            if len(lines) == self.max_lines - 1:
+                current = ' '.join([current] + words[index + 1:])
+                break
+        lines.append(current)
+        lines[-1] = self._fit(lines[-1], available, width)
+        return [self._fit(line, available, width) for line in lines[:-1]] + lines[-1:]
+
+    def _layout(self, rows, col_widths):
+        """
+        Formatea y ajusta todas las celdas columna por columna.
+        Retorna (celdas por columna, renglones por fila): cada celda es una lista de
+        renglones [(texto, ancho o None si no hace falta)].
+        """
+        pdf = self.pdf
+        pdf.set_font(*self.font)
+        width, max_char = self._width_function()
+        padding = 2 * pdf.c_margin
+        row_lines = [1] * len(rows)
+        cells = []
+        for index, column in enumerate(self.columns):
+            formatter = column.formatter
+            texts = [_latin1('' if row[index] is None else formatter(row[index])) for row in rows]
+            available = col_widths[index] - padding
+            measure_all = column.align != 'L'
+            laid_out = []
+            for r, text in enumerate(texts):
+                # Si ni con el carácter más ancho se pasa del ancho, no hace falta medir
+                fits_surely = max_char is not None and len(text) * max_char <= available
+                if fits_surely and not measure_all:
+                    laid_out.append(((text, None),))
+                    continue
+                text_width = width(text)
+                if text_width <= available:
+                    laid_out.append(((text, text_width),))
+                elif self.max_lines > 1 and ' ' in text:
+                    lines = self._wrap(text, available, width)
+                    laid_out.append(tuple((line, width(line)) for line in lines))
+                    if len(lines) > row_lines[r]:
+                        row_lines[r] = len(lines)
+                else:
+                    fitted = self._fit(text, available, width)
+                    laid_out.append(((fitted, width(fitted)),))
+            cells.append(laid_out)
+        return cells, row_lines
+
+    # --- Dibujo ---
+
+    def _draw_header(self, col_widths):
+        pdf = self.pdf
+        pdf.set_font(*self.header_font)
+        pdf.set_fill_color(*self.header_fill)
+        for column, col_width in zip(self.columns, col_widths):
+            pdf.cell(col_width, self.header_height, _latin1(str(column.header)), border=1, align='C', fill=True)
+        pdf.ln(self.header_height)
+        pdf.set_font(*self.font)
+        pdf.set_fill_color(*self.alt_fill)
+        return pdf.get_y()
+
+    def _draw_verticals(self, x_edges, top, bottom):
+        if bottom > top:
+            for x in x_edges:
+                self.pdf.line(x, top, x, bottom)
+
+    def render(self, rows, title=None, title_font=('Arial', 'B', 12)):
+        """Dibuja el título (opcional), el encabezado y todas las filas. Deja el cursor debajo."""
+        pdf = self.pdf
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        page_width = pdf.w - pdf.l_margin - pdf.r_margin
+        col_widths = [column.width / 100.0 * page_width for column in self.columns]
+        x_edges = [pdf.l_margin]
+        for col_width in col_widths:
+            x_edges.append(x_edges[-1] + col_width)
+        table_width = x_edges[-1] - pdf.l_margin
+
+        if title:
+            pdf.set_font(*title_font)
+            pdf.cell(0, 10, _latin1(title), new_x='LMARGIN', new_y='NEXT')
+
+        cells, row_lines = self._layout(rows, col_widths)
+
+        # El salto de página se decide aquí (text() y rect() no lo disparan)
+        auto_break, break_margin = pdf.auto_page_break, pdf.b_margin
+        pdf.set_auto_page_break(False, margin=break_margin)
+        try:
+            if pdf.get_y() + self.header_height + self.row_height > pdf.page_break_trigger:
+                pdf.add_page()
+            y = top = self._draw_header(col_widths)
+            line_height = self.row_height
+            baseline = line_height / 2.0 + 0.3 * pdf.font_size
+            c_margin = pdf.c_margin
+            left = pdf.l_margin
+            right = left + table_width
+            text = pdf.text
+            for r in range(len(rows)):
+                height = line_height * row_lines[r]
+                if y + height > pdf.page_break_trigger:
+                    self._draw_verticals(x_edges, top, y)
+                    pdf.add_page()
+                    y = top = self._draw_header(col_widths)
+                if r % 2:
+                    pdf.rect(left, y, table_width, height, style='F')
+                for index, column in enumerate(self.columns):
+                    x0, x1 = x_edges[index], x_edges[index + 1]
+                    for j, (content, content_width) in enumerate(cells[index][r]):
+                        if not content:
+                            continue
+                        if column.align == 'R':
+                            x = x1 - c_margin - content_width
+                        elif column.align == 'C':
+                            x = x0 + (x1 - x0 - content_width) / 2.0
+                        else:
+                            x = x0 + c_margin
+                        text(x, y + j * line_height + baseline, content)
+                y += height
+                pdf.line(left, y, right, y)
+            self._draw_verticals(x_edges, top, y)
+            pdf.set_y(y)
+        finally:
+            pdf.set_auto_page_break(auto_break, margin=break_margin)
@@ -0,0 +1,375 @@
+"""
+Instrumentación opcional de LogicControllerQt: tiempos por método y por sentencia SQL.
+
+- Cada método público del controlador se envuelve para contar llamadas, medir
+  su duración (p50/p95) y las filas que retorna.
+- Cada sentencia SQL se mide a través de una conexión/cursor propios
+  (InstrumentedConnection), incluyendo el tiempo de lectura de filas.
+- Las sentencias que superan el umbral ('slow_query_ms') se escriben, con su
+  EXPLAIN QUERY PLAN, en un log rotativo (slow_queries.log por defecto).
+
+Está desactivada por defecto. Se activa con "diagnostics_enabled": true en
+config.json o con la variable de entorno FACTURAS_QUERY_STATS=1. Las
+estadísticas se ven en Opciones > Diagnóstico y con
+'python db_maintenance.py query-stats'.
+"""
+import os
+import json
+import time
+import sqlite3
+import inspect
+import logging
+import datetime
+import functools
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+SLOW_LOG_FILE = "slow_queries.log"
+STATS_FILE = "query_stats.json"
+DEFAULT_SLOW_MS = 100.0
+ENV_FLAG = "FACTURAS_QUERY_STATS"
+
+# Muestras guardadas por clave para calcular percentiles (las más recientes)
+_SAMPLES = 2048
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+slow_logger = logging.getLogger("facturas.slow_queries")
+slow_logger.propagate = False
+
+
+def is_enabled(settings):
+    """True si la instrumentación está activada (variable de entorno o config.json)."""
+    flag = os.environ.get(ENV_FLAG)
+    if flag is not None:
+        return flag.strip().lower() not in ("", "0", "false", "no")
+    return bool(settings.get("diagnostics_enabled", False))
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+def _count_rows(result):
+    """Filas de un resultado del controlador: una lista, o las listas dentro de un dict."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        lists = [v for v in result.values() if isinstance(v, list)]
+        if lists:
+            return sum(len(v) for v in lists)
+    return 0
+
+
+class _Sample:
+    """Una ejecución: duración acumulada (s) y filas leídas; se completa al leer filas."""
+    __slots__ = ("elapsed", "rows", "logged")
+
+    def __init__(self, elapsed, rows):
+        self.elapsed = elapsed
+        self.rows = rows
+        self.logged = False
+
+
+class _Bucket:
+    __slots__ = ("count", "errors", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.samples = deque(maxlen=_SAMPLES)
+
+    def summary(self):
+        samples = list(self.samples)
+        times = sorted(s.elapsed for s in samples)
+        rows = sum(s.rows for s in samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": _percentile(times, 0.50) * 1000.0,
+            "p95_ms": _percentile(times, 0.95) * 1000.0,
+            "max_ms": (times[-1] if times else 0.0) * 1000.0,
+            "total_ms": sum(times) * 1000.0,
+            "avg_rows": rows / len(samples) if samples else 0.0,
+        }
+
+
+class QueryStats:
+    """Acumula las métricas de métodos y sentencias SQL (seguro entre hilos)."""
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, log_path=SLOW_LOG_FILE, max_log_bytes=1_000_000, log_backups=3):
+        self.slow_ms = float(slow_ms)
+        self.log_path = log_path
+        self.started = datetime.datetime.now()
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._statements = {}
+        self._sql_keys = {}
+        self._plans = {}
+        self._setup_log(max_log_bytes, log_backups)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(slow_ms=settings.get("slow_query_ms", DEFAULT_SLOW_MS),
+                   log_path=settings.get("slow_query_log", SLOW_LOG_FILE))
+
+    def _setup_log(self, max_bytes, backups):
+        if not self.log_path:
+            return
+        target = os.path.abspath(self.log_path)
+        for handler in slow_logger.handlers:
+            if getattr(handler, "baseFilename", None) == target:
+                return
+        handler = RotatingFileHandler(target, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+
+    # ------------------------
+    # Métodos del controlador
+    # ------------------------
+    def instrument(self, obj):
+        """Envuelve los métodos públicos de 'obj' (en la instancia, no en la clase)."""
+        for name, attr in inspect.getmembers(type(obj)):
+            if name.startswith("_") or not inspect.isfunction(attr):
+                continue
+            setattr(obj, name, self._wrap_method(f"{type(obj).__name__}.{name}", getattr(obj, name)))
+        return obj
+
+    def _wrap_method(self, key, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._add(self._methods, key, time.perf_counter() - started, _count_rows(result), failed)
+        return wrapper
+
+    # ------------------------
+    # Sentencias SQL
+    # ------------------------
+    def connection_factory(self):
+        """Clase de conexión para sqlite3.connect(factory=...) que mide cada sentencia."""
+        stats = self
+
+        class _Cursor(InstrumentedCursor):
+            pass
+        _Cursor.stats = stats
+
+        class _Connection(InstrumentedConnection):
+            cursor_class = _Cursor
+        return _Connection
+
+    def _sql_key(self, sql):
+        key = self._sql_keys.get(sql)
+        if key is None:
+            key = self._sql_keys[sql] = _normalize_sql(sql)
+        return key
+
+    def _add(self, table, key, elapsed, rows, failed=False):
+        sample = _Sample(elapsed, rows)
+        with self._lock:
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = _Bucket()
+            bucket.count += 1
+            if failed:
+                bucket.errors += 1
+            bucket.samples.append(sample)
+        return sample
+
+    def record_statement(self, sql, elapsed, rows, failed=False):
+        return self._add(self._statements, self._sql_key(sql), elapsed, rows, failed)
+
+    def check_slow(self, cursor, sql, parameters, sample):
+        """Registra la sentencia en el log lento (con su plan) la primera vez que supera el umbral."""
+        if sample.logged or sample.elapsed * 1000.0 < self.slow_ms:
+            return
+        sample.logged = True
+        key = self._sql_key(sql)
+        plan = self._plans.get(key)
+        if plan is None and key.split(" ", 1)[0].upper() in _EXPLAINABLE:
+            plan = self._plans[key] = _explain(cursor.connection, sql, parameters)
+        lines = [f"{sample.elapsed * 1000.0:.1f} ms, {sample.rows} filas: {key}"]
+        lines.extend(f"    {step}" for step in plan or ())
+        slow_logger.info("\n".join(lines))
+
+    # ------------------------
+    # Consulta y persistencia
+    # ------------------------
+    def snapshot(self):
+        """Dict con el resumen de métodos y sentencias (apto para JSON)."""
+        with self._lock:
+            methods = {k: b.summary() for k, b in self._methods.items()}
+            statements = {k: b.summary() for k, b in self._statements.items()}
+            plans = dict(self._plans)
+        for key, plan in plans.items():
+            if key in statements:
+                statements[key]["plan"] = plan
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "taken": datetime.datetime.now().isoformat(timespec="seconds"),
+            "slow_ms": self.slow_ms,
+            "methods": methods,
+            "statements": statements,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._statements.clear()
+            self._plans.clear()
+            self.started = datetime.datetime.now()
+
+    def save(self, path=STATS_FILE):
+        """Guarda el resumen en JSON (lo lee 'db_maintenance.py query-stats --saved')."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def _explain(conn, sql, parameters):
+    try:
+        # Cursor base: el EXPLAIN no se mide ni se registra a sí mismo
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        return [row[3] for row in rows]
+    except (sqlite3.Error, ValueError) as e:
+        return [f"(sin plan: {e})"]
+
+
+def full_scans(snapshot):
+    """Sentencias cuyo plan conocido recorre una tabla completa ('SCAN <tabla>')."""
+    return [key for key, info in snapshot.get("statements", {}).items()
+            if any(step.startswith("SCAN ") and step != "SCAN CONSTANT ROW" for step in info.get("plan", ()))]
+
+
+def format_snapshot(snapshot, limit=30):
+    """Texto tabular del resumen (para la consola)."""
+    lines = [f"Desde {snapshot['started']} hasta {snapshot['taken']} (umbral lento: {snapshot['slow_ms']:.0f} ms)", ""]
+
+    def _table(title, entries, width):
+        lines.append(title)
+        lines.append(f"{'llamadas':>9} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9} {'filas':>8}  nombre")
+        ordered = sorted(entries.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+        for name, info in ordered[:limit]:
+            label = name if len(name) <= width else name[:width - 3] + "..."
+            lines.append(f"{info['count']:>9} {info['p50_ms']:>9.2f} {info['p95_ms']:>9.2f} "
+                         f"{info['max_ms']:>9.2f} {info['avg_rows']:>8.1f}  {label}")
+        if len(ordered) > limit:
+            lines.append(f"... y {len(ordered) - limit} más")
+        lines.append("")
+
+    _table("Métodos del controlador (por tiempo total)", snapshot.get("methods", {}), 80)
+    _table("Sentencias SQL (por tiempo total)", snapshot.get("statements", {}), 120)
+
+    scans = full_scans(snapshot)
+    if scans:
+        lines.append("Sentencias lentas que recorren una tabla completa:")
+        for key in scans:
+            lines.append(f"  {key}")
+            for step in snapshot["statements"][key]["plan"]:
+                lines.append(f"      {step}")
+    return "\n".join(lines)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mide execute/executemany y la lectura de filas."""
+
+    stats = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(sql, parameters)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            rows = max(self.rowcount, 0)
+            self._sample = self.stats.record_statement(sql, elapsed, rows, failed)
+            self._sql = (sql, parameters)
+            # Las consultas con filas se evalúan al leerlas (el tiempo real incluye el fetch)
+            if not failed and self.description is None:
+                self.stats.check_slow(self, sql, parameters, self._sample)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+            failed = False
+            return result
+        finally:
+            self._sample = self.stats.record_statement(sql, time.perf_counter() - started,
+                                                       max(self.rowcount, 0), failed)
+            self._sql = None
+
+    def _fetched(self, started, rows, check=True):
+        sample = getattr(self, "_sample", None)
+        if sample is None:
+            return
+        sample.elapsed += time.perf_counter() - started
+        sample.rows += rows
+        if check and self._sql is not None:
+            self.stats.check_slow(self, self._sql[0], self._sql[1], sample)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1, check=False)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexión cuyos cursores (incluidos los de conn.execute) son InstrumentedCursor."""
+
+    cursor_class = InstrumentedCursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    # conn.execute() de sqlite3 crea un cursor base sin pasar por cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,298 @@
+"""
+Generación por lotes de los reportes mensuales (PDF y Excel), sin interfaz gráfica.
+
+Arma de una vez el paquete de cierre de mes: un PDF con anexos y un Excel por
+cada empresa y mes elegidos, repartidos entre varios procesos. Al final escribe
+manifest.json con los archivos generados, los tiempos y los anexos que no se
+encontraron. No importa PyQt6: corre en un servidor o en una tarea programada.
+
+Uso:
+    python report_batch.py [--db ruta.db] [--out carpeta] [--companies 1,3|todas]
+                           [--formats pdf,xlsx] [--workers N] [--root carpeta]
+                           [--include-empty] [--no-page-cache] [--imputacion] [PERÍODO ...]
+
+PERÍODO es 'AAAA-MM' o un rango 'AAAA-MM:AAAA-MM'; por defecto, el mes anterior.
+--companies acepta ids o nombres separados por coma. Con --imputacion los meses
+son de imputación en lugar de fecha de factura.
+
+    python report_batch.py --out cierre_2024 2024-01:2024-12
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import calendar
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logic_qt import LogicControllerQt
+from settings_service import get_settings
+import report_generator
+import excel_export
+
+FORMATS = ("pdf", "xlsx")
+MANIFEST_FILE = "manifest.json"
+# Anexos faltantes que se listan por reporte en el manifiesto (el conteo es completo)
+MAX_MISSING_LISTED = 50
+
+# Controlador de cada proceso (se abre una vez en _init_worker)
+_controller = None
+
+
+def _default_db_path():
+    return get_settings().get("facturas_config", "database.db")
+
+
+def _previous_month(today=None):
+    first = (today or datetime.date.today()).replace(day=1)
+    last = first - datetime.timedelta(days=1)
+    return last.year, last.month
+
+
+def parse_periods(values):
+    """['2024-01', '2024-03:2024-05'] -> [(2024, 1), (2024, 3), (2024, 4), (2024, 5)] sin repetidos."""
+    periods = []
+    for value in values:
+        start, _, end = str(value).partition(":")
+        try:
+            y1, m1 = (int(part) for part in start.split("-"))
+            y2, m2 = (int(part) for part in (end or start).split("-"))
+        except ValueError:
+            raise ValueError(f"Período inválido: '{value}' (se espera AAAA-MM o AAAA-MM:AAAA-MM)")
+        if not (1 <= m1 <= 12 and 1 <= m2 <= 12) or (y1, m1) > (y2, m2):
+            raise ValueError(f"Período inválido: '{value}'")
+        year, month = y1, m1
+        while (year, month) <= (y2, m2):
+            if (year, month) not in periods:
+                periods.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+def select_companies(companies, spec):
+    """Filtra las empresas por ids o nombres ('1,3' o 'Empresa A'); 'todas' o vacío = todas."""
+    if not spec or spec.strip().lower() in ("todas", "all"):
+        return list(companies)
+    wanted = [part.strip() for part in spec.split(",") if part.strip()]
+    selected = []
+    for item in wanted:
+        match = [c for c in companies if str(c["id"]) == item or (c["name"] or "").lower() == item.lower()]
+        if not match:
+            raise ValueError(f"Empresa no encontrada: '{item}'")
+        selected.extend(c for c in match if c not in selected)
+    return selected
+
+
+def _safe_name(text):
+    """Nombre de archivo válido en Windows y Linux."""
+    cleaned = "".join("_" if ch in '<>:"/\\|?*' or ord(ch) < 32 else ch for ch in str(text))
+    return cleaned.strip().replace(" ", "_") or "empresa"
+
+
+def _init_worker(db_path):
+    global _controller
+    _controller = LogicControllerQt(db_path)
+
+
+def run_report(task):
+    """
+    Genera los archivos de una empresa y un mes. Corre en un proceso del pool
+    (o en el principal con --workers 1). Retorna la entrada del manifiesto.
+    """
+    controller = _controller
+    company_id, company_name = task["company_id"], task["company_name"]
+    year, month = task["year"], task["month"]
+    date_field = task["date_field"]
+    entry = {
+        "company_id": company_id, "company": company_name, "year": year, "month": month,
+        "invoices": 0, "files": {}, "seconds": {}, "missing_attachments": 0, "missing": [], "errors": [],
+    }
+    started = time.perf_counter()
+
+    report_data = controller.get_monthly_report_data(company_id, month, year, date_field)
+    if report_data is None:
+        entry["errors"].append("No se pudieron leer los datos del reporte.")
+        entry["seconds"]["total"] = round(time.perf_counter() - started, 3)
+        return entry
+    entry["invoices"] = len(report_data["emitted_invoices"]) + len(report_data["expense_invoices"])
+    if not entry["invoices"] and not task["include_empty"]:
+        entry["skipped"] = True
+        entry["seconds"]["total"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    suffix = "_imputacion" if date_field == "imputation_date" else ""
+    base = os.path.join(task["out_dir"], f"Reporte_{_safe_name(company_name)}_{year}-{month:02d}{suffix}")
+    if "pdf" in task["formats"]:
+        t0 = time.perf_counter()
+        missing = []
+        ok, message = report_generator.generate_professional_pdf(
+            report_data, base + ".pdf", company_name, str(month), str(year), task["root"],
+            use_page_cache=task["page_cache"], image_workers=task["image_workers"],
+            missing_attachments=missing, date_field=date_field)
+        entry["seconds"]["pdf"] = round(time.perf_counter() - t0, 3)
+        entry["missing_attachments"] = len(missing)
+        entry["missing"] = [{"invoice_number": number, "attachment": ref}
+                            for number, ref in missing[:MAX_MISSING_LISTED]]
+        if ok:
+            entry["files"]["pdf"] = base + ".pdf"
+        else:
+            entry["errors"].append(message)
+
+    if "xlsx" in task["formats"]:
+        t0 = time.perf_counter()
+        last_day = calendar.monthrange(year, month)[1]
+        ok, message = excel_export.export_report_excel(
+            controller, base + ".xlsx", company_id,
+            f"{year}-{month:02d}-01", f"{year}-{month:02d}-{last_day:02d}", date_field=date_field)
+        entry["seconds"]["xlsx"] = round(time.perf_counter() - t0, 3)
+        if ok:
+            entry["files"]["xlsx"] = base + ".xlsx"
+        else:
+            entry["errors"].append(message)
+
+    entry["seconds"]["total"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def _run_tasks(db_path, tasks, workers):
+    """Ejecuta las tareas (en paralelo si workers > 1) y va imprimiendo el avance."""
+    results = []
+
+    def _report(entry):
+        results.append(entry)
+        status = "omitido (sin facturas)" if entry.get("skipped") else (
+            "ERROR" if entry["errors"] else f"{entry['seconds'].get('total', 0):.1f}s")
+        print(f"[{len(results)}/{len(tasks)}] {entry['company']} {entry['year']}-{entry['month']:02d}: {status}",
+              flush=True)
+
+    if workers <= 1:
+        _init_worker(db_path)
+        try:
+            for task in tasks:
+                _report(run_report(task))
+        finally:
+            _controller.close_connection()
+        return results
+
+    # 'spawn' como en report_generator._image_pool: cada proceso abre su propia conexión
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(db_path,)) as pool:
+        futures = {pool.submit(run_report, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                _report(future.result())
+            except Exception as e:
+                task = futures[future]
+                _report({"company_id": task["company_id"], "company": task["company_name"],
+                         "year": task["year"], "month": task["month"], "invoices": 0, "files": {},
+                         "seconds": {}, "missing_attachments": 0, "missing": [], "errors": [str(e)]})
+    return results
+
+
+def write_manifest(path, manifest):
+    """Guarda el manifiesto de forma atómica (archivo temporal + reemplazo)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Genera los reportes mensuales (PDF y Excel) por lotes.")
+    parser.add_argument("periods", nargs="*", metavar="PERÍODO",
+                        help="AAAA-MM o AAAA-MM:AAAA-MM (por defecto, el mes anterior)")
+    parser.add_argument("--db", help="ruta de la base de datos (por defecto la de config.json)")
+    parser.add_argument("--out", default="reportes", help="carpeta de salida (se crea si no existe)")
+    parser.add_argument("--companies", default="todas", help="ids o nombres separados por coma")
+    parser.add_argument("--formats", default="pdf,xlsx", help="pdf, xlsx o ambos separados por coma")
+    parser.add_argument("--workers", type=int, default=0, help="procesos en paralelo (por defecto, núcleos)")
+    parser.add_argument("--root", help="raíz de adjuntos (por defecto la configurada)")
+    parser.add_argument("--include-empty", action="store_true", help="generar también los meses sin facturas")
+    parser.add_argument("--no-page-cache", action="store_true", help="no usar la caché de páginas de anexos")
+    parser.add_argument("--imputacion", action="store_true", help="meses por fecha de imputación")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    formats = tuple(f.strip().lower() for f in args.formats.split(",") if f.strip())
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown or not formats:
+        print(f"[ERROR] Formato no soportado: {', '.join(unknown) or args.formats}")
+        return 1
+    try:
+        periods = parse_periods(args.periods) if args.periods else [_previous_month()]
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+
+    db_path = os.path.abspath(args.db or _default_db_path())
+    if not os.path.exists(db_path):
+        print(f"[ERROR] No existe la base de datos: {db_path}")
+        return 1
+
+    # El proceso principal aplica las migraciones una sola vez y arma la lista de tareas
+    controller = LogicControllerQt(db_path)
+    if not controller.conn:
+        return 1
+    try:
+        companies = select_companies(controller.get_companies(), args.companies)
+        root = args.root or controller.get_attachment_base_path()
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    finally:
+        controller.close_connection()
+
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [{
+        "company_id": company["id"], "company_name": company["name"], "year": year, "month": month,
+        "out_dir": out_dir, "formats": formats, "root": root, "include_empty": args.include_empty,
+        "page_cache": not args.no_page_cache, "image_workers": None,
+        "date_field": "imputation_date" if args.imputacion else "invoice_date",
+    } for company in companies for year, month in periods]
+    if not tasks:
+        print("No hay reportes que generar.")
+        return 0
+
+    workers = min(args.workers or os.cpu_count() or 1, len(tasks))
+    if workers > 1:
+        # El paralelismo es entre reportes: cada uno convierte sus imágenes en serie
+        for task in tasks:
+            task["image_workers"] = 1
+
+    started = time.perf_counter()
+    results = _run_tasks(db_path, tasks, workers)
+    elapsed = time.perf_counter() - started
+
+    order = {(t["company_id"], t["year"], t["month"]): i for i, t in enumerate(tasks)}
+    results.sort(key=lambda e: order.get((e["company_id"], e["year"], e["month"]), len(order)))
+    failed = sum(1 for e in results if e["errors"])
+    manifest = {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "database": db_path,
+        "attachment_root": root,
+        "formats": list(formats),
+        "date_field": "imputation_date" if args.imputacion else "invoice_date",
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "reports": results,
+        "totals": {
+            "reports": len(results),
+            "skipped": sum(1 for e in results if e.get("skipped")),
+            "failed": failed,
+            "missing_attachments": sum(e["missing_attachments"] for e in results),
+        },
+    }
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    write_manifest(manifest_path, manifest)
+    print(f"\n{len(results)} reportes en {elapsed:.1f}s ({failed} con errores). Manifiesto: {manifest_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,14 +1,23 @@
 import os
 import io
-import glob
-import shutil
 import tempfile
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-import pandas as pd
 from fpdf import FPDF
 from PIL import Image
-from pypdf import PdfWriter, PdfReader
+from pypdf import PdfReader
+
+from pdf_stream_writer import StreamingPdfWriter
+from pdf_table import PdfTable, TableColumn
+from excel_export import ExcelReportWriter
+from page_cache import get_page_cache
+from attachment_index import get_attachment_index, locate_attachment
+from invoice_record import period_date
+from attachment_ingest import needs_normalizing, normalized_image
 
 # Logger config (the application may already configure logging; this is a sensible default)
 logger = logging.getLogger(__name__)
@@ -44,21 +53,157 @@ class PDF(FPDF):
         self.cell(0, 10, f'Página {self.page_no()}/{{nb}}', 0, 0, 'C')
 
 
-def generate_professional_pdf(report_data, save_path, company_name, month, year, attachment_base_path=None):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
+
+# Lado mayor (px) de una imagen anexa: ~300 dpi sobre el ancho útil de un A4
+MAX_IMAGE_PX = 2400
+# Calidad JPEG al recomprimir imágenes convertidas o reducidas
+IMAGE_JPEG_QUALITY = 85
+# Desde cuántas imágenes vale la pena arrancar procesos (arrancar cada uno cuesta ~1 s)
+PARALLEL_MIN_IMAGES = 4
+# Subir al cambiar el diseño de las páginas de anexo (invalida la caché de páginas)
+IMAGE_PAGE_VERSION = 1
+
+
+def _place_image(pdf, source, img_w, img_h):
+    """Dibuja la imagen ajustada al ancho útil de la página (o al alto disponible)."""
+    y_position = pdf.get_y()
+    aspect_ratio = img_w / img_h if img_h else 1.0
+    display_w = pdf.w - 2 * pdf.l_margin
+    display_h = display_w / aspect_ratio
+    available_height = pdf.h - y_position - pdf.b_margin
+    if display_h > available_height:
+        display_h = available_height
+        display_w = display_h * aspect_ratio
+    pdf.image(source, x=pdf.l_margin, y=y_position, w=display_w, h=display_h)
+
+
+def _prepare_image(path):
+    """
+    Devuelve (fuente, ancho, alto) lista para FPDF. Un JPEG RGB/gris ya derecho y
+    de tamaño razonable se usa tal cual (FPDF lo incrusta sin decodificar); el resto
+    se orienta según EXIF, se aplana a RGB sobre blanco, se reduce a MAX_IMAGE_PX y
+    se recomprime como JPEG en memoria.
+    """
+    with Image.open(path) as img:
+        if not needs_normalizing(img, MAX_IMAGE_PX):
+            return path, img.width, img.height
+        img = normalized_image(img, MAX_IMAGE_PX)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+        buffer.seek(0)
+        return buffer, img.width, img.height
+
+
+def _image_page_settings(invoice_number, company_name):
+    """Todo lo que cambia el aspecto de una página de imagen (parte de la clave en page_cache)."""
+    return ("image-page", IMAGE_PAGE_VERSION, MAX_IMAGE_PX, IMAGE_JPEG_QUALITY, company_name, invoice_number)
+
+
+def _render_image_page(path, invoice_number, company_name):
+    """
+    Página 'Anexo de Comprobante' de una imagen, como bytes de PDF. Es una
+    función de módulo (picklable) para poder ejecutarse en un ProcessPoolExecutor.
+    """
+    source, img_w, img_h = _prepare_image(path)
+    pdf = PDF(orientation='P', company_name=company_name, report_title="Anexo de Comprobante",
+              report_period=f"Factura: {invoice_number}")
+    pdf.add_page()
+    _place_image(pdf, source, img_w, img_h)
+    return bytes(pdf.output())
+
+
+def _image_pool(image_count, max_workers=None):
+    """
+    ProcessPoolExecutor para las páginas de imagen, o None si no conviene (pocas
+    imágenes, un solo núcleo, max_workers=1 o el sistema no permite crear procesos).
+    Se usa 'spawn' (igual que en Windows): hacer fork de un proceso con hilos de Qt
+    y de SQLite activos no es seguro.
+    """
+    workers = min(max_workers or os.cpu_count() or 1, image_count)
+    if image_count < PARALLEL_MIN_IMAGES or workers < 2:
+        return None
+    try:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    except (OSError, ValueError, NotImplementedError) as e:
+        logger.warning("No se pudo iniciar el pool de procesos, se convierte en serie: %s", e)
+        return None
+
+
+class _PdfAssembler:
+    """
+    Une el reporte y sus anexos, en orden, escribiendo directo al archivo final
+    (StreamingPdfWriter): la memoria usada no crece con la cantidad de anexos.
+    - Los documentos FPDF y las páginas de imagen se agregan desde sus bytes,
+      sin archivos temporales.
+    - Cada PDF anexo se copia y su lector se descarta enseguida.
+    """
+
+    def __init__(self, stream):
+        self.writer = StreamingPdfWriter(stream)
+
+    def add_fpdf(self, pdf):
+        self.add_pdf_bytes(pdf.output())
+
+    def add_pdf_bytes(self, data):
+        self.writer.append(PdfReader(io.BytesIO(data), strict=False))
+
+    def add_pdf(self, path):
+        # [FIX] PdfReader con strict=False para manejar PDFs problemáticos
+        self.writer.append(PdfReader(path, strict=False))
+
+    def close(self):
+        self.writer.close()
+
+
+def _attachment_ref(invoice, resolved_attachments=None):
+    """Ruta del anexo de una factura: la ya resuelta por la ventana o la guardada."""
+    resolved = resolved_attachments.get(invoice.get('id')) if resolved_attachments else None
+    return (resolved or invoice.get('attachment_resolved') or invoice.get('attachment_path')
+            or invoice.get('attachment') or invoice.get('anexo'))
+
+
+def generate_professional_pdf(report_data, save_path, company_name, month, year, attachment_base_path=None,
+                              progress_callback=None, use_page_cache=True, image_workers=None,
+                              missing_attachments=None, date_field='invoice_date', resolved_attachments=None):
     """
     Genera un PDF profesional con el resumen y las tablas del reporte mensual.
     - Ahora soporta anexar archivos referenciados por cada factura (emitidas y gastos).
-    - Intenta resolver rutas absolutas, relativas a attachment_base_path, al proyecto y al cwd.
+    - Usa primero la ruta verificada guardada (attachment_relpath); si no, intenta resolver rutas
+      absolutas, relativas a attachment_base_path, al proyecto y al cwd.
+    - progress_callback(hecho, total, mensaje), opcional, se llama por cada anexo procesado.
+    - Todo se arma en memoria (_PdfAssembler): sin archivos temporales intermedios.
+    - Las imágenes anexas se convierten en paralelo en otros procesos (_image_pool) y
+      se agregan respetando el orden (o 'ordered_attachments' si viene dado).
+    - Las páginas convertidas se guardan en page_cache (junto a attachment_base_path) y
+      se reutilizan en la siguiente exportación; use_page_cache=False lo desactiva.
+    - image_workers limita los procesos de conversión (1 = en serie).
+    - Si se pasa una lista en missing_attachments, se le agrega (número de factura, ruta)
+      por cada anexo que no se encontró.
+    - date_field='imputation_date': reporte por período de imputación (título y fechas).
+    - resolved_attachments: {id de factura: ruta absoluta} ya resueltas por la ventana;
+      se usan antes que 'attachment_resolved' y sin modificar las facturas recibidas.
     """
-    temp_files = []
 
     def find_attachment_fullpath(base_path, relative_path, invoice):
-        # Primero, acepta rutas ya resueltas proporcionadas por la UI (attachment_resolved)
+        # Primero, acepta rutas ya resueltas proporcionadas por la UI (resolved_attachments o attachment_resolved)
         try:
-            if invoice and invoice.get("attachment_resolved"):
+            ar = None
+            if invoice and resolved_attachments:
+                ar = resolved_attachments.get(invoice.get("id"))
+            if invoice and not ar:
                 ar = invoice.get("attachment_resolved")
-                if ar and os.path.exists(ar):
-                    return ar
+            if ar and os.path.exists(ar):
+                return ar
+        except Exception:
+            pass
+
+        # Ubicación verificada al adjuntar (attachment_relpath) o su blob en el almacén por contenido
+        try:
+            stored = locate_attachment(invoice.get("attachment_relpath") or invoice.get("attachment_path"),
+                                       base_path, invoice.get("attachment_hash")) if invoice else None
+            if stored:
+                return stored
         except Exception:
             pass
 
@@ -138,26 +283,20 @@ def generate_professional_pdf(report_data, save_path, company_name, month, year,
             except Exception:
                 continue
 
-        # glob search under base_path for basename
+        # Buscar por nombre en el índice de base_path (sin recorrer el árbol)
         try:
-            if base_path:
-                pattern = os.path.join(base_path, "**", os.path.basename(rel))
-                matches = glob.glob(pattern, recursive=True)
-                if matches:
-                    return matches[0]
+            index = get_attachment_index(base_path)
+            if index is not None:
+                return index.find(rel)
         except Exception:
             pass
 
         return None
 
     try:
-        # Temp file for main report
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_report:
-            temp_report_path = temp_report.name
-            temp_files.append(temp_report_path)
-
         pdf_report = PDF(orientation='L', company_name=company_name,
-                         report_title="Reporte Mensual de Facturación",
+                         report_title=("Reporte Mensual por Imputación" if date_field == 'imputation_date'
+                                       else "Reporte Mensual de Facturación"),
                          report_period=f"{month}/{year}")
         pdf_report.add_page()
 
@@ -206,78 +345,36 @@ def generate_professional_pdf(report_data, save_path, company_name, month, year,
         pdf_report.ln(6)
 
         # -------------------------
-        # Dibujar tablas (igual que antes)
+        # Dibujar tablas con PdfTable: encabezado repetido en cada página y nombres
+        # largos partidos en dos renglones
         # -------------------------
-        def draw_table(title, headers, data, column_widths_percent):
-            pdf_report.set_font('Arial', 'B', 12)
-            pdf_report.cell(0, 10, title, 0, 1, 'L')
-            pdf_report.set_font('Arial', 'B', 9)
-            pdf_report.set_fill_color(*HEADER_BG_COLOR)
-            page_width_inner = pdf_report.w - 2 * pdf_report.l_margin
-            column_widths = [(w / 100.0) * page_width_inner for w in column_widths_percent]
-            for i, header in enumerate(headers):
-                pdf_report.cell(column_widths[i], 8, header, 1, 0, 'C', 1)
-            pdf_report.ln()
-            pdf_report.set_font('Arial', '', 8)
-            fill = False
-            for row in data:
-                try:
-                    pdf_report.set_fill_color(*ROW_BG_COLOR_ALT) if fill else pdf_report.set_fill_color(255, 255, 255)
-                    for i, datum in enumerate(row):
-                        pdf_report.cell(column_widths[i], 6, str(datum), 1, 0, 'L' if i < 3 else 'R', 1)
-                    pdf_report.ln()
-                    fill = not fill
-                except Exception:
-                    continue
+        # Registros Invoice (o dicts): ambos se leen con .get(), sin copiarlos
+        emitted_invoices = list(report_data.get('emitted_invoices') or [])
+        expense_invoices = list(report_data.get('expense_invoices') or [])
 
-        # Normalize helpers (como antes)
-        def _safe_list_of_dicts(lst):
-            normalized = []
-            for r in lst or []:
-                try:
-                    normalized.append(dict(r))
-                except Exception:
-                    if isinstance(r, dict):
-                        normalized.append(r)
-                    else:
-                        try:
-                            normalized.append({k: r[k] for k in r.keys()})
-                        except Exception:
-                            normalized.append(r)
-            return normalized
-
-        emitted_invoices = _safe_list_of_dicts(report_data.get('emitted_invoices', []))
-        expense_invoices = _safe_list_of_dicts(report_data.get('expense_invoices', []))
-
-        headers_emitted = ['Fecha', 'No. Fact.', 'Empresa', 'ITBIS (RD$)', 'Total (RD$)']
-        data_emitted = []
-        for f in emitted_invoices:
-            itbis = float(f.get('itbis', 0.0))
-            rate = float(f.get('exchange_rate', 1.0) or 1.0)
-            total_rd = float(f.get('total_amount_rd') or (float(f.get('total_amount', 0.0)) * rate))
-            data_emitted.append([f.get('invoice_date', ''), f.get('invoice_number', ''), f.get('third_party_name', ''), f"{itbis * rate:,.2f}", f"{total_rd:,.2f}"])
-        draw_table('Facturas Emitidas (Ingresos)', headers_emitted, data_emitted, [15, 15, 45, 12.5, 12.5])
-        pdf_report.ln(6)
-
-        headers_expenses = ['Fecha', 'No. Fact.', 'Empresa', 'ITBIS (RD$)', 'Total (RD$)']
-        data_expenses = []
-        for f in expense_invoices:
-            itbis = float(f.get('itbis', 0.0))
-            rate = float(f.get('exchange_rate', 1.0) or 1.0)
-            total_rd = float(f.get('total_amount_rd') or (float(f.get('total_amount', 0.0)) * rate))
-            data_expenses.append([f.get('invoice_date', ''), f.get('invoice_number', ''), f.get('third_party_name', ''), f"{itbis * rate:,.2f}", f"{total_rd:,.2f}"])
-        draw_table('Facturas de Gastos', headers_expenses, data_expenses, [15, 15, 45, 12.5, 12.5])
+        def _amount(value):
+            return f"{value:,.2f}"
 
-        # write primary report to temp path
-        pdf_report.output(temp_report_path)
+        date_header = 'Fecha Imp.' if date_field == 'imputation_date' else 'Fecha'
+        invoice_columns = [
+            TableColumn(date_header, 15), TableColumn('No. Fact.', 15), TableColumn('Empresa', 45),
+            TableColumn('ITBIS (RD$)', 12.5, 'R', _amount), TableColumn('Total (RD$)', 12.5, 'R', _amount),
+        ]
 
-        # Merge with attachments (mantén tu lógica actual de búsqueda/append)
-        merger = PdfWriter()
-        try:
-            merger.append(temp_report_path)
-        except Exception:
-            logger.warning("No se pudo anexar el PDF principal al writer. Continuando con fallback.")
-            pass
+        def table_rows(invoices):
+            rows = []
+            for f in invoices:
+                rate = float(f.get('exchange_rate', 1.0) or 1.0)
+                total_rd = float(f.get('total_amount_rd') or (float(f.get('total_amount', 0.0)) * rate))
+                rows.append((period_date(f, date_field), f.get('invoice_number', ''), f.get('third_party_name', ''),
+                             float(f.get('itbis', 0.0)) * rate, total_rd))
+            return rows
+
+        table = PdfTable(pdf_report, invoice_columns, header_fill=HEADER_BG_COLOR, alt_fill=ROW_BG_COLOR_ALT,
+                         overflow='wrap')
+        table.render(table_rows(emitted_invoices), title='Facturas Emitidas (Ingresos)')
+        pdf_report.ln(6)
+        table.render(table_rows(expense_invoices), title='Facturas de Gastos')
 
         # Build attachments list from both emitted and expense invoices, unless an explicit ordered list is provided
         attachments_candidates = []
@@ -286,132 +383,125 @@ def generate_professional_pdf(report_data, save_path, company_name, month, year,
         else:
             # include attachments from both lists
             for f in emitted_invoices + expense_invoices:
-                ap = f.get('attachment_resolved') or f.get('attachment_path') or f.get('attachment') or f.get('anexo')
-                if ap:
-                    # keep original invoice dict along with path for processing
-                    new_inv = dict(f)
-                    new_inv['attachment_path'] = ap
-                    attachments_candidates.append(new_inv)
-
-        # Process attachments; if attachment_base_path is None, find_attachment_fullpath will still try several locations
-        if attachments_candidates:
-            for invoice in attachments_candidates:
+                if _attachment_ref(f, resolved_attachments):
+                    attachments_candidates.append(f)
+
+        # Resolver rutas primero (rápido); lo pesado es convertir las imágenes
+        cache = get_page_cache(attachment_base_path) if use_page_cache else None
+        attachments = []
+        for invoice in attachments_candidates:
+            try:
+                rel = _attachment_ref(invoice, resolved_attachments) or ''
+                full_path = find_attachment_fullpath(attachment_base_path, rel, invoice)
+                if not full_path:
+                    logger.warning("Anexo no encontrado para factura %s -> '%s'", invoice.get('invoice_number'), rel)
+                    if missing_attachments is not None:
+                        missing_attachments.append((invoice.get('invoice_number', ''), rel))
+                    continue
+                lowered = full_path.lower()
+                invoice_number = invoice.get('invoice_number', '')
+                if lowered.endswith('.pdf'):
+                    attachments.append(('pdf', full_path, invoice_number, None))
+                elif lowered.endswith(IMAGE_EXTENSIONS):
+                    key = cache.key(full_path, *_image_page_settings(invoice_number, company_name)) if cache else None
+                    attachments.append(('image', full_path, invoice_number, key))
+                else:
+                    logger.warning("Tipo de archivo no soportado para anexo: %s", full_path)
+            except Exception as e:
+                logger.warning("Error procesando anexo para factura %s: %s", invoice.get('invoice_number'), e)
+
+        # Se escribe en un temporal junto al destino que solo reemplaza a save_path al
+        # terminar: un error o una cancelación (JobCancelled desde progress_callback) no
+        # dejan un PDF a medias ni destruyen el archivo que ya existía con ese nombre
+        fd, tmp_path = tempfile.mkstemp(prefix='.reporte-', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(save_path)))
+        try:
+            with os.fdopen(fd, "wb") as f_out:
+                # Reporte principal: de memoria directo al archivo
+                assembler = _PdfAssembler(f_out)
+                assembler.add_fpdf(pdf_report)
+                del pdf_report
+
+                # Las páginas de imagen que no están en la caché se generan en paralelo
+                # (_image_pool) y se agregan en el orden de la lista; solo hay 'window'
+                # imágenes en vuelo a la vez.
+                image_queue = deque(i for i, item in enumerate(attachments)
+                                    if item[0] == 'image' and not (cache and cache.has(item[3])))
+                pool = _image_pool(len(image_queue), image_workers)
+                window = 2 * (image_workers or os.cpu_count() or 1)
+                futures = {}
                 try:
-                    rel = invoice.get('attachment_path') or ''
-                    full_path = find_attachment_fullpath(attachment_base_path, rel, invoice)
-                    if not full_path:
-                        logger.warning("Anexo no encontrado para factura %s -> '%s'", invoice.get('invoice_number'), rel)
-                        continue
-
-# PDF attachments: append directly
-                    if full_path.lower().endswith('.pdf'):
-                        try:
-                            # [FIX] Usar PdfReader con strict=False para manejar PDFs problemáticos
-                            reader = PdfReader(full_path, strict=False)
-                            merger.append(reader)
-                        except Exception as e:
-                            logger.warning("No se pudo anexar PDF %s: %s", full_path, e)
+                    total_attachments = len(attachments)
+                    for index, (kind, full_path, invoice_number, key) in enumerate(attachments):
+                        while pool is not None and image_queue and len(futures) < window:
+                            j = image_queue.popleft()
+                            _, path_j, number_j, _ = attachments[j]
+                            futures[j] = pool.submit(_render_image_page, path_j, number_j, company_name)
+                        if progress_callback:
+                            progress_callback(index, total_attachments, f"Anexo {index + 1} de {total_attachments}")
+
+                        if kind == 'pdf':
+                            try:
+                                assembler.add_pdf(full_path)
+                            except Exception as e:
+                                logger.warning("No se pudo anexar PDF %s: %s", full_path, e)
                             continue
 
-                    # Image attachments: convert to PDF and append
-                    elif full_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_img:
-                            temp_img_path = temp_img.name
-                            temp_files.append(temp_img_path)
                         try:
-                            pdf_img = PDF(orientation='P', company_name=company_name,
-                                          report_title="Anexo de Comprobante",
-                                          report_period=f"Factura: {invoice.get('invoice_number', '')}")
-                            pdf_img.add_page()
-                            y_position = pdf_img.get_y()
-                            with Image.open(full_path) as img:
-                                img_w, img_h = img.size
-                                aspect_ratio = img_w / img_h if img_h != 0 else 1.0
-                                printable_width = pdf_img.w - 2 * pdf_img.l_margin
-                                display_w = printable_width
-                                display_h = display_w / aspect_ratio
-                                available_height = pdf_img.h - y_position - pdf_img.b_margin
-                                if display_h > available_height:
-                                    display_h = available_height
-                                    display_w = display_h * aspect_ratio
-                                # Use try/except because FPDF may fail with some image modes
-                                try:
-                                    pdf_img.image(full_path, x=pdf_img.l_margin, y=y_position, w=display_w, h=display_h)
-                                except Exception:
-                                    # fallback: convert image to RGB and save a temp PNG then embed
-                                    tmp_img_path = None
-                                    try:
-                                        with Image.open(full_path) as imconv:
-                                            rgb = imconv.convert('RGB')
-                                            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as t2:
-                                                tmp_img_path = t2.name
-                                                rgb.save(tmp_img_path, format="PNG")
-                                        pdf_img.image(tmp_img_path, x=pdf_img.l_margin, y=y_position, w=display_w, h=display_h)
-                                    finally:
-                                        if tmp_img_path and os.path.exists(tmp_img_path):
-                                            try:
-                                                os.remove(tmp_img_path)
-                                            except Exception:
-                                                pass
-                                pdf_img.output(temp_img_path)
-                                try:
-                                    # [FIX] Usar PdfReader con strict=False aquí también
-                                    reader = PdfReader(temp_img_path, strict=False)
-                                    merger.append(reader)
-                                except Exception as e:
-                                    logger.warning("No se pudo anexar PDF generado desde imagen %s: %s", temp_img_path, e)
-                                    continue
+                            future = futures.pop(index, None)
+                            data = cache.get(key) if cache and future is None else None
+                            try:
+                                if future is not None:
+                                    data = future.result()
+                                    if cache:
+                                        cache.put(key, data)
+                            except BrokenProcessPool as e:
+                                # Un proceso murió (memoria, antivirus...): seguir en serie
+                                logger.warning("Pool de procesos interrumpido, se continúa en serie: %s", e)
+                                pool.shutdown(wait=False, cancel_futures=True)
+                                pool, data = None, None
+                                futures.clear()
+                            if data is None:
+                                data = _render_image_page(full_path, invoice_number, company_name)
+                                if cache:
+                                    cache.put(key, data)
+                            assembler.add_pdf_bytes(data)
                         except Exception as e:
                             logger.warning("Error al convertir imagen a PDF para %s: %s", full_path, e)
-                            continue
-                    else:
-                        logger.warning("Tipo de archivo no soportado para anexo: %s", full_path)
-                        continue
-                except Exception as e:
-                    logger.warning("Error procesando anexo para factura %s: %s", invoice.get('invoice_number'), e)
-                    continue
-
-        # write merged file
-        try:
-            with open(save_path, "wb") as f_out:
-                merger.write(f_out)
-        except Exception as e:
+                finally:
+                    if pool is not None:
+                        pool.shutdown(wait=True, cancel_futures=True)
+                    if cache:
+                        cache.prune()
+
+                assembler.close()
+            os.chmod(tmp_path, 0o644)  # mkstemp crea el archivo solo para el dueño
+            os.replace(tmp_path, save_path)
+        except BaseException:
             try:
-                shutil.copyfile(temp_report_path, save_path)
-                logger.warning("Se uso fallback y se copió el reporte principal sin anexos: %s", e)
-            except Exception as e2:
-                return False, f"No se pudo escribir el PDF final: {e2}"
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
 
         return True, "Reporte PDF con anexos generado exitosamente."
 
     except Exception as e:
         logger.exception("Error generando professional PDF")
         return False, f"No se pudo generar el PDF: {e}"
-    finally:
-        for temp_file in temp_files:
-            try:
-                os.remove(temp_file)
-            except Exception:
-                pass
 
 
 def generate_excel_report(report_data, save_path):
-    """Genera un reporte mensual en formato Excel."""
+    """
+    Genera un reporte mensual en formato Excel (hojas Resumen, Ingresos y Gastos)
+    con las columnas de la tabla en pantalla, montos numéricos y fechas reales.
+    Las filas se escriben por flujo (ver excel_export).
+    """
     try:
-        summary_totals = report_data["summary"]
-        resumen_data = {
-            "Descripción": ["Total Ingresos (RD$)", "Total ITBIS Ingresos (RD$)", "Total Gastos (RD$)", "Total ITBIS Gastos (RD$)", "ITBIS Neto (RD$)", "Total Neto (RD$)"],
-            "Monto": [summary_totals.get("total_ingresos", 0.0), summary_totals.get("itbis_ingresos", 0.0), summary_totals.get("total_gastos", 0.0), summary_totals.get("itbis_gastos", 0.0), summary_totals.get("itbis_neto", 0.0), summary_totals.get("total_neto", 0.0)]
-        }
-        df_resumen = pd.DataFrame(resumen_data)
-        df_ingresos = pd.DataFrame(report_data["emitted_invoices"])
-        df_gastos = pd.DataFrame(report_data["expense_invoices"])
-
-        with pd.ExcelWriter(save_path, engine='openpyxl') as writer:
-            df_resumen.to_excel(writer, sheet_name='Resumen', index=False)
-            df_ingresos.to_excel(writer, sheet_name='Ingresos', index=False)
-            df_gastos.to_excel(writer, sheet_name='Gastos', index=False)
-
+        writer = ExcelReportWriter(save_path)
+        writer.write_invoices('Ingresos', report_data.get("emitted_invoices") or [])
+        writer.write_invoices('Gastos', report_data.get("expense_invoices") or [])
+        writer.close(report_data.get("summary"))
         return True, "Reporte Excel generado exitosamente."
     except Exception as e:
         return False, f"No se pudo generar el Excel: {e}"
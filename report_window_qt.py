@@ -1,11 +1,18 @@
 # Migrated ReportWindow -> PyQt6 version (modificada para permitir maximizar y manejo de columnas)
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton,
-    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox, QWidget, QGroupBox
+    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox, QWidget, QGroupBox,
+    QProgressDialog
 )
 from PyQt6.QtCore import Qt, QDate
 import report_generator
+import excel_export
+import inspect
+from job_executor_qt import JobExecutor
+from attachment_index import get_attachment_index, locate_attachment
+from invoice_record import period_date
 import datetime
+import calendar
 from pathlib import Path
 import os
 
@@ -21,6 +28,11 @@ class ReportWindowQt(QDialog):
         self.parent = parent
         self.controller = controller
         self.report_data = None
+        # Base de período del reporte mostrado ('invoice_date' o 'imputation_date')
+        self.report_date_field = 'invoice_date'
+        # Pool de tareas de la ventana principal (o uno propio si se abre de forma aislada)
+        self.jobs = getattr(parent, "jobs", None) or JobExecutor(self)
+        self._report_request = None
 
         # Título y tamaño inicial
         self.setWindowTitle(f"Reporte Mensual para {self.parent.company_selector.currentText() if hasattr(self.parent, 'company_selector') else ''}")
@@ -54,6 +66,12 @@ class ReportWindowQt(QDialog):
         self.year_cb.setEditable(False)
         controls.addWidget(self.year_cb)
 
+        controls.addWidget(QLabel("Período por:"))
+        self.date_field_cb = QComboBox()
+        self.date_field_cb.addItem("Fecha de factura", "invoice_date")
+        self.date_field_cb.addItem("Fecha de imputación", "imputation_date")
+        controls.addWidget(self.date_field_cb)
+
         btn_generate = QPushButton("Generar Reporte")
         btn_generate.clicked.connect(self._generate_report)
         controls.addWidget(btn_generate)
@@ -170,32 +188,30 @@ class ReportWindowQt(QDialog):
             QMessageBox.warning(self, "Sin Empresa", "Selecciona una empresa activa.")
             return
 
-        try:
-            raw = self.controller.get_monthly_report_data(company_id, month, year) or {}
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo obtener datos: {e}")
-            return
+        # La consulta corre en segundo plano; si el usuario pide otro período antes
+        # de que termine, la petición anterior se cancela.
+        request = object()
+        self._report_request = request
+        date_field = self.date_field_cb.currentData()
+        self.jobs.submit(
+            self.controller.get_monthly_report_data, company_id, month, year, date_field, key="report-data",
+            on_finished=lambda raw: self._on_report_data(request, raw, date_field),
+            on_failed=lambda message: QMessageBox.critical(self, "Error", f"No se pudo obtener datos: {message}"),
+        )
 
-        # Normalizar filas (sqlite3.Row -> dict)
-        def _normalize_list(lst):
-            normalized = []
-            for r in lst or []:
-                try:
-                    normalized.append(dict(r))
-                except Exception:
-                    if isinstance(r, dict):
-                        normalized.append(r)
-                    else:
-                        try:
-                            normalized.append({k: r[k] for k in r.keys()})
-                        except Exception:
-                            normalized.append(r)
-            return normalized
+    def _on_report_data(self, request, raw, date_field='invoice_date'):
+        # Ignorar resultados de una petición ya reemplazada
+        if request is not self._report_request:
+            return
+        self._report_request = None
+        raw = raw or {}
+        self.report_date_field = date_field
 
+        # Las facturas llegan como registros Invoice (acceso tipo dict); se usan tal cual
         self.report_data = {
             "summary": raw.get("summary", {}),
-            "emitted_invoices": _normalize_list(raw.get("emitted_invoices", [])),
-            "expense_invoices": _normalize_list(raw.get("expense_invoices", []))
+            "emitted_invoices": raw.get("emitted_invoices") or [],
+            "expense_invoices": raw.get("expense_invoices") or []
         }
         self._populate_report()
 
@@ -220,6 +236,12 @@ class ReportWindowQt(QDialog):
         self.summary_labels.get("itbis_gastos").setText(f"RD$ {summary.get('itbis_gastos', 0.0):,.2f}")
         self.summary_labels.get("itbis_neto").setText(f"RD$ {summary.get('itbis_neto', 0.0):,.2f}")
 
+        # En el reporte por imputación la primera columna es la fecha de imputación
+        date_field = self.report_date_field
+        date_header = "Fecha Imp." if date_field == 'imputation_date' else "Fecha"
+        for tbl in (self.emitted_table, self.expenses_table):
+            tbl.setHorizontalHeaderItem(0, QTableWidgetItem(date_header))
+
         # populate emitted
         for inv in self.report_data.get("emitted_invoices", []):
             row = self.emitted_table.rowCount()
@@ -227,7 +249,7 @@ class ReportWindowQt(QDialog):
             monto_orig = f"{inv.get('total_amount', 0.0):,.2f} {inv.get('currency', 'RD$')}"
             itbis_rd = float(inv.get('itbis', 0.0)) * float(inv.get('exchange_rate', 1.0) or 1.0)
             total_rd = float(inv.get('total_amount_rd', 0.0))
-            self.emitted_table.setItem(row, 0, QTableWidgetItem(str(inv.get('invoice_date', ''))))
+            self.emitted_table.setItem(row, 0, QTableWidgetItem(str(period_date(inv, date_field))))
             self.emitted_table.setItem(row, 1, QTableWidgetItem(str(inv.get('invoice_number', ''))))
             self.emitted_table.setItem(row, 2, QTableWidgetItem(str(inv.get('third_party_name', ''))))
             item_mo = QTableWidgetItem(monto_orig)
@@ -247,7 +269,7 @@ class ReportWindowQt(QDialog):
             monto_orig = f"{inv.get('total_amount', 0.0):,.2f} {inv.get('currency', 'RD$')}"
             itbis_rd = float(inv.get('itbis', 0.0)) * float(inv.get('exchange_rate', 1.0) or 1.0)
             total_rd = float(inv.get('total_amount_rd', 0.0))
-            self.expenses_table.setItem(row, 0, QTableWidgetItem(str(inv.get('invoice_date', ''))))
+            self.expenses_table.setItem(row, 0, QTableWidgetItem(str(period_date(inv, date_field))))
             self.expenses_table.setItem(row, 1, QTableWidgetItem(str(inv.get('invoice_number', ''))))
             self.expenses_table.setItem(row, 2, QTableWidgetItem(str(inv.get('third_party_name', ''))))
             item_mo = QTableWidgetItem(monto_orig)
@@ -291,9 +313,11 @@ class ReportWindowQt(QDialog):
         print("[DBG] attachment_base_path:", attachment_base_path)
 
         # Normalizar y resolver rutas de adjuntos en report_data
-        # Añadimos 'attachment_resolved' a cada invoice dict con ruta absoluta o None
+        # Las rutas absolutas van en resolved_paths (id de factura -> ruta): las facturas
+        # son las mismas que guarda la caché de reportes del controlador y no se modifican.
         base_folder = Path(__file__).parent
         missing_attachments = []
+        resolved_paths = {}
         def _resolve_attachment_path(apath):
             if not apath:
                 return None
@@ -307,18 +331,14 @@ class ReportWindowQt(QDialog):
                 np = Path(os.path.normpath(str(p)))
                 if np.exists():
                     return str(np)
-                return None
+                # ruta absoluta de otro equipo: buscar el mismo archivo por nombre
+                index = get_attachment_index(attachment_base_path)
+                return index.find(ap_norm) if index else None
             # relative path: if attachment_base_path provided, join it (normalize)
             if attachment_base_path:
                 candidate = Path(os.path.normpath(os.path.join(attachment_base_path, ap_norm)))
                 if candidate.exists():
                     return str(candidate)
-                # try basename under base path with glob
-                bname = os.path.basename(ap_norm)
-                pattern = os.path.join(attachment_base_path, "**", bname)
-                matches = list(Path(attachment_base_path).glob("**/" + bname))
-                if matches:
-                    return str(matches[0])
             # try project-relative
             candidate = base_folder / ap_norm
             if candidate.exists():
@@ -327,25 +347,70 @@ class ReportWindowQt(QDialog):
             candidate = Path.cwd() / ap_norm
             if candidate.exists():
                 return str(candidate)
-            # last resort: case-insensitive search under attachment_base_path (if provided)
-            if attachment_base_path:
-                for root, dirs, files in os.walk(attachment_base_path):
-                    for f in files:
-                        if f.lower() == os.path.basename(ap_norm).lower():
-                            return os.path.join(root, f)
-            return None
+            # last resort: buscar por nombre (exacto o sin mayúsculas) en el índice de adjuntos
+            index = get_attachment_index(attachment_base_path)
+            return index.find(ap_norm) if index else None
 
         for section in ("emitted_invoices", "expense_invoices"):
             for inv in self.report_data.get(section, []):
                 # Keep existing attachment_path if present; resolve to absolute when possible
                 ap = inv.get("attachment_path") or inv.get("attachment") or inv.get("anexo") or None
-                resolved = _resolve_attachment_path(ap)
-                inv["attachment_resolved"] = resolved
+                # La ruta verificada al adjuntar (attachment_relpath) o el blob del almacén evitan sondear el disco
+                stored = locate_attachment(inv.get("attachment_relpath") or ap, attachment_base_path,
+                                           inv.get("attachment_hash"))
+                resolved = stored or _resolve_attachment_path(ap)
+                if resolved and inv.get("id") is not None:
+                    resolved_paths[inv.get("id")] = resolved
                 # Debug print per invoice
                 print(f"[DBG] invoice {inv.get('invoice_number')} attachment_path='{ap}' resolved='{resolved}'")
                 if ap and not resolved:
-                    missing_attachments.append({"invoice_number": inv.get("invoice_number"), "attachment": ap})
-
+                    missing_attachments.append({"invoice_number": inv.get("invoice_number"), "attachment": ap,
+                                                "invoice": inv})
+
+        # Anexos movidos o renombrados: buscarlos por contenido (hash) en segundo plano y
+        # reubicarlos en bloque; la exportación sigue cuando termina la búsqueda.
+        missing_ids = [m["invoice"].get("id") for m in missing_attachments if m["invoice"].get("id") is not None]
+        if missing_ids and hasattr(self.controller, "find_moved_attachments"):
+            self._find_moved_attachments(fname, attachment_base_path, resolved_paths, missing_attachments,
+                                         missing_ids)
+            return
+        self._start_pdf_export(fname, attachment_base_path, resolved_paths, missing_attachments)
+
+    def _find_moved_attachments(self, fname, attachment_base_path, resolved_paths, missing_attachments,
+                                missing_ids):
+        progress = QProgressDialog("Buscando anexos movidos...", "Cancelar", 0, 0, self)
+        progress.setWindowTitle("Exportar a PDF")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def _run(job):
+            return self.controller.find_moved_attachments(attachment_base_path, invoice_ids=missing_ids,
+                                                          progress_callback=job.report_progress)
+
+        def _on_progress(done, total, message):
+            progress.setMaximum(total)
+            progress.setValue(done)
+            progress.setLabelText(message)
+
+        def _on_finished(result):
+            progress.reset()
+            found, _still_missing = result
+            # La base se actualiza en este hilo (conexión de escritura)
+            self.controller.apply_relinked_attachments(found, attachment_base_path)
+            resolved_paths.update(found)
+            still_missing = [m for m in missing_attachments if m["invoice"].get("id") not in found]
+            self._start_pdf_export(fname, attachment_base_path, resolved_paths, still_missing)
+
+        def _on_failed(message):
+            progress.reset()
+            print(f"[WARN] No se pudieron buscar los anexos movidos: {message}")
+            self._start_pdf_export(fname, attachment_base_path, resolved_paths, missing_attachments)
+
+        job = self.jobs.submit(_run, key="report-relink", on_finished=_on_finished, on_failed=_on_failed,
+                               on_cancelled=progress.reset, on_progress=_on_progress)
+        progress.canceled.connect(job.cancel)
+
+    def _start_pdf_export(self, fname, attachment_base_path, resolved_paths, missing_attachments):
         # If attachments expected but missing, warn user (non-blocking)
         if missing_attachments:
             missing_list = "\n".join([f"{m['invoice_number']}: {m['attachment']}" for m in missing_attachments[:10]])
@@ -371,26 +436,58 @@ class ReportWindowQt(QDialog):
             return
 
         # Llamada defensiva: intentamos pasar (report_data, fname, company, month, year, attachment_base_path)
-        # pero nos aseguramos que report_data contiene 'attachment_resolved' por invoice.
+        # y, si la función lo acepta, las rutas ya resueltas en resolved_attachments.
+        # La generación (con sus anexos) corre en segundo plano con un diálogo de progreso cancelable.
+        report_data = self.report_data
+        args = (report_data, fname, self.parent.company_selector.currentText(),
+                self.month_cb.currentText(), self.year_cb.currentText())
         try:
-            ok, msg = func(self.report_data, fname, self.parent.company_selector.currentText(),
-                        self.month_cb.currentText(), self.year_cb.currentText(), attachment_base_path)
-        except TypeError:
-            # Si la firma es distinta, intentar con menos argumentos
+            parameters = inspect.signature(func).parameters
+        except (TypeError, ValueError):
+            parameters = {}
+        accepts_progress = "progress_callback" in parameters
+        call_extra = {"date_field": self.report_date_field} if "date_field" in parameters else {}
+        if "resolved_attachments" in parameters:
+            call_extra["resolved_attachments"] = resolved_paths
+
+        def _run(job):
+            extra = dict(call_extra)
+            if accepts_progress:
+                extra["progress_callback"] = job.report_progress
             try:
-                ok, msg = func(self.report_data, fname, self.parent.company_selector.currentText(),
-                            self.month_cb.currentText(), self.year_cb.currentText())
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"No se pudo generar el PDF (firma inesperada): {e}")
-                return
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo generar el PDF: {e}")
-            return
+                return func(*args, attachment_base_path, **extra)
+            except TypeError:
+                # Si la firma es distinta, intentar con menos argumentos
+                try:
+                    return func(*args)
+                except Exception as e:
+                    return False, f"No se pudo generar el PDF (firma inesperada): {e}"
+
+        progress = QProgressDialog("Generando PDF...", "Cancelar", 0, 0, self)
+        progress.setWindowTitle("Exportar a PDF")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def _on_progress(done, total, message):
+            progress.setMaximum(total)
+            progress.setValue(done)
+            progress.setLabelText(message)
+
+        def _on_finished(result):
+            progress.reset()
+            ok, msg = result
+            if ok:
+                QMessageBox.information(self, "Éxito", msg)
+            else:
+                QMessageBox.critical(self, "Error", msg)
 
-        if ok:
-            QMessageBox.information(self, "Éxito", msg)
-        else:
-            QMessageBox.critical(self, "Error", msg)
+        def _on_failed(message):
+            progress.reset()
+            QMessageBox.critical(self, "Error", f"No se pudo generar el PDF: {message}")
+
+        job = self.jobs.submit(_run, key="report-pdf", on_finished=_on_finished, on_failed=_on_failed,
+                               on_cancelled=progress.reset, on_progress=_on_progress)
+        progress.canceled.connect(job.cancel)
 
     def _export_excel(self):
         if not self.report_data:
@@ -407,10 +504,39 @@ class ReportWindowQt(QDialog):
             return
 
         try:
-            ok, msg = report_generator.generate_excel_report(self.report_data, fname)
+            company_id = self.parent.get_current_company_id()
+            month, year = int(self.month_cb.currentText()), int(self.year_cb.currentText())
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el Excel: {e}")
+            return
+        # Las filas se leen de la base por lotes y se escriben por flujo en segundo plano
+        date_field = self.report_date_field
+        start_date = datetime.date(year, month, 1)
+        end_date = datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+        progress = QProgressDialog("Generando Excel...", "Cancelar", 0, 0, self)
+        progress.setWindowTitle("Exportar a Excel")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+
+        def _on_finished(result):
+            progress.reset()
+            ok, msg = result
             if ok:
                 QMessageBox.information(self, "Éxito", msg)
             else:
                 QMessageBox.critical(self, "Error", msg)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo generar el Excel: {e}")
\ No newline at end of file
+
+        def _on_failed(message):
+            progress.reset()
+            QMessageBox.critical(self, "Error", f"No se pudo generar el Excel: {message}")
+
+        def _run(job):
+            return excel_export.export_report_excel(
+                self.controller, fname, company_id, start_date.isoformat(), end_date.isoformat(),
+                progress_callback=job.report_progress, date_field=date_field)
+
+        job = self.jobs.submit(_run, key="report-excel", on_finished=_on_finished, on_failed=_on_failed,
+                               on_cancelled=progress.reset,
+                               on_progress=lambda done, total, message: progress.setLabelText(message))
+        progress.canceled.connect(job.cancel)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Servicio de configuración (config.json) compartido por toda la aplicación.
+
+- El archivo se lee una sola vez y se mantiene en memoria; solo se vuelve a leer
+  si cambia en disco (mtime/tamaño), p. ej. al editarlo a mano con la app abierta.
+- La carpeta de Dropbox detectada y la raíz de adjuntos se calculan una vez y se
+  guardan en caché hasta que cambie la configuración.
+- Las escrituras son atómicas: se escribe un archivo temporal en la misma carpeta
+  y se reemplaza con os.replace, así un cierre inesperado nunca deja un
+  config.json a medio escribir.
+
+Reemplaza a config_manager.py; sus funciones (load_config, save_config,
+get_db_path, set_db_path) siguen disponibles aquí.
+"""
+import os
+import json
+import tempfile
+import threading
+
+from utils import find_dropbox_folder
+
+CONFIG_FILE = 'config.json'
+
+_MISSING = object()
+
+
+class SettingsService:
+    """Configuración en memoria respaldada por un archivo JSON."""
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._data = {}
+        self._signature = _MISSING
+        self._dropbox_folder = _MISSING
+        self._attachment_root = _MISSING
+
+    # --- Lectura ---
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        """Vuelve a leer el archivo solo si cambió desde la última lectura."""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        data = {}
+        if signature is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    data = loaded
+            except (OSError, ValueError):
+                data = {}  # Archivo corrupto o vacío
+        self._data = data
+        self._signature = signature
+        self._attachment_root = _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._refresh()
+            return self._data.get(key, default)
+
+    def all(self):
+        """Copia de toda la configuración."""
+        with self._lock:
+            self._refresh()
+            return dict(self._data)
+
+    # --- Escritura ---
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """Aplica varios cambios y guarda el archivo una sola vez."""
+        with self._lock:
+            self._refresh()
+            data = dict(self._data)
+            data.update(values)
+            self._write(data)
+
+    def replace(self, data):
+        """Reemplaza toda la configuración por 'data'."""
+        with self._lock:
+            self._write(dict(data))
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._data = data
+        self._signature = self._file_signature()
+        self._attachment_root = _MISSING
+
+    # --- Rutas derivadas (en caché) ---
+
+    def dropbox_folder(self):
+        """Carpeta personal de Dropbox (se busca una sola vez)."""
+        with self._lock:
+            if self._dropbox_folder is _MISSING:
+                self._dropbox_folder = find_dropbox_folder()
+            return self._dropbox_folder
+
+    def attachment_root(self):
+        """
+        Ruta base de adjuntos: carpeta de Dropbox + 'attachment_subfolder'.
+        Retorna None si falta alguna de las dos.
+        """
+        with self._lock:
+            self._refresh()
+            if self._attachment_root is _MISSING:
+                dropbox_path = self.dropbox_folder()
+                subfolder_name = self._data.get('attachment_subfolder')
+                root = None
+                if dropbox_path and subfolder_name:
+                    root = os.path.join(dropbox_path, subfolder_name)
+                self._attachment_root = root
+            return self._attachment_root
+
+    def invalidate(self):
+        """Descarta todo lo cacheado (configuración y rutas detectadas)."""
+        with self._lock:
+            self._signature = _MISSING
+            self._dropbox_folder = _MISSING
+            self._attachment_root = _MISSING
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_settings(path=CONFIG_FILE):
+    """Instancia compartida del servicio para 'path'."""
+    key = os.path.abspath(path)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = SettingsService(path)
+        return service
+
+
+# --- Compatibilidad con config_manager.py ---
+
+def load_config():
+    """Carga la configuración desde config.json."""
+    return get_settings().all()
+
+
+def save_config(data):
+    """Guarda un diccionario de datos en config.json."""
+    get_settings().replace(data)
+
+
+def get_db_path():
+    """Obtiene la ruta de la BD desde el config, o devuelve None."""
+    path = get_settings().get("database_path")
+    # Verificamos que la ruta guardada todavía exista
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+def set_db_path(path):
+    """Guarda la nueva ruta de la BD en el config."""
+    get_settings().set("database_path", path)
@@ -4,6 +4,7 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtCore import Qt
 import typing
+from job_executor_qt import JobExecutor
 
 
 class ThirdPartyReportWindowQt(QDialog):
@@ -18,6 +19,9 @@ class ThirdPartyReportWindowQt(QDialog):
         self.parent = parent
         self.controller = controller
         self.selected_rnc = None
+        # Pool de tareas de la ventana principal (o uno propio si se abre de forma aislada)
+        self.jobs = getattr(parent, "jobs", None) or JobExecutor(self)
+        self._report_request = None
 
         self.setWindowTitle("Reporte por Cliente / Proveedor")
         self.resize(900, 600)
@@ -199,24 +203,25 @@ class ThirdPartyReportWindowQt(QDialog):
         except Exception:
             company_id = None
 
-        try:
-            raw = self.controller.get_report_by_third_party(company_id, self.selected_rnc) or {}
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo obtener el reporte: {e}")
+        # La consulta corre en segundo plano; una nueva búsqueda cancela la anterior
+        request = object()
+        self._report_request = request
+        self.jobs.submit(
+            self.controller.get_report_by_third_party, company_id, self.selected_rnc, key="third-party-report",
+            on_finished=lambda raw: self._show_report(request, raw),
+            on_failed=lambda message: QMessageBox.critical(self, "Error", f"No se pudo obtener el reporte: {message}"),
+        )
+
+    def _show_report(self, request, raw):
+        # Ignorar resultados de una búsqueda ya reemplazada
+        if request is not self._report_request:
             return
+        self._report_request = None
+        raw = raw or {}
 
-        # normalize lists
-        def _normalize_list(lst):
-            normalized = []
-            for r in lst or []:
-                try:
-                    normalized.append(dict(r))
-                except Exception:
-                    normalized.append(r if isinstance(r, dict) else r)
-            return normalized
-
-        emitted = _normalize_list(raw.get("emitted_invoices", []))
-        expenses = _normalize_list(raw.get("expense_invoices", []))
+        # Invoice records (dict-like access), used as-is
+        emitted = raw.get("emitted_invoices") or []
+        expenses = raw.get("expense_invoices") or []
         summary = raw.get("summary", {})
 
         # update summary
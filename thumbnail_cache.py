@@ -0,0 +1,145 @@
+"""
+Miniaturas de los anexos, guardadas en disco según el contenido del archivo.
+
+Para revisar si una factura tiene el comprobante correcto había que abrir el
+editor de anexos, que decodifica la foto completa. Aquí cada anexo se reduce
+una sola vez a una miniatura PNG (lado mayor THUMBNAIL_PX) y se guarda en la
+subcarpeta 'miniaturas' de la caché local de la raíz (page_cache.cache_dir_for):
+
+- La clave es la de PageCache: hash SHA-256 y tamaño del archivo más la versión
+  y el tamaño de la miniatura. El hash sale del índice de la caché de páginas
+  (no se vuelve a leer un archivo sin cambios) o del nombre del blob en el
+  almacén por contenido. Un anexo copiado o renombrado reutiliza su miniatura.
+- Las imágenes se decodifican ya reducidas (draft de JPEG) y se orientan según
+  EXIF, igual que al ingresarlas (attachment_ingest.normalized_image).
+- De un PDF se usa la imagen más grande de la primera página (los comprobantes
+  escaneados son una foto por página). Un PDF sin imágenes no tiene miniatura.
+- Tamaño máximo 'thumbnail_cache_max_mb' (config.json), con limpieza LRU.
+
+Es independiente de la interfaz: la llama un hilo secundario de la ventana
+(thumbnail_loader_qt en PyQt6, un hilo en el organizador de anexos en tkinter).
+
+    path = thumbnail_file(source, root)     # PNG en caché, o None si no hay miniatura
+"""
+import io
+import os
+import threading
+
+from PIL import Image
+from pypdf import PdfReader
+
+from settings_service import get_settings
+from page_cache import PageCache, cache_dir_for, get_page_cache
+from attachment_ingest import INGEST_IMAGE_EXTENSIONS, normalized_image
+
+THUMBNAIL_DIRNAME = 'miniaturas'
+THUMBNAIL_PX = 256
+# Cambia si cambia la forma de dibujar las miniaturas (invalida las guardadas)
+THUMBNAIL_VERSION = 1
+DEFAULT_MAX_MB = 64
+
+
+class ThumbnailCache(PageCache):
+    """Miniaturas PNG en 'directory'; los hashes de origen se comparten con la caché de páginas."""
+
+    EXTENSION = '.png'
+
+    def __init__(self, directory, hashes, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        super().__init__(directory, max_bytes)
+        self._hashes = hashes
+
+    def content_hash(self, path):
+        return self._hashes.content_hash(path)
+
+    def path_for(self, key):
+        """Ruta de la miniatura si ya está en caché (la marca como usada), o None."""
+        if key is None:
+            return None
+        path = self._page_path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def prune(self):
+        result = super().prune()
+        # Los hashes calculados para las miniaturas viven en el índice de la caché de páginas
+        self._hashes.prune()
+        return result
+
+
+def _pdf_first_image(path):
+    """Imagen más grande de la primera página del PDF, o None."""
+    reader = PdfReader(path, strict=False)
+    if not reader.pages:
+        return None
+    best, best_area = None, 0
+    for image_file in reader.pages[0].images:
+        image = image_file.image
+        area = image.width * image.height
+        if area > best_area:
+            best, best_area = image, area
+    return best
+
+
+def render_thumbnail(path, size=THUMBNAIL_PX):
+    """PNG (bytes) con el lado mayor <= size, o None si el archivo no tiene una imagen que mostrar."""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext in INGEST_IMAGE_EXTENSIONS:
+        with Image.open(path) as img:
+            thumb = normalized_image(img, size)
+    elif ext == '.pdf':
+        image = _pdf_first_image(path)
+        if image is None:
+            return None
+        thumb = normalized_image(image, size)
+    else:
+        return None
+    buffer = io.BytesIO()
+    thumb.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def thumbnail_file(path, root, size=THUMBNAIL_PX):
+    """
+    Ruta de la miniatura de 'path' en la caché de 'root', generándola si falta.
+    Retorna None si el archivo no existe o no tiene miniatura. Pensado para un
+    hilo secundario.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    cache = get_thumbnail_cache(root)
+    key = cache.key(path, 'thumbnail', THUMBNAIL_VERSION, size)
+    cached = cache.path_for(key)
+    if cached:
+        return cached
+    try:
+        data = render_thumbnail(path, size)
+    except Exception as e:
+        # Imagen o PDF dañado: sin miniatura, la vista sigue funcionando
+        print(f"[WARN] No se pudo generar la miniatura de {path}: {e}")
+        return None
+    if data is None:
+        return None
+    cache.put(key, data)
+    return cache.path_for(key)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_thumbnail_cache(attachment_root=None):
+    """Instancia compartida para esa raíz de adjuntos (tamaño: 'thumbnail_cache_max_mb')."""
+    directory = os.path.abspath(os.path.join(cache_dir_for(attachment_root), THUMBNAIL_DIRNAME))
+    try:
+        max_mb = float(get_settings().get('thumbnail_cache_max_mb', DEFAULT_MAX_MB))
+    except (TypeError, ValueError):
+        max_mb = DEFAULT_MAX_MB
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = ThumbnailCache(directory, get_page_cache(attachment_root))
+        cache.max_bytes = int(max_mb * 1024 * 1024)
+        return cache
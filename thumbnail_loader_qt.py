@@ -0,0 +1,142 @@
+"""
+Carga de miniaturas de anexos en segundo plano para las vistas PyQt6.
+
+La vista pide solo las miniaturas de sus filas visibles (request) cuando deja
+de desplazarse. Cada una se busca en un hilo del pool propio del cargador:
+
+- se ubica el archivo (ruta guardada, almacén por contenido o índice de adjuntos);
+- thumbnail_cache.thumbnail_file la toma de la caché en disco o la genera;
+- se lee como QImage ya reducida a ICON_PX (QImage se puede usar fuera del hilo
+  de la GUI; QPixmap no).
+
+Las imágenes quedan en memoria (LRU de MEMORY_ITEMS) y la señal 'ready' avisa
+a la vista. Al pedir otras filas se cancelan las tareas que ya no se ven.
+
+    loader = ThumbnailLoader(self, root_provider=controller.get_attachment_base_path)
+    loader.ready.connect(model.thumbnail_ready)
+    loader.request([(key, relpath, content_hash), ...])
+    loader.image(key)     # QImage o None mientras no esté
+"""
+import os
+import html
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QObject, QUrl, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from job_executor_qt import JobExecutor
+from attachment_index import locate_attachment, resolve_attachment
+from thumbnail_cache import thumbnail_file, get_thumbnail_cache
+
+ICON_PX = 32
+# Lado mayor de la vista previa en el tooltip
+TOOLTIP_PX = 240
+MEMORY_ITEMS = 2000
+_JOB_PREFIX = "thumbnail:"
+
+
+def _load_thumbnail(key, relpath, content_hash, root):
+    """Tarea del pool: (clave, miniatura PNG en disco o None, QImage de ICON_PX o None)."""
+    path = locate_attachment(relpath, root, content_hash) or resolve_attachment(relpath, root)
+    thumb_path = thumbnail_file(path, root) if path else None
+    if not thumb_path:
+        return key, None, None
+    image = QImage(thumb_path)
+    if image.isNull():
+        return key, None, None
+    image = image.scaled(ICON_PX, ICON_PX, Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+    return key, thumb_path, image
+
+
+class ThumbnailLoader(QObject):
+    """Miniaturas de anexos por clave (la ruta guardada del anexo), cargadas bajo demanda."""
+
+    ready = pyqtSignal(str)  # clave cuya miniatura terminó de cargarse (exista o no)
+
+    def __init__(self, parent=None, root_provider=None, max_threads=1):
+        super().__init__(parent)
+        self.root_provider = root_provider
+        # Pool propio: las miniaturas no esperan detrás de los reportes ni del dashboard
+        self.jobs = JobExecutor(self, max_threads=max_threads)
+        self._entries = OrderedDict()  # clave -> (ruta PNG, QImage) o (None, None) si no hay
+        self._pending = set()
+        self._root = None
+
+    def _current_root(self):
+        try:
+            root = self.root_provider() if self.root_provider else None
+        except Exception:
+            root = None
+        if root != self._root:
+            # Otra carpeta de adjuntos: las rutas relativas apuntan a otros archivos
+            self.clear()
+            self._root = root
+        return root
+
+    def request(self, items):
+        """
+        Pide las miniaturas de 'items' (clave, ruta guardada, hash). Cancela las
+        pedidas antes que ya no están en la lista y no repite las que ya se tienen.
+        """
+        root = self._current_root()
+        wanted = {}
+        for key, relpath, content_hash in items:
+            if key and key not in self._entries:
+                wanted[key] = (relpath, content_hash)
+        for key in self._pending - wanted.keys():
+            self.jobs.cancel(_JOB_PREFIX + key)
+        self._pending &= wanted.keys()
+        for key, (relpath, content_hash) in wanted.items():
+            if key in self._pending:
+                continue
+            self._pending.add(key)
+            self.jobs.submit(_load_thumbnail, key, relpath, content_hash, root, key=_JOB_PREFIX + key,
+                             on_finished=self._on_loaded,
+                             on_failed=lambda message, key=key: self._on_failed(key, message))
+
+    def _on_loaded(self, result):
+        key, thumb_path, image = result
+        self._pending.discard(key)
+        self._entries[key] = (thumb_path, image)
+        self._entries.move_to_end(key)
+        while len(self._entries) > MEMORY_ITEMS:
+            self._entries.popitem(last=False)
+        self.ready.emit(key)
+
+    def _on_failed(self, key, message):
+        print(f"[WARN] Miniatura de {key}: {message}")
+        self._on_loaded((key, None, None))
+
+    def image(self, key):
+        """QImage de la miniatura (ICON_PX) o None si aún no se cargó o no hay."""
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def tooltip(self, key, title):
+        """Tooltip HTML con la vista previa si la miniatura está en disco; si no, solo 'title'."""
+        entry = self._entries.get(key)
+        text = html.escape(title)
+        if not entry or not entry[0]:
+            return title
+        url = QUrl.fromLocalFile(os.path.abspath(entry[0])).toString()
+        image = entry[1]
+        # El tooltip dibuja el PNG guardado (THUMBNAIL_PX) al tamaño de vista previa
+        if image.width() >= image.height():
+            size = f'width="{TOOLTIP_PX}"'
+        else:
+            size = f'height="{TOOLTIP_PX}"'
+        return f'<img src="{html.escape(url)}" {size}><br>{text}'
+
+    def clear(self):
+        """Olvida las miniaturas en memoria (p. ej. después de editar un anexo)."""
+        self.jobs.cancel_all()
+        self._pending.clear()
+        self._entries.clear()
+
+    def shutdown(self, wait_ms=-1):
+        """Cancela lo pendiente y guarda los índices de la caché en disco."""
+        finished = self.jobs.shutdown(wait_ms)
+        if self._root is not None:
+            get_thumbnail_cache(self._root).prune()
+        return finished
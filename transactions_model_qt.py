@@ -0,0 +1,235 @@
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+
+
+class TransactionsTableModel(QAbstractTableModel):
+    """
+    Modelo perezoso para la tabla de transacciones del dashboard.
+
+    Las filas se piden al controlador por páginas (get_transactions_page, paginación
+    por clave sobre invoice_date DESC, id DESC) a medida que la vista las necesita
+    mediante canFetchMore/fetchMore. Cada fila se guarda ya formateada en una tupla
+    compacta, así que el costo por fila visible es mínimo y abrir la vista no depende
+    del tamaño del historial.
+
+    La columna "Anexo" muestra la miniatura del comprobante (y una vista previa en
+    el tooltip) si se le pasa un ThumbnailLoader. La vista llama a
+    request_thumbnails con sus filas visibles; data() nunca decodifica imágenes.
+    """
+
+    HEADERS = ["Fecha", "Tipo", "No. Fact.", "Empresa", "ITBIS (RD$)", "Monto Original", "Total (RD$)", "Anexo"]
+
+    # Posiciones dentro de la tupla interna de cada fila
+    _TYPE, _ID, _RATE, _TOOLTIP, _ATTACHMENT = 1, 7, 8, 9, 10
+    # Columna de la miniatura del anexo
+    PREVIEW_COLUMN = 7
+
+    _TYPE_DISPLAY = {
+        'emitida': ("↑ INGRESO", QColor("#35ff95")),
+        'gasto': ("↓ GASTO", QColor("#ff5370")),
+    }
+    _TYPE_UNKNOWN = ("N/A", QColor("gray"))
+
+    _ALIGN_LEFT = Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+    _ALIGN_RIGHT = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+    _ALIGNMENTS = (_ALIGN_LEFT, Qt.AlignmentFlag.AlignCenter, _ALIGN_LEFT, _ALIGN_LEFT,
+                   _ALIGN_RIGHT, _ALIGN_RIGHT, _ALIGN_RIGHT, Qt.AlignmentFlag.AlignCenter)
+
+    def __init__(self, controller, page_size=200, parent=None, thumbnails=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.page_size = page_size
+        self.thumbnails = thumbnails
+        if thumbnails is not None:
+            thumbnails.ready.connect(self.thumbnail_ready)
+        self._query = None
+        self._rows = []
+        self._rows_by_attachment = {}  # clave del anexo -> filas que lo muestran
+        self._after = None
+        self._exhausted = True
+
+    # ------------------------
+    # Consulta
+    # ------------------------
+    def set_query(self, company_id, filter_month=None, filter_year=None, specific_date=None, invoice_type=None):
+        """Reinicia el modelo para un nuevo filtro y carga la primera página."""
+        self.beginResetModel()
+        self._rows = []
+        self._rows_by_attachment = {}
+        self._after = None
+        if company_id is None:
+            self._query = None
+            self._exhausted = True
+        else:
+            self._query = dict(company_id=company_id, filter_month=filter_month, filter_year=filter_year,
+                               specific_date=specific_date, invoice_type=invoice_type)
+            self._exhausted = False
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def clear(self):
+        """Vacía el modelo."""
+        self.set_query(None)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = self.controller.get_transactions_page(after=self._after, limit=self.page_size, **self._query)
+        if not page:
+            self._exhausted = True
+            return
+        if len(page) < self.page_size:
+            self._exhausted = True
+        last = page[-1]
+        self._after = (last['invoice_date'], last['id'])
+
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        self._rows.extend(self._format_row(trans) for trans in page)
+        for row in range(first, len(self._rows)):
+            attachment = self._rows[row][self._ATTACHMENT]
+            if attachment:
+                self._rows_by_attachment.setdefault(attachment[0], []).append(row)
+        self.endInsertRows()
+
+    @staticmethod
+    def _format_row(trans):
+        """Convierte una transacción en la tupla de textos que muestra la tabla."""
+        currency = str(trans.get('currency') or 'RD$').strip()
+        if currency.upper() in ("RDS", "RDS$", "RD", "DOP"):
+            currency = "RD$"
+
+        def _num(value, default):
+            try:
+                return float(value) if value not in (None, '') else default
+            except (TypeError, ValueError):
+                return default
+
+        itbis = _num(trans.get('itbis'), 0.0)
+        exchange_rate = _num(trans.get('exchange_rate'), 1.0)
+        total_amount = _num(trans.get('total_amount'), 0.0)
+        # total_amount_rd preferido si está y > 0, si no calcularlo
+        total_amount_rd = _num(trans.get('total_amount_rd'), 0.0) or total_amount * exchange_rate
+
+        if currency == "RD$":
+            monto_original = f"RD$ {total_amount:,.2f}"
+        else:
+            monto_original = f"{total_amount:,.2f} {currency}"
+
+        return (
+            str(trans.get('invoice_date') or ''),
+            str(trans.get('invoice_type') or ''),
+            str(trans.get('invoice_number') or ''),
+            str(trans.get('third_party_name') or ''),
+            f"{itbis * exchange_rate:,.2f}",
+            monto_original,
+            f"{total_amount_rd:,.2f}",
+            trans.get('id'),
+            exchange_rate,
+            f"Tasa: {exchange_rate} → Total RD$: {total_amount_rd:,.2f}",
+            TransactionsTableModel._attachment_of(trans),
+        )
+
+    @staticmethod
+    def _attachment_of(trans):
+        """(clave, ruta guardada, hash) del anexo de la transacción, o None si no tiene."""
+        relpath = trans.get('attachment_relpath') or trans.get('attachment_path')
+        if not relpath:
+            return None
+        return str(relpath).replace('\\', '/'), relpath, trans.get('attachment_hash') or None
+
+    # ------------------------
+    # Acceso a filas
+    # ------------------------
+    def invoice_id(self, row):
+        """Devuelve el ID de la factura en la fila indicada (o None)."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row][self._ID]
+        return None
+
+    def exchange_rate(self, row):
+        """Devuelve la tasa de cambio de la fila indicada (o None)."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row][self._RATE]
+        return None
+
+    def request_thumbnails(self, first, last):
+        """Pide las miniaturas de las filas first..last (las visibles); cancela las demás."""
+        if self.thumbnails is None:
+            return
+        first, last = max(first, 0), min(last, len(self._rows) - 1)
+        items = [self._rows[row][self._ATTACHMENT] for row in range(first, last + 1)]
+        self.thumbnails.request(item for item in items if item)
+
+    def thumbnail_ready(self, key):
+        """Repinta la columna del anexo en las filas que muestran 'key'."""
+        for row in self._rows_by_attachment.get(key, ()):
+            index = self.index(row, self.PREVIEW_COLUMN)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole, Qt.ItemDataRole.ToolTipRole])
+
+    def transaction_at(self, row):
+        """Devuelve el registro completo de la factura en la fila indicada, leído de la base de datos."""
+        invoice_id = self.invoice_id(row)
+        if invoice_id is None:
+            return None
+        return self.controller.get_invoice_by_id(invoice_id)
+
+    # ------------------------
+    # Interfaz QAbstractTableModel
+    # ------------------------
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        # Celdas no editables (solo seleccionables)
+        return Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+
+        if column == self.PREVIEW_COLUMN:
+            return self._preview_data(row[self._ATTACHMENT], role)
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 1:
+                return self._TYPE_DISPLAY.get(row[self._TYPE], self._TYPE_UNKNOWN)[0]
+            return row[column]
+        if role == Qt.ItemDataRole.ForegroundRole and column == 1:
+            return self._TYPE_DISPLAY.get(row[self._TYPE], self._TYPE_UNKNOWN)[1]
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return self._ALIGNMENTS[column]
+        if role == Qt.ItemDataRole.ToolTipRole and column == 5:
+            return row[self._TOOLTIP]
+        if role == Qt.ItemDataRole.UserRole and column == 2:
+            # Igual que antes: el ID de la factura viaja en la columna "No. Fact."
+            return row[self._ID]
+        return None
+
+    def _preview_data(self, attachment, role):
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return self._ALIGNMENTS[self.PREVIEW_COLUMN]
+        if attachment is None:
+            return "—" if role == Qt.ItemDataRole.DisplayRole else None
+        key, relpath, _hash = attachment
+        if role == Qt.ItemDataRole.DecorationRole and self.thumbnails is not None:
+            return self.thumbnails.image(key)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            name = key.rsplit('/', 1)[-1]
+            return self.thumbnails.tooltip(key, name) if self.thumbnails is not None else name
+        return None
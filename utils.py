@@ -10,8 +10,9 @@ def find_dropbox_folder():
     Devuelve la ruta como un string o None si no se encuentra.
     """
     info_path_options = [
-        os.path.join(os.getenv('APPDATA'), 'Dropbox', 'info.json'),
-        os.path.join(os.getenv('LOCALAPPDATA'), 'Dropbox', 'info.json')
+        os.path.join(base, 'Dropbox', 'info.json')
+        for base in (os.getenv('APPDATA'), os.getenv('LOCALAPPDATA'))
+        if base  # Fuera de Windows estas variables no existen
     ]
 
     for info_path in info_path_options: